@@ -18,18 +18,42 @@
 
 import argparse
 import collections.abc
+import dataclasses
 import json
 import logging
 import os
 import pathlib
+import shlex
+import sqlite3
 import subprocess
 import sys
+import tempfile
 from argparse import Namespace, ArgumentParser
-from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import (
+    ALL_COMPLETED,
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
+from dataclasses import dataclass
 from functools import lru_cache
 from functools import partial
 from io import TextIOWrapper
-from typing import Dict, Tuple, List, Optional, Iterable, cast, Any, Set
+from typing import (
+    Dict,
+    Tuple,
+    List,
+    Optional,
+    Iterable,
+    cast,
+    Any,
+    Set,
+    Callable,
+    Iterator,
+    Deque,
+)
 
 import toml
 from grammar_graph import gg
@@ -125,6 +149,14 @@ def solve(stdout, stderr, parser: ArgumentParser, args: Namespace):
     if output_dir:
         assert_path_is_dir(stderr, command, output_dir)
 
+    if args.jobs < 1:
+        print(
+            f"isla {command}: error: the number of jobs must be positive, "
+            + f"got {args.jobs}",
+            file=stderr,
+        )
+        sys.exit(USAGE_ERROR)
+
     grammar = parse_grammar(command, args.grammar, files, stderr)
     structural_predicates, semantic_predicates = read_predicates(files, stderr)
     constraint = parse_constraint(
@@ -152,6 +184,8 @@ def solve(stdout, stderr, parser: ArgumentParser, args: Namespace):
         grammar_unwinding_threshold=args.unwinding_depth,
         structural_predicates=structural_predicates,
         semantic_predicates=semantic_predicates,
+        workers=args.jobs,
+        regex_cache_dir=args.regex_cache_dir,
     )
 
     try:
@@ -196,6 +230,8 @@ def solve(stdout, stderr, parser: ArgumentParser, args: Namespace):
             i += 1
     except KeyboardInterrupt:
         sys.exit(0)
+    finally:
+        solver.terminate_workers()
 
 
 def read_predicates(
@@ -235,9 +271,6 @@ def read_predicates(
 
 def fuzz(_, stderr, parser: ArgumentParser, args: Namespace):
     input_ending = "_input.txt"
-    stdout_ending = "_stdout.txt"
-    stderr_ending = "_stderr.txt"
-    status_ending = "_status.txt"
 
     files = read_files(args.files)
     ensure_grammar_present(stderr, parser, args, files)
@@ -247,6 +280,14 @@ def fuzz(_, stderr, parser: ArgumentParser, args: Namespace):
     output_dir = args.output_dir
     assert_path_is_dir(stderr, command, output_dir)
 
+    if args.target_jobs < 1:
+        print(
+            f"isla {command}: error: the number of target jobs must be positive, "
+            + f"got {args.target_jobs}",
+            file=stderr,
+        )
+        sys.exit(USAGE_ERROR)
+
     grammar = parse_grammar(command, args.grammar, files, stderr)
     structural_predicates, semantic_predicates = read_predicates(files, stderr)
     constraint = parse_constraint(
@@ -274,72 +315,195 @@ def fuzz(_, stderr, parser: ArgumentParser, args: Namespace):
         grammar_unwinding_threshold=args.unwinding_depth,
         structural_predicates=structural_predicates,
         semantic_predicates=semantic_predicates,
-    )
+        regex_cache_dir=args.regex_cache_dir,
+    )
+
+    fuzz_command = shlex.split(get_fuzz_command(args, command, stderr))
+
+    # Inputs are only kept as separate files if the results are stored as files;
+    # otherwise, they are part of the results file and only temporarily written
+    # for the test target.
+    with tempfile.TemporaryDirectory() as tmp_dir, ThreadPoolExecutor(
+        max_workers=args.target_jobs
+    ) as executor, fuzz_results_writer(args.results, output_dir) as write_result:
+        running: Set[Future] = set()
+
+        def collect_results(return_when: str) -> None:
+            nonlocal running
+            done, running = wait(running, return_when=return_when)
+            for future in done:
+                try:
+                    write_result(future.result())
+                except OSError as err:
+                    print(
+                        f"isla {command}: error: could not run the test target "
+                        + f"({type(err).__name__}): {err}",
+                        file=stderr,
+                    )
+                    sys.exit(1)
+
+        try:
+            num_solutions = args.num_solutions
+            i = 0
+            while not (0 < num_solutions <= i):
+                istr = str(i).rjust(4, "0")
+
+                # The next input is generated while the test target processes the
+                # previous ones.
+                try:
+                    result = solver.solve()
+                except StopIteration:
+                    print("UNSAT", flush=True, file=stderr)
+                    break
+                except TimeoutError:
+                    break
+
+                if args.results == "files":
+                    inp_file_name = os.path.join(output_dir, f"{istr}{input_ending}")
+                else:
+                    inp_file_name = os.path.join(tmp_dir, f"{istr}{args.ending}")
+
+                with open(inp_file_name, "wb") as inp_file:
+                    inp_file.write(str(result).encode("utf-8"))
+
+                if len(running) >= args.target_jobs:
+                    collect_results(FIRST_COMPLETED)
+
+                running.add(
+                    executor.submit(
+                        run_fuzz_target,
+                        i,
+                        fuzz_command,
+                        inp_file_name,
+                        args.results != "files",
+                    )
+                )
+
+                i += 1
+
+            collect_results(ALL_COMPLETED)
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            sys.exit(0)
+
 
-    fuzz_command = get_fuzz_command(args, command, stderr)
+@dataclass(frozen=True)
+class FuzzResult:
+    """
+    The result of running a test target on one input generated by :code:`isla fuzz`.
+    """
+
+    index: int
+    input: str
+    stdout: str
+    stderr: str
+    status: int
 
-    def inst_fuzz_command(inp_file: str) -> str:
-        return fuzz_command.replace("{}", inp_file)
+
+def run_fuzz_target(
+    index: int, fuzz_command: List[str], inp_file_name: str, remove_input: bool
+) -> FuzzResult:
+    """
+    Runs the test target (without a shell) on the given input file.
+
+    :param index: The number of the input.
+    :param fuzz_command: The test target command as a list of arguments, in which
+      all occurrences of :code:`{}` are replaced by the input file name.
+    :param inp_file_name: The name of the input file.
+    :param remove_input: Whether the input file should be removed after the run.
+    :return: The input and the output and status code of the test target.
+    """
 
     try:
-        num_solutions = args.num_solutions
-        i = 0
-        while not (0 < num_solutions <= i):
-            istr = str(i).rjust(4, "0")
+        target_result = subprocess.run(
+            [arg.replace("{}", inp_file_name) for arg in fuzz_command],
+            capture_output=True,
+            text=True,
+        )
 
-            try:
-                result = solver.solve()
-            except StopIteration:
-                print("UNSAT", flush=True, file=stderr)
-                break
-            except TimeoutError:
-                break
+        with open(inp_file_name, "rb") as inp_file:
+            inp = inp_file.read().decode("utf-8")
+    finally:
+        if remove_input:
+            os.remove(inp_file_name)
 
-            # Write input file
-            with open(
-                os.path.join(output_dir, f"{istr}{input_ending}"), "wb"
-            ) as inp_file:
-                inp_file.write(str(result).encode("utf-8"))
-                inp_file.seek(0)
-                inp_file_name = inp_file.name
+    return FuzzResult(
+        index,
+        inp,
+        target_result.stdout,
+        target_result.stderr,
+        target_result.returncode,
+    )
 
-            try:
-                # Execute fuzz target
-                target_result = subprocess.run(
-                    inst_fuzz_command(inp_file_name),
-                    shell=True,
-                    capture_output=True,
-                    check=True,
-                    text=True,
-                )
 
-                standard_output = target_result.stdout
-                error_output = target_result.stderr
-                return_code = target_result.returncode
-            except subprocess.CalledProcessError as cpe:
-                standard_output = cpe.stdout
-                error_output = cpe.stderr
-                return_code = cpe.returncode
-
-            # Write results
-            with open(
-                os.path.join(output_dir, f"{istr}{stdout_ending}"), "wb"
-            ) as stdout_file:
-                stdout_file.write(standard_output.encode("utf-8"))
-
-            with open(
-                os.path.join(output_dir, f"{istr}{stderr_ending}"), "wb"
-            ) as stderr_file:
-                stderr_file.write(error_output.encode("utf-8"))
-
-            with open(
-                os.path.join(output_dir, f"{istr}{status_ending}"), "wb"
-            ) as stat_file:
-                stat_file.write(str(return_code).encode("utf-8"))
+@contextmanager
+def fuzz_results_writer(
+    results_format: str, output_dir: str
+) -> Iterator[Callable[[FuzzResult], None]]:
+    """
+    Provides a function storing the results of :code:`isla fuzz` in the given
+    format. For the format :code:`files`, there are three files per result (the
+    input file is written before running the test target). For :code:`jsonl`
+    and :code:`sqlite`, all results are stored in a single file
+    :code:`results.jsonl` or :code:`results.sqlite`, respectively. Existing
+    results are overwritten.
+
+    :param results_format: One of :code:`files`, :code:`jsonl`, and :code:`sqlite`.
+    :param output_dir: The directory in which the results are stored.
+    :return: A function storing a result.
+    """
 
-            i += 1
-    except KeyboardInterrupt:
-        sys.exit(0)
+    if results_format == "files":
+
+        def write_files(result: FuzzResult) -> None:
+            istr = str(result.index).rjust(4, "0")
+            for ending, content in [
+                ("_stdout.txt", result.stdout),
+                ("_stderr.txt", result.stderr),
+                ("_status.txt", str(result.status)),
+            ]:
+                with open(os.path.join(output_dir, f"{istr}{ending}"), "wb") as file:
+                    file.write(content.encode("utf-8"))
+
+        yield write_files
+
+    elif results_format == "jsonl":
+        with open(
+            os.path.join(output_dir, "results.jsonl"), "w", encoding="utf-8"
+        ) as results_file:
+
+            def write_json(result: FuzzResult) -> None:
+                results_file.write(json.dumps(dataclasses.asdict(result)) + "\n")
+
+            yield write_json
+
+    else:
+        assert results_format == "sqlite"
+        con = sqlite3.connect(os.path.join(output_dir, "results.sqlite"))
+        rows: List[Tuple[int, str, str, str, int]] = []
+
+        def flush() -> None:
+            with con:
+                con.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?)", rows)
+            rows.clear()
+
+        def write_row(result: FuzzResult) -> None:
+            rows.append(dataclasses.astuple(result))
+            if len(rows) >= 100:
+                flush()
+
+        try:
+            with con:
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY, "
+                    + "input TEXT, stdout TEXT, stderr TEXT, status INTEGER)"
+                )
+                con.execute("DELETE FROM results")
+
+            yield write_row
+            flush()
+        finally:
+            con.close()
 
 
 def get_fuzz_command(args: Namespace, command, stderr):
@@ -355,11 +519,87 @@ def get_fuzz_command(args: Namespace, command, stderr):
 
 
 def check(stdout, stderr, parser: ArgumentParser, args: Namespace):
+    if args.batch:
+        check_batch(stdout, stderr, parser, args)
+
     code, msg, _ = do_check(stdout, stderr, parser, args)
     print(msg, file=stdout)
     sys.exit(code)
 
 
+def check_batch(stdout, stderr, parser: ArgumentParser, args: Namespace):
+    files = read_files(args.files)
+    ensure_grammar_present(stderr, parser, args, files)
+    ensure_constraint_present(stderr, parser, args, files)
+    command = args.command
+
+    if args.input_string or any(
+        not file.endswith(".bnf")
+        and not file.endswith(".isla")
+        and not file.endswith(".py")
+        for file in files
+    ):
+        print(
+            f"isla {command}: error: inputs cannot be passed via `--input-string` "
+            + "or files in batch mode",
+            file=stderr,
+        )
+        sys.exit(USAGE_ERROR)
+
+    if not os.path.exists(args.batch):
+        print(
+            f"isla {command}: error: path {args.batch} does not exist",
+            file=stderr,
+        )
+        sys.exit(USAGE_ERROR)
+
+    grammar = parse_grammar(command, args.grammar, files, stderr)
+    structural_predicates, semantic_predicates = read_predicates(files, stderr)
+    constraint = parse_constraint(
+        command,
+        args.constraint,
+        files,
+        grammar,
+        stderr,
+        structural_predicates=structural_predicates,
+        semantic_predicates=semantic_predicates,
+    )
+
+    solver = ISLaSolver(
+        grammar,
+        constraint,
+        structural_predicates=structural_predicates,
+        semantic_predicates=semantic_predicates,
+    )
+
+    # The names of the inputs that have been passed to the solver, but whose
+    # verdicts have not been printed yet.
+    names: Deque[str] = collections.deque()
+
+    def inputs() -> Iterator[str]:
+        for name, inp in read_batch_inputs(command, args.batch, stderr):
+            names.append(name)
+            yield inp
+
+    all_satisfied = True
+    for result in solver.check_batch(inputs(), processes=args.jobs):
+        name = names.popleft()
+        match result:
+            case Failure(_):
+                msg = "input could not be parsed"
+            case Success(truth) if truth.is_unknown():
+                msg = "could not determine whether input satisfies the ISLa constraint"
+            case Success(truth) if truth.is_true():
+                msg = "input satisfies the ISLa constraint"
+            case _:
+                msg = "input does not satisfy the ISLa constraint"
+
+        all_satisfied = all_satisfied and msg == "input satisfies the ISLa constraint"
+        print(f"{name}: {msg}", file=stdout, flush=True)
+
+    sys.exit(0 if all_satisfied else 1)
+
+
 def find(stdout, stderr, parser: ArgumentParser, args: Namespace):
     language_spec_files: List[TextIOWrapper] = [
         io_wrapper
@@ -513,6 +753,57 @@ def mutate(stdout, stderr, parser: ArgumentParser, args: Namespace):
     sys.exit(0)
 
 
+def read_batch_inputs(command: str, path: str, stderr) -> Iterator[Tuple[str, str]]:
+    """
+    Lazily reads the inputs for :code:`isla check --batch`. If :code:`path` is a
+    directory, each file in it (in the order of the file names) is one input. As
+    for single inputs, a trailing newline is removed. Otherwise, :code:`path` is a
+    JSON lines file, each line of which is an input string or an object with an
+    :code:`input` attribute (like the files written by :code:`isla fuzz` with
+    :code:`--results jsonl`). Terminates with a `DATA_FORMAT_ERROR` at the first
+    line not of this form.
+
+    :param command: The name of the ISLa command (for error messages).
+    :param path: A directory or a JSON lines file.
+    :param stderr: The standard error stream to write error messages to.
+    :return: Pairs of the names of the inputs (the file names or the file name and
+      line number) and the inputs.
+    """
+
+    if os.path.isdir(path):
+        for file_name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, file_name)
+            if not os.path.isfile(file_path):
+                continue
+
+            with open(file_path, encoding="utf-8") as file:
+                inp = file.read()
+
+            yield file_path, inp[:-1] if inp.endswith("\n") else inp
+
+        return
+
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                entry = None
+
+            inp = entry.get("input") if isinstance(entry, dict) else entry
+            if not isinstance(inp, str):
+                print(
+                    f"isla {command}: error: {path}:{line_number}: invalid batch entry",
+                    file=stderr,
+                )
+                sys.exit(DATA_FORMAT_ERROR)
+
+            yield f"{path}:{line_number}", inp
+
+
 def do_check(
     stdout, stderr, parser: ArgumentParser, args: Namespace
 ) -> Tuple[int, str, Maybe[DerivationTree]]:
@@ -1013,8 +1304,10 @@ generator for satisfiable formulas""",
     smt_insts_arg(parser)
     unique_trees_arg(parser)
     unwinding_depth_arg(parser)
+    regex_cache_dir_arg(parser)
     weight_vector_arg(parser)
     k_arg(parser)
+    jobs_arg(parser)
     log_level_arg(parser)
     grammar_constraint_extension_files_arg(parser)
 
@@ -1026,10 +1319,14 @@ def create_fuzz_parser(subparsers, stdout, stderr):
         description="""
 Create solutions to an ISLa constraint and a reference grammar, and pass these to
 a test subject. An output directory must be specified (`-d`). Into this directory,
-ISLa writes three files per generated test input: (1) the input (`..._input.txt`),
+ISLa writes four files per generated test input: (1) the input (`..._input.txt`),
 (2) the standard output of the fuzzed program (`..._stdout.txt`), (3) the standard
 error of the fuzzed program (`..._stderr.txt`), and (4) the returned status code of
-the fuzzed program (`..._status.txt`).""",
+the fuzzed program (`..._status.txt`). Alternatively (`--results`), all results are
+written into a single file `results.jsonl` (one JSON object per input) or an SQLite
+database `results.sqlite` (table `results`). The test subject is run without a
+shell; up to `--target-jobs` instances run concurrently while ISLa generates the
+next inputs.""",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
     parser.set_defaults(func=lambda *args: fuzz(stdout, stderr, parser, *args))
@@ -1054,6 +1351,23 @@ The file ending for the generated files that are passed to the test target, if t
 test target expects a particular format""",
     )
 
+    parser.add_argument(
+        "--target-jobs",
+        type=int,
+        default=get_default(stderr, "fuzz", "--target-jobs").unwrap(),
+        help="""
+The maximum number of test target processes running concurrently""",
+    )
+
+    parser.add_argument(
+        "--results",
+        choices=["files", "jsonl", "sqlite"],
+        default=get_default(stderr, "fuzz", "--results").unwrap(),
+        help="""
+How to store the inputs and the outputs of the test target: as separate files per
+input, or in a single JSON lines file or SQLite database""",
+    )
+
     grammar_arg(parser)
     constraint_arg(parser)
     num_solutions_arg(parser)
@@ -1062,6 +1376,7 @@ test target expects a particular format""",
     smt_insts_arg(parser)
     unique_trees_arg(parser)
     unwinding_depth_arg(parser)
+    regex_cache_dir_arg(parser)
     weight_vector_arg(parser)
     k_arg(parser)
     log_level_arg(parser)
@@ -1081,6 +1396,27 @@ constraint.""",
 
     input_string_arg(parser)
 
+    parser.add_argument(
+        "-b",
+        "--batch",
+        metavar="DIR_OR_JSONL_FILE",
+        help="""
+Check many inputs against the constraint, which is prepared only once. The inputs
+are the files in the given directory or the lines of the given JSON lines file
+(strings or objects with an "input" attribute, as written by `isla fuzz`). One
+verdict per input is printed; the exit code is 0 iff all inputs satisfy the
+constraint""",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=get_default(stderr, "check", "--jobs").unwrap(),
+        help="""
+The number of worker processes parsing and checking inputs in batch mode""",
+    )
+
     grammar_arg(parser)
     constraint_arg(parser)
     log_level_arg(parser)
@@ -1410,6 +1746,34 @@ in certain cases""",
     )
 
 
+def regex_cache_dir_arg(parser):
+    command = parser.prog.split(" ")[-1]
+
+    parser.add_argument(
+        "--regex-cache-dir",
+        default=get_default(sys.stderr, command, "--regex-cache-dir").value_or(None),
+        help="""
+A directory in which ISLa persists the regular expressions computed for the syntax of
+nonterminals. Subsequent runs for the same grammar and unwinding depth load them from
+there instead of recomputing them""",
+    )
+
+
+def jobs_arg(parser):
+    command = parser.prog.split(" ")[-1]
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=get_default(sys.stderr, command, "--jobs").unwrap(),
+        help="""
+The number of worker processes used for solving. With more than one job, the states
+in the solver queue are distributed over a process pool, and the solutions of all
+workers are merged into one stream without duplicates""",
+    )
+
+
 def smt_insts_arg(parser):
     command = parser.prog.split(" ")[-1]
 
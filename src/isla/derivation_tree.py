@@ -18,7 +18,9 @@
 
 import html
 import json
-from functools import lru_cache, cache
+import sys
+from bisect import bisect_left
+from functools import lru_cache
 from typing import (
     Optional,
     Sequence,
@@ -29,6 +31,7 @@ from typing import (
     Callable,
     Union,
     Generator,
+    Iterable,
 )
 
 import graphviz
@@ -36,6 +39,7 @@ import ijson
 import zlib
 from grammar_graph import gg
 from graphviz import Digraph
+from returns.maybe import Maybe, Nothing, Some
 
 from isla.helpers import (
     is_nonterminal,
@@ -43,6 +47,7 @@ from isla.helpers import (
     TRAVERSE_POSTORDER,
     dict_of_lists_to_list_of_dicts,
 )
+from isla.k_path_index import k_path_index
 from isla.trie import SubtreesTrie
 from isla.type_defs import Path, ParseTree, CanonicalGrammar
 
@@ -50,6 +55,38 @@ from isla.type_defs import Path, ParseTree, CanonicalGrammar
 class DerivationTree:
     """Derivation trees are immutable!"""
 
+    # Derivation trees are created in large numbers (every state in the solver queue
+    # holds one), so we avoid per-instance dictionaries.
+    __slots__ = (
+        "__value",
+        "__children",
+        "_id",
+        "__len",
+        "__hash",
+        "__structural_hash",
+        "__k_paths",
+        "__concrete_k_paths",
+        "__is_open",
+        "__paths",
+        "__open_leaves",
+        "__origin",
+        "__id_index",
+        "__value_index",
+        "__k_path_bits",
+    )
+
+    # The attributes persisted by `to_json`. The (mangled) attribute names serve as
+    # JSON keys, which are thus the same as when trees had instance dictionaries.
+    __SERIALIZED_ATTRIBUTES = (
+        "_DerivationTree__value",
+        "_DerivationTree__children",
+        "_id",
+        "_DerivationTree__len",
+        "_DerivationTree__hash",
+        "_DerivationTree__structural_hash",
+        "_DerivationTree__is_open",
+    )
+
     next_id: int = 0
 
     TRAVERSE_PREORDER = 0
@@ -65,7 +102,8 @@ class DerivationTree:
         structural_hash: Optional[int] = None,
         is_open: Optional[bool] = None,
     ):
-        self.__value = value
+        # Node values (nonterminals and terminal symbols) are shared by many nodes.
+        self.__value = sys.intern(value)
         self.__children = None if children is None else tuple(children)
 
         if id is not None:
@@ -74,11 +112,33 @@ class DerivationTree:
             self._id = DerivationTree.next_id
             DerivationTree.next_id += 1
 
-        self.__len = 1 if not children else None
+        self.__len = (
+            1 if not children else DerivationTree.__sum_of_lengths(self.__children)
+        )
         self.__hash = hash
         self.__structural_hash = structural_hash
-        self.__k_paths: Dict[int, Set[Tuple[gg.Node, ...]]] = k_paths or {}
-        self.__concrete_k_paths: Dict[int, Set[Tuple[gg.Node, ...]]] = {}
+
+        # The k-path caches are only allocated when needed.
+        self.__k_paths: Optional[Dict[int, Set[Tuple[gg.Node, ...]]]] = k_paths or None
+        self.__concrete_k_paths: Optional[Dict[int, Set[Tuple[gg.Node, ...]]]] = None
+        self.__k_path_bits: Optional[Dict[Tuple[int, bool], int]] = None
+
+        # Lazily computed lists of all paths and of open leaves, and a "recipe" for
+        # deriving them from an original tree by splicing (see `replace_path`).
+        self.__paths: Optional[List[Tuple[Path, DerivationTree]]] = None
+        self.__open_leaves: Optional[List[Tuple[Path, DerivationTree]]] = None
+        self.__origin: Optional[
+            Tuple[DerivationTree, Tuple[Tuple[Path, DerivationTree], ...]]
+        ] = None
+
+        # Lazily computed mapping from node IDs to paths (see `find_node`).
+        self.__id_index: Optional[Dict[int, Path]] = None
+
+        # Lazily computed mapping from node values to (path, subtree) pairs in
+        # pre-order (see `subtrees_with_value`).
+        self.__value_index: Optional[
+            Dict[str, List[Tuple[Path, DerivationTree]]]
+        ] = None
 
         self.__is_open = is_open
         if children is None:
@@ -88,13 +148,21 @@ class DerivationTree:
         elif any(child.__is_open for child in children):
             self.__is_open = True
 
+    def __to_dict(self) -> dict:
+        result = {
+            attribute: getattr(self, attribute)
+            for attribute in DerivationTree.__SERIALIZED_ATTRIBUTES
+        }
+
+        if self.__children is not None:
+            result["_DerivationTree__children"] = [
+                child.__to_dict() for child in self.__children
+            ]
+
+        return result
+
     def to_json(self) -> str:
-        the_dict = self.__dict__
-        if "_DerivationTree__k_paths" in the_dict:
-            del the_dict["_DerivationTree__k_paths"]
-        if "_DerivationTree__concrete_k_paths" in the_dict:
-            del the_dict["_DerivationTree__concrete_k_paths"]
-        return json.dumps(the_dict, default=lambda o: o.__dict__)
+        return json.dumps(self.__to_dict())
 
     def __getstate__(self) -> bytes:
         return zlib.compress(self.to_json().encode("UTF-8"))
@@ -103,23 +171,30 @@ class DerivationTree:
     def from_json(
         json_str: str, tree: Optional["DerivationTree"] = None
     ) -> "DerivationTree":
-        def from_dict(a_dict: dict) -> "DerivationTree":
-            result = DerivationTree.__new__(DerivationTree)
-            result.__k_paths = {}
-            result.__concrete_k_paths = {}
-
-            children_key = "_DerivationTree__children"
-            ser_children = a_dict[children_key]
-
-            if ser_children is None:
-                a_dict[children_key] = None
-            else:
-                a_dict[children_key] = tuple(
-                    [from_dict(child) for child in ser_children]
+        def from_dict(
+            a_dict: dict, result: Optional[DerivationTree] = None
+        ) -> "DerivationTree":
+            if result is None:
+                result = DerivationTree.__new__(DerivationTree)
+
+            result.__k_paths = None
+            result.__concrete_k_paths = None
+            result.__k_path_bits = None
+            result.__paths = None
+            result.__open_leaves = None
+            result.__origin = None
+            result.__id_index = None
+            result.__value_index = None
+
+            for attribute in DerivationTree.__SERIALIZED_ATTRIBUTES:
+                setattr(result, attribute, a_dict.get(attribute))
+
+            result.__value = sys.intern(result.__value)
+            if result.__children is not None:
+                result.__children = tuple(
+                    [from_dict(child) for child in result.__children]
                 )
 
-            result.__dict__.update(a_dict)
-
             # To ensure that when resuming from a checkpoint during debugging,
             # ID uniqueness constraints are maintained.
             if result.id >= DerivationTree.next_id:
@@ -129,13 +204,7 @@ class DerivationTree:
 
         assert isinstance(json_str, str)
 
-        if tree is None:
-            tree = DerivationTree("<start>")
-        tree.__dict__.update(
-            from_dict(next(ijson.items(json_str.encode("utf-8"), ""))).__dict__
-        )
-
-        return tree
+        return from_dict(next(ijson.items(json_str.encode("utf-8"), "")), tree)
 
     def __setstate__(self, state: bytes):
         return DerivationTree.from_json(zlib.decompress(state).decode("UTF-8"), self)
@@ -157,45 +226,56 @@ class DerivationTree:
         raise NotImplementedError()
 
     def has_unique_ids(self) -> bool:
-        return all(
-            not any(
-                subt_1 is not subt_2 and subt_1.id == subt_2.id
-                for _, subt_2 in self.paths()
-            )
-            for _, subt_1 in self.paths()
-        )
+        nodes_by_id: Dict[int, DerivationTree] = {}
+        for _, subtree in self.paths():
+            if nodes_by_id.setdefault(subtree.id, subtree) is not subtree:
+                return False
+
+        return True
 
     def k_coverage(
         self, graph: gg.GrammarGraph, k: int, include_potential_paths: bool = True
     ) -> float:
-        tree_paths = self.k_paths(
-            graph, k, include_potential_paths=include_potential_paths
+        return k_path_index(graph, k).coverage(
+            self.k_path_bits(graph, k, include_potential_paths)
         )
-        all_paths = graph.k_paths(k, include_terminals=False)
 
-        if not all_paths:
-            return 0
+    def k_path_bits(
+        self, graph: gg.GrammarGraph, k: int, include_potential_paths: bool = True
+    ) -> int:
+        """
+        Returns the k-paths of this tree as a bit set according to the
+        :class:`~isla.k_path_index.KPathIndex` for the given graph and k.
+
+        :param graph: The grammar graph.
+        :param k: The length of the k-paths.
+        :param include_potential_paths: Whether to include k-paths starting from open
+            leaves.
+        :return: The bit set of the k-paths in this tree.
+        """
+
+        if self.__k_path_bits is None:
+            self.__k_path_bits = {}
+
+        key = (k, include_potential_paths)
+        if key not in self.__k_path_bits:
+            self.__k_path_bits[key] = k_path_index(graph, k).to_bits(
+                self.k_paths(graph, k, include_potential_paths)
+            )
 
-        return len(tree_paths) / len(all_paths)
+        return self.__k_path_bits[key]
 
     def k_paths(
         self, graph: gg.GrammarGraph, k: int, include_potential_paths: bool = True
     ) -> Set[Tuple[gg.Node, ...]]:
         if not include_potential_paths:
+            if self.__concrete_k_paths is None:
+                self.__concrete_k_paths = {}
             if k not in self.__concrete_k_paths:
-                self.__concrete_k_paths[k] = set(
-                    iter(
-                        graph.k_paths_in_tree(
-                            self,
-                            k,
-                            include_potential_paths=include_potential_paths,
-                            include_terminals=False,
-                        )
-                    )
-                )
+                self.__compute_concrete_k_paths_up_to(graph, k)
             return self.__concrete_k_paths[k]
 
-        if k not in self.__k_paths:
+        if self.__k_paths is None or k not in self.__k_paths:
             self.recompute_k_paths(
                 graph, k, include_potential_paths=include_potential_paths
             )
@@ -203,9 +283,43 @@ class DerivationTree:
 
         return self.__k_paths[k]
 
+    def __compute_concrete_k_paths_up_to(self, graph: gg.GrammarGraph, k: int) -> None:
+        """
+        Computes the concrete k-paths (excluding terminal symbols) of this tree for all
+        lengths from 1 to `k` from a single set of graph paths. This yields the same
+        results as `graph.k_paths_in_tree(self, k, False, False)` for each length, but
+        the tree is only converted once.
+
+        :param graph: The grammar graph.
+        :param k: The maximum length of k-paths to compute.
+        """
+
+        graph_paths = [
+            path[:-2] if isinstance(path[-1], gg.TerminalNode) else path
+            for path in graph.graph_paths_from_tree(self, include_terminals=True)
+        ]
+
+        for curr_k in range(1, k + 1):
+            if curr_k in self.__concrete_k_paths:
+                continue
+
+            # Each path of k terminal/nonterminal nodes includes k-1 choice nodes
+            length = 2 * curr_k - 1
+            self.__concrete_k_paths[curr_k] = {
+                path[idx : idx + length]
+                for path in graph_paths
+                for idx in range(0, len(path) - length + 1)
+                if not isinstance(path[idx], gg.ChoiceNode)
+                and not isinstance(path[idx + length - 1], gg.ChoiceNode)
+            }
+
     def recompute_k_paths(
         self, graph: gg.GrammarGraph, k: int, include_potential_paths=True
     ) -> Set[Tuple[gg.Node, ...]]:
+        if self.__k_paths is None:
+            self.__k_paths = {}
+        if self.__k_path_bits is not None:
+            self.__k_path_bits.pop((k, True), None)
         self.__k_paths[k] = set(
             iter(
                 graph.k_paths_in_tree(
@@ -276,14 +390,117 @@ class DerivationTree:
 
         return True
 
-    @lru_cache
     def paths(self) -> List[Tuple[Path, "DerivationTree"]]:
-        def action(path, node):
-            result.append((path, node))
+        """
+        Returns all paths in this tree together with the subtrees at these paths,
+        in pre-order (which coincides with the lexicographic order of the paths).
+        For trees obtained from
+        :meth:`~isla.derivation_tree.DerivationTree.replace_path`, the result is
+        spliced together from the paths of the original tree if those have been
+        computed before.
+
+        >>> tree = DerivationTree(
+        ...     "<a>", [DerivationTree("<b>"), DerivationTree("c", [])])
+        >>> [(path, subtree.value) for path, subtree in tree.paths()]
+        [((), '<a>'), ((0,), '<b>'), ((1,), 'c')]
+
+        >>> expanded = tree.replace_path(
+        ...     (0,), DerivationTree("<b>", [DerivationTree("d", [])]))
+        >>> [(path, subtree.value) for path, subtree in expanded.paths()]
+        [((), '<a>'), ((0,), '<b>'), ((0, 0), 'd'), ((1,), 'c')]
+
+        :return: The (path, subtree) pairs of this tree.
+        """
 
-        result: List[Tuple[Path, "DerivationTree"]] = []
-        self.traverse(action, kind=DerivationTree.TRAVERSE_PREORDER)
-        return result
+        if self.__paths is None:
+            self.__paths = self.__spliced_from_origin(
+                lambda tree: tree.__paths, DerivationTree.paths, fix_ancestors=True
+            ).value_or(None)
+
+        if self.__paths is None:
+
+            def action(path, node):
+                result.append((path, node))
+
+            result: List[Tuple[Path, "DerivationTree"]] = []
+            self.traverse(action, kind=DerivationTree.TRAVERSE_PREORDER)
+            self.__paths = result
+
+        self.__forget_origin()
+        return self.__paths
+
+    def __spliced_from_origin(
+        self,
+        get_cached: Callable[
+            ["DerivationTree"], Optional[List[Tuple[Path, "DerivationTree"]]]
+        ],
+        compute: Callable[["DerivationTree"], List[Tuple[Path, "DerivationTree"]]],
+        fix_ancestors: bool = False,
+    ) -> Maybe[List[Tuple[Path, "DerivationTree"]]]:
+        """
+        Derives a list of (path, subtree) pairs in pre-order (all paths, or open
+        leaves) from the corresponding list of the tree from which this tree was
+        obtained by `replace_path`. For each replacement, we remove the entries
+        below the replaced path and insert the (prefixed) entries of the replacement
+        tree, whose list is obtained from `compute`. The cost is dominated by copying
+        the list, which is much cheaper than traversing the tree.
+
+        :param get_cached: Returns the cached list of a tree, if any.
+        :param compute: Computes the list for a tree.
+        :param fix_ancestors: If True, the entries of the ancestors of replaced paths
+            are updated to point to the new nodes.
+        :return: The derived list, or Nothing if the original tree has no cached list.
+        """
+
+        if self.__origin is None:
+            return Nothing
+
+        original, replacements = self.__origin
+        entries = get_cached(original)
+        if entries is None:
+            return Nothing
+
+        def first(entry: Tuple[Path, DerivationTree]) -> Path:
+            return entry[0]
+
+        result = list(entries)
+        for path, replacement in replacements:
+            start = bisect_left(result, path, key=first)
+            end = (
+                len(result)
+                if not path
+                else bisect_left(result, path[:-1] + (path[-1] + 1,), key=first)
+            )
+            result[start:end] = [
+                (path + sub_path, subtree) for sub_path, subtree in compute(replacement)
+            ]
+
+        if fix_ancestors:
+            for path, _ in replacements:
+                node = self
+                for idx in range(len(path)):
+                    if idx > 0:
+                        if not node.children or path[idx - 1] >= len(node.children):
+                            break
+                        node = node.children[path[idx - 1]]
+
+                    pos = bisect_left(result, path[:idx], key=first)
+                    assert result[pos][0] == path[:idx]
+                    result[pos] = (path[:idx], node)
+
+        return Some(result)
+
+    def __forget_origin(self) -> None:
+        # We keep the original tree only as long as some list that it has cached is
+        # not yet derived for this tree.
+        if self.__origin is None:
+            return
+
+        original, _ = self.__origin
+        if (self.__paths is not None or original.__paths is None) and (
+            self.__open_leaves is not None or original.__open_leaves is None
+        ):
+            self.__origin = None
 
     @lru_cache
     def trie(self) -> SubtreesTrie:
@@ -327,9 +544,89 @@ class DerivationTree:
         if isinstance(node_or_id, DerivationTree):
             node_or_id = node_or_id.id
 
-        return next(
-            (path for path, subtree in self.paths() if subtree.id == node_or_id), None
-        )
+        return self.__get_id_index().get(node_or_id)
+
+    def find_nodes(
+        self, nodes_or_ids: Iterable[Union["DerivationTree", int]]
+    ) -> List[Optional[Path]]:
+        """
+        Bulk version of :meth:`~isla.derivation_tree.DerivationTree.find_node`.
+
+        >>> tree = DerivationTree(
+        ...     "<a>",
+        ...     [DerivationTree("<b>", None, id=1), DerivationTree("c", [], id=2)],
+        ...     id=0)
+        >>> tree.find_nodes([2, tree, 3])
+        [(1,), (), None]
+
+        :param nodes_or_ids: The nodes or node IDs to search for.
+        :return: The paths to the nodes (or None), in the order of the input.
+        """
+
+        id_index = self.__get_id_index()
+        return [
+            id_index.get(
+                node_or_id.id if isinstance(node_or_id, DerivationTree) else node_or_id
+            )
+            for node_or_id in nodes_or_ids
+        ]
+
+    def __get_id_index(self) -> Dict[int, Path]:
+        # The index is built once per tree. Since trees are immutable and shared
+        # between solver states, so is the index. If IDs are not unique, we map
+        # each ID to the first path in pre-order, as a linear search would.
+        if self.__id_index is None:
+            self.__id_index = {
+                subtree.id: path for path, subtree in reversed(self.paths())
+            }
+
+        return self.__id_index
+
+    def subtrees_with_value(
+        self, value: str, path: Path = ()
+    ) -> List[Tuple[Path, "DerivationTree"]]:
+        """
+        Returns all subtrees with the given value (e.g., a nonterminal) below the given
+        path, together with their paths, in pre-order. The underlying index from node
+        values to subtrees is built once per tree; thus, looking up the matches of
+        many quantifiers in the same tree or in its subtrees does not require
+        re-traversing the tree.
+
+        >>> tree = DerivationTree.from_parse_tree(
+        ...     ("<a>", [("<b>", [("<b>", [("x", [])])]), ("<b>", [("y", [])])]))
+        >>> [(path, str(subtree)) for path, subtree in tree.subtrees_with_value("<b>")]
+        [((0,), 'x'), ((0, 0), 'x'), ((1,), 'y')]
+
+        >>> [path for path, _ in tree.subtrees_with_value("<b>", (0, 0))]
+        [(0, 0)]
+
+        >>> tree.subtrees_with_value("<c>")
+        []
+
+        :param value: The value of the searched-for subtrees.
+        :param path: The path below which (inclusively) to search.
+        :return: The (path, subtree) pairs of the subtrees with the given value.
+        """
+
+        if self.__value_index is None:
+            self.__value_index = {}
+            for subtree_path, subtree in self.paths():
+                self.__value_index.setdefault(subtree.value, []).append(
+                    (subtree_path, subtree)
+                )
+
+        entries = self.__value_index.get(value, [])
+        if not path:
+            return entries
+
+        def first(entry: Tuple[Path, DerivationTree]) -> Path:
+            return entry[0]
+
+        return entries[
+            bisect_left(entries, path, key=first) : bisect_left(
+                entries, path[:-1] + (path[-1] + 1,), key=first
+            )
+        ]
 
     def traverse(
         self,
@@ -481,7 +778,20 @@ class DerivationTree:
             )
 
         assert len(stack) == 1
-        return stack[0]
+        result = stack[0]
+
+        # Remember how we obtained the result such that derived data (paths and open
+        # leaves) can be updated instead of recomputed. For the empty path, the result
+        # is the replacement tree itself.
+        if not path:
+            pass
+        elif self.__paths is not None or self.__open_leaves is not None:
+            result.__origin = (self, ((path, replacement_tree),))
+        elif self.__origin is not None:
+            original, replacements = self.__origin
+            result.__origin = (original, replacements + ((path, replacement_tree),))
+
+        return result
 
     def leaves(self) -> Generator[Tuple[Path, "DerivationTree"], None, None]:
         return (
@@ -489,13 +799,23 @@ class DerivationTree:
         )
 
     def open_leaves(self) -> Generator[Tuple[Path, "DerivationTree"], None, None]:
-        return (
-            (path, sub_tree)
-            for path, sub_tree in self.paths()
-            if sub_tree.children is None
-        )
+        if self.__open_leaves is None:
+            self.__open_leaves = self.__spliced_from_origin(
+                lambda tree: tree.__open_leaves,
+                lambda tree: list(tree.open_leaves()),
+            ).value_or(None)
+
+        if self.__open_leaves is None:
+            self.__open_leaves = [
+                (path, sub_tree)
+                for path, sub_tree in self.paths()
+                if sub_tree.children is None
+            ]
+
+        self.__forget_origin()
+        return (leaf for leaf in self.__open_leaves)
 
-    @cache
+    @lru_cache(maxsize=100)
     def depth(self) -> int:
         if not self.children:
             return 1
@@ -515,6 +835,18 @@ class DerivationTree:
 
         return self.__len
 
+    @staticmethod
+    def __sum_of_lengths(children: Sequence["DerivationTree"]) -> Optional[int]:
+        # The length of a tree with the given children, if all their lengths are known.
+        # This way, lengths are propagated to new trees, e.g., in `replace_path`.
+        result = 1
+        for child in children:
+            if child.__len is None:
+                return None
+            result += child.__len
+
+        return result
+
     def substitute(
         self, subst_map: Dict["DerivationTree", "DerivationTree"]
     ) -> "DerivationTree":
@@ -727,46 +1059,47 @@ class DerivationTree:
             return None if self.children is None else list(self.children)
 
     def compute_hash_iteratively(self, structural=False):
-        # We perform an iterative reverse post-order depth-first traversal and use a stack
-        # to store intermediate results from lower levels.
+        # We perform an iterative post-order depth-first traversal and use a stack
+        # to store intermediate results from lower levels. We do not descend into
+        # subtrees whose hashes are already known; thus, after `replace_path`, only
+        # the new nodes on the path to the replacement are visited.
 
-        stack: List[int] = []
+        results: List[int] = []
+        stack: List[Tuple[DerivationTree, bool]] = [(self, False)]
 
-        def action(_, node: DerivationTree) -> None:
-            if structural and node.__structural_hash is not None:
-                for _ in range(len(node.children or [])):
-                    stack.pop()
-                stack.append(node.__structural_hash)
-                return
-            if not structural and node.__hash is not None:
-                for _ in range(len(node.children or [])):
-                    stack.pop()
-                stack.append(node.__hash)
-                return
+        while stack:
+            node, children_done = stack.pop()
+
+            node_hash = node.__structural_hash if structural else node.__hash
+            if node_hash is not None:
+                results.append(node_hash)
+                continue
 
             if node.children is None:
                 node_hash = (
                     hash(node.value) if structural else hash((node.value, node.id))
                 )
+            elif not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.children))
+                continue
             else:
-                children_values = []
-                for _ in range(len(node.children)):
-                    children_values.append(stack.pop())
+                num_children = len(node.children)
+                children_values = tuple(results[len(results) - num_children :])
+                del results[len(results) - num_children :]
                 node_hash = hash(
                     ((node.value,) if structural else (node.value, node.id))
-                    + tuple(children_values)
+                    + children_values
                 )
 
-            stack.append(node_hash)
+            results.append(node_hash)
             if structural:
                 node.__structural_hash = node_hash
             else:
                 node.__hash = node_hash
 
-        self.traverse(action, kind=DerivationTree.TRAVERSE_POSTORDER, reverse=True)
-
-        assert len(stack) == 1
-        return stack.pop()
+        assert len(results) == 1
+        return results.pop()
 
     def __hash__(self):
         # return self.id  # Should be unique!
@@ -19,15 +19,15 @@
 import copy
 import itertools
 import logging
-from functools import reduce
-from typing import Union, Optional, Set, Dict, cast, Tuple, List, Callable
+from functools import reduce, lru_cache
+from typing import Union, Optional, Set, Dict, cast, Tuple, List, Callable, Iterable
 
 import z3
 from grammar_graph import gg
 from orderedset import OrderedSet
 from returns.functions import compose
 from returns.maybe import Nothing, Some
-from returns.pipeline import flow
+from returns.pipeline import flow, is_successful
 from returns.pointfree import lash
 from returns.result import Success
 
@@ -69,6 +69,7 @@ from isla.language import (
     parse_bnf,
     unparse_isla,
     smt_atom,
+    convert_to_nnf,
 )
 from isla.three_valued_truth import ThreeValuedTruth
 from isla.trie import SubtreesTrie
@@ -82,7 +83,7 @@ from isla.z3_helpers import (
     z3_eq,
     replace_in_z3_expr,
     z3_subst,
-    Z3EvalResult,
+    evaluate_z3_formula,
 )
 
 logger = logging.getLogger("evaluator")
@@ -111,103 +112,227 @@ def evaluate(
     subtrees_trie: Optional[SubtreesTrie] = None,
     graph: Optional[gg.GrammarGraph] = None,
 ) -> ThreeValuedTruth:
-    assumptions = assumptions or set()
+    return PreparedFormula(
+        formula, grammar, structural_predicates, semantic_predicates, graph
+    ).evaluate(reference_tree, assumptions, subtrees_trie)
 
-    if isinstance(grammar, str):
-        grammar = parse_bnf(grammar)
 
-    assert reference_tree is not None
-    assert isinstance(reference_tree, DerivationTree)
-    subtrees_trie = reference_tree.trie() if subtrees_trie is None else subtrees_trie
-    graph = gg.GrammarGraph.from_grammar(grammar) if graph is None else graph
+class PreparedFormula:
+    """
+    A formula prepared for evaluation: The formula is parsed (with predicates
+    resolved) and converted to negation normal form, and the grammar graph is
+    computed. All of this happens only once; afterward, the formula can be evaluated
+    against any number of inputs. Use this class instead of
+    :func:`~isla.evaluator.evaluate` when checking many inputs against the same
+    constraint.
+
+    >>> grammar = {
+    ...     "<start>": ["<digits>"],
+    ...     "<digits>": ["<digit>", "<digit><digits>"],
+    ...     "<digit>": list("0123456789"),
+    ... }
+    >>> prepared = PreparedFormula(
+    ...     'not exists <digit> d in start: d = "0"', grammar)
+    >>> print(unparse_isla(prepared.formula))
+    forall <digit> d in start:
+      (not (= d "0"))
+
+    >>> from isla.parser import EarleyParser
+    >>> parser = EarleyParser(grammar)
+    >>> [
+    ...     prepared.evaluate(DerivationTree.from_parse_tree(next(parser.parse(inp))))
+    ...     for inp in ["12", "102"]
+    ... ]
+    [ThreeValuedTruth(val=1), ThreeValuedTruth(val=0)]
+    """
 
-    formula = instantiate_top_level_constant(
-        parse_isla(formula, grammar, structural_predicates, semantic_predicates)
-        if isinstance(formula, str)
-        else formula,
-        reference_tree,
-    )
+    def __init__(
+        self,
+        formula: Formula | str,
+        grammar: Grammar | str,
+        structural_predicates: Set[
+            StructuralPredicate
+        ] = STANDARD_STRUCTURAL_PREDICATES,
+        semantic_predicates: Set[SemanticPredicate] = STANDARD_SEMANTIC_PREDICATES,
+        graph: Optional[gg.GrammarGraph] = None,
+    ):
+        """
+        :param formula: The formula to prepare, either parsed or as a string.
+        :param grammar: The reference grammar, either parsed or in BNF syntax.
+        :param structural_predicates: The structural predicates for parsing the
+            formula (if it is passed as a string).
+        :param semantic_predicates: The semantic predicates for parsing the
+            formula (if it is passed as a string).
+        :param graph: The graph of the grammar, if already available.
+        """
+
+        self.grammar: Grammar = (
+            parse_bnf(grammar) if isinstance(grammar, str) else grammar
+        )
+        self.graph = (
+            gg.GrammarGraph.from_grammar(self.grammar) if graph is None else graph
+        )
+
+        self.formula: Formula = convert_to_nnf(
+            parse_isla(
+                formula, self.grammar, structural_predicates, semantic_predicates
+            )
+            if isinstance(formula, str)
+            else formula
+        )
 
-    # NOTE: Deactivated, might be too strict for evaluation (though maybe
-    #       necessary for solving). See comment in well_formed.
-    # if assertions_activated():
-    #     res, msg = well_formed(formula, grammar)
-    #     assert res, msg
+        top_level_constants = {
+            c
+            for c in VariablesCollector.collect(self.formula)
+            if isinstance(c, Constant) and not c.is_numeric()
+        }
+        assert len(top_level_constants) <= 1
+        self.top_level_constant: Optional[Constant] = next(
+            iter(top_level_constants), None
+        )
+
+        self.numeric_constants: Set[Constant] = {
+            c
+            for c in VariablesCollector.collect(self.formula)
+            if isinstance(c, Constant) and c.is_numeric()
+        }
 
-    if not assumptions and not FilterVisitor(
-        lambda f: isinstance(f, NumericQuantifiedFormula)
-    ).collect(formula):
         # The legacy evaluation performs better, but only works w/o
-        # NumericQuantifiedFormulas / assumptions. # It might be possible to consider
+        # NumericQuantifiedFormulas / assumptions. It might be possible to consider
         # assumptions, but the implemented method works and we would rather not invest
         # that work to gain some seconds of performance.
-        return evaluate_legacy(
-            formula, grammar, {}, reference_tree, trie=subtrees_trie, graph=graph
+        self.legacy_evaluation_applicable = not FilterVisitor(
+            lambda f: isinstance(f, NumericQuantifiedFormula)
+        ).collect(self.formula)
+
+        # Formulas for the legacy evaluation are compiled to closures once.
+        self.compiled_formula: Optional[CompiledFormula] = (
+            compile_formula(self.formula, self.grammar, self.graph)
+            if self.legacy_evaluation_applicable
+            else None
         )
 
-    qfr_free: Formula = eliminate_quantifiers(
-        formula,
-        grammar=grammar,
-        numeric_constants={
-            c
-            for f in (assumptions | {formula})
-            for c in VariablesCollector.collect(f)
-            if isinstance(c, Constant) and c.is_numeric()
-        },
-    )
+    def instantiate(self, reference_tree: DerivationTree) -> Formula:
+        """
+        :param reference_tree: The input to evaluate the formula against.
+        :return: The formula with the top-level constant (if any) replaced by the
+            given input.
+        """
 
-    # Substitute assumptions
+        if self.top_level_constant is None:
+            return self.formula
 
-    # First, eliminate quantifiers in assumptions. We don't supply any numeric constants
-    # here, as this would be unsound in assumptions: We know that the core holds for any
-    # int, but not for which one.
-    qfr_free_assumptions_set = eliminate_quantifiers_in_assumptions(
-        assumptions, formula, grammar
-    )
-    assert qfr_free_assumptions_set
-
-    # The assumptions in qfr_free_assumptions_set have to be regarded as a disjunction,
-    # thus we can only return True if the formula holds for all assumptions. However,
-    # we can already return False if it does not hold for any assumption.
-
-    for qfr_free_assumptions in qfr_free_assumptions_set:
-        # Replace the assumptions by True in the formula
-        assumptions_instantiated = qfr_free
-        for assumption in qfr_free_assumptions:
-            assumptions_instantiated = replace_formula(
-                assumptions_instantiated, assumption, sc.true()
+        return self.formula.substitute_expressions(
+            {self.top_level_constant: reference_tree}
+        )
+
+    def evaluate(
+        self,
+        reference_tree: DerivationTree,
+        assumptions: Optional[Set[Formula]] = None,
+        subtrees_trie: Optional[SubtreesTrie] = None,
+    ) -> ThreeValuedTruth:
+        """
+        Evaluates the prepared formula against the given input.
+
+        :param reference_tree: The input to evaluate the formula against.
+        :param assumptions: Formulas that can be assumed to hold.
+        :param subtrees_trie: The subtrees trie of the input, if already available.
+        :return: The truth value of the formula for the given input.
+        """
+
+        assumptions = assumptions or set()
+
+        assert reference_tree is not None
+        assert isinstance(reference_tree, DerivationTree)
+        subtrees_trie = (
+            reference_tree.trie() if subtrees_trie is None else subtrees_trie
+        )
+
+        # NOTE: Deactivated, might be too strict for evaluation (though maybe
+        #       necessary for solving). See comment in well_formed.
+        # if assertions_activated():
+        #     res, msg = well_formed(formula, grammar)
+        #     assert res, msg
+
+        if not assumptions and self.compiled_formula is not None:
+            # The compiled formula is not instantiated; instead, the top-level
+            # constant is assigned to the root of the reference tree.
+            return self.compiled_formula(
+                {}
+                if self.top_level_constant is None
+                else {self.top_level_constant: ((), reference_tree)},
+                reference_tree,
+                subtrees_trie,
             )
 
-        # Evaluate predicates
-        without_predicates: Formula = replace_formula(
-            assumptions_instantiated,
-            lambda f: evaluate_predicates_action(f, reference_tree, graph),
+        formula = self.instantiate(reference_tree)
+
+        qfr_free: Formula = eliminate_quantifiers(
+            formula,
+            grammar=self.grammar,
+            numeric_constants=self.numeric_constants
+            | {
+                c
+                for f in assumptions
+                for c in VariablesCollector.collect(f)
+                if isinstance(c, Constant) and c.is_numeric()
+            },
         )
 
-        # The remaining formula is a pure SMT formula if there were no quantifiers over
-        # open trees. In the case that there *were* such quantifiers, we still convert
-        # to an SMT formula, replacing all quantifiers with fresh predicates, which
-        # still allows us to perform an evaluation.
-        smt_formula: z3.BoolRef = approximate_isla_to_smt_formula(
-            without_predicates, replace_untranslatable_with_predicate=True
+        # Substitute assumptions
+
+        # First, eliminate quantifiers in assumptions. We don't supply any numeric
+        # constants here, as this would be unsound in assumptions: We know that the
+        # core holds for any int, but not for which one.
+        qfr_free_assumptions_set = eliminate_quantifiers_in_assumptions(
+            assumptions, formula, self.grammar
         )
+        assert qfr_free_assumptions_set
+
+        # The assumptions in qfr_free_assumptions_set have to be regarded as a
+        # disjunction, thus we can only return True if the formula holds for all
+        # assumptions. However, we can already return False if it does not hold for
+        # any assumption.
+
+        for qfr_free_assumptions in qfr_free_assumptions_set:
+            # Replace the assumptions by True in the formula
+            assumptions_instantiated = qfr_free
+            for assumption in qfr_free_assumptions:
+                assumptions_instantiated = replace_formula(
+                    assumptions_instantiated, assumption, sc.true()
+                )
 
-        smt_result = is_valid(smt_formula)
+            # Evaluate predicates
+            without_predicates: Formula = replace_formula(
+                assumptions_instantiated,
+                lambda f: evaluate_predicates_action(f, reference_tree, self.graph),
+            )
 
-        # We return unknown / false directly if the result is unknown / false for any
-        # assumption.
-        if smt_result.is_unknown():
-            return ThreeValuedTruth.unknown()
-        elif smt_result.is_false():
-            if not propositionally_unsatisfiable(
-                reduce(Formula.__and__, qfr_free_assumptions, sc.true())
-            ):
-                return ThreeValuedTruth.false()
-        else:
-            assert smt_result.is_true()
+            # The remaining formula is a pure SMT formula if there were no quantifiers
+            # over open trees. In the case that there *were* such quantifiers, we still
+            # convert to an SMT formula, replacing all quantifiers with fresh
+            # predicates, which still allows us to perform an evaluation.
+            smt_formula: z3.BoolRef = approximate_isla_to_smt_formula(
+                without_predicates, replace_untranslatable_with_predicate=True
+            )
+
+            smt_result = is_valid(smt_formula)
+
+            # We return unknown / false directly if the result is unknown / false for
+            # any assumption.
+            if smt_result.is_unknown():
+                return ThreeValuedTruth.unknown()
+            elif smt_result.is_false():
+                if not propositionally_unsatisfiable(
+                    reduce(Formula.__and__, qfr_free_assumptions, sc.true())
+                ):
+                    return ThreeValuedTruth.false()
+            else:
+                assert smt_result.is_true()
 
-    # We have proven the formula true for all assumptions: Return True
-    return ThreeValuedTruth.true()
+        # We have proven the formula true for all assumptions: Return True
+        return ThreeValuedTruth.true()
 
 
 def instantiate_top_level_constant(formula, reference_tree):
@@ -693,62 +818,37 @@ def evaluate_smt_formula(
     ):
         return Some(ThreeValuedTruth.unknown())
 
-    z3_formula = (
-        z3_subst(
-            formula.formula,
-            {
-                z3.String(var.name): z3.StringVal(str(tree))
-                for var, tree in formula.substitutions.items()
-            },
-        )
-        if formula.substitutions
-        else formula.formula
+    # We evaluate the formula natively for the values of the substituted trees and
+    # the assigned variables (the results are cached), which is much faster than
+    # substituting the values in the Z3 formula.
+    instantiation = tuple(
+        (var.name, str(tree)) for var, tree in formula.substitutions.items()
+    ) + tuple(
+        (var.name, str(assignments[var][1]))
+        for var in formula.free_variables()
+        if not assignments[var][1].is_open()
     )
 
-    def process_translation(translation: Z3EvalResult) -> Maybe[ThreeValuedTruth]:
-        var_map: Dict[str, Variable] = {var.name: var for var in assignments}
-
-        args_instantiation = [assignments[var_map[arg]][1] for arg in translation[0]]
-
-        if any(inst.is_open() for inst in args_instantiation):
-            return Some(ThreeValuedTruth.unknown())
-
-        string_instantiations = tuple(map(str, args_instantiation))
-
-        try:
-            return Some(
-                ThreeValuedTruth.from_bool(
-                    translation[1](string_instantiations)
-                    if string_instantiations
-                    else translation[1]
-                )
-            )
-        except DomainError:
-            return Some(ThreeValuedTruth.false())
+    def fallback() -> ThreeValuedTruth:
+        if is_successful(evaluate_z3_expression(formula.formula)):
+            # The formula could be evaluated natively if all variables were
+            # assigned to closed trees.
+            return ThreeValuedTruth.unknown()
 
-    def fallback(_) -> Maybe[ThreeValuedTruth]:
-        return Some(
-            is_valid(
-                z3.substitute(
-                    formula.formula,
-                    *tuple(
-                        {
-                            z3.String(symbol.name): z3.StringVal(
-                                str(symbol_assignment[1])
-                            )
-                            for symbol, symbol_assignment in assignments.items()
-                        }.items()
-                    ),
-                )
+        return is_valid(
+            z3.substitute(
+                formula.formula,
+                *tuple(
+                    {
+                        z3.String(symbol.name): z3.StringVal(str(symbol_assignment[1]))
+                        for symbol, symbol_assignment in assignments.items()
+                    }.items()
+                ),
             )
         )
 
-    return (
-        evaluate_z3_expression(z3_formula)
-        .map(process_translation)
-        .lash(compose(fallback, Success))
-        .unwrap()
-    )
+    result = evaluate_z3_formula(formula.formula, instantiation)
+    return result if is_successful(result) else Some(fallback())
 
 
 def evaluate_quantified_formula(
@@ -763,34 +863,19 @@ def evaluate_quantified_formula(
         return Nothing
 
     if isinstance(formula.in_variable, DerivationTree):
-        in_path, in_inst = next(
-            (path, subtree)
-            for path, subtree in reference_tree.paths()
-            if subtree.id == formula.in_variable.id
-        )
+        in_path = reference_tree.find_node(formula.in_variable)
+        assert in_path is not None
+        in_inst = reference_tree.get_subtree(in_path)
     else:
         assert formula.in_variable in assignments
         in_path, in_inst = assignments[formula.in_variable]
 
-    if formula.bind_expression is None:
-        sub_trie = trie.get_subtrie(in_path)
-
-        new_assignments: List[Dict[Variable, Tuple[Path, DerivationTree]]] = []
-        for path_key, (path, subtree) in sub_trie.items():
-            if subtree.value == formula.bound_variable.n_type:
-                new_assignments.append(
-                    {formula.bound_variable: (in_path + path, subtree)}
-                )
-    else:
-        new_assignments = [
-            {
-                var: (in_path + path, tree)
-                for var, (path, tree) in new_assignment.items()
-            }
-            for new_assignment in matches_for_quantified_formula(
-                formula, grammar, in_inst, {}
-            )
-        ]
+    new_assignments: List[Dict[Variable, Tuple[Path, DerivationTree]]] = [
+        {var: (in_path + path, tree) for var, (path, tree) in new_assignment.items()}
+        for new_assignment in matches_for_quantified_formula(
+            formula, grammar, reference_tree, {}, in_path
+        )
+    ]
 
     new_assignments = [
         new_assignment | assignments for new_assignment in new_assignments
@@ -1006,6 +1091,376 @@ def evaluate_disjunctive_formula(
     )
 
 
+Assignments = Dict[Variable, Tuple[Path, DerivationTree]]
+
+# A formula compiled by :func:`~isla.evaluator.compile_formula`. The arguments are
+# the assignments of the free variables, the reference tree, and its subtrees trie.
+CompiledFormula = Callable[
+    [Assignments, DerivationTree, SubtreesTrie], ThreeValuedTruth
+]
+
+
+def compile_formula(
+    formula: Formula,
+    grammar: Grammar,
+    graph: gg.GrammarGraph,
+) -> CompiledFormula:
+    """
+    Compiles a formula into a tree of closures computing the same result as
+    :func:`~isla.evaluator.evaluate_legacy`. All decisions that only depend on the
+    formula (the type of each sub-formula, the translation of SMT formulas to Python
+    functions, the arguments of predicates) are taken once, during compilation;
+    evaluating the compiled formula only traverses the reference tree. Conjunctions,
+    disjunctions, and quantifiers stop evaluating their sub-formulas as soon as the
+    result is determined.
+
+    >>> grammar = {
+    ...     "<start>": ["<digits>"],
+    ...     "<digits>": ["<digit>", "<digit><digits>"],
+    ...     "<digit>": list("0123456789"),
+    ... }
+    >>> graph = gg.GrammarGraph.from_grammar(grammar)
+    >>> formula = parse_isla(
+    ...     'forall <digit> d in start: str.to.int(d) < 5', grammar)
+    >>> compiled = compile_formula(formula, grammar, graph)
+
+    The top-level constant is passed as an assignment to the root of the tree.
+
+    >>> from isla.parser import EarleyParser
+    >>> start = next(iter(formula.free_variables()))
+    >>> def check(inp: str) -> ThreeValuedTruth:
+    ...     tree = DerivationTree.from_parse_tree(
+    ...         next(EarleyParser(grammar).parse(inp)))
+    ...     return compiled({start: ((), tree)}, tree, tree.trie())
+    >>> check("1234")
+    ThreeValuedTruth(val=1)
+    >>> check("1294")
+    ThreeValuedTruth(val=0)
+
+    :param formula: The formula to compile. It must not contain numeric quantifiers.
+    :param grammar: The reference grammar.
+    :param graph: The GrammarGraph for `grammar`.
+    :return: A function evaluating the formula.
+    """
+
+    def raise_not_implemented_error(_=Nothing) -> Maybe[CompiledFormula]:
+        raise NotImplementedError(
+            f"Don't know how to evaluate the formula {unparse_isla(formula)}"
+        )
+
+    return (
+        flow(
+            Nothing,
+            *map(
+                compose(lambda f: (lambda _: f(formula, grammar, graph)), lash),
+                [
+                    compile_exists_int_formula,
+                    compile_smt_formula,
+                    compile_quantified_formula,
+                    compile_structural_predicate_formula,
+                    compile_semantic_predicate_formula,
+                    compile_negated_formula,
+                    compile_conjunctive_formula,
+                    compile_disjunctive_formula,
+                ],
+            ),
+        )
+        .lash(raise_not_implemented_error)
+        .unwrap()
+    )
+
+
+def compile_exists_int_formula(formula: Formula, _1, _2) -> Maybe[CompiledFormula]:
+    if not isinstance(formula, ExistsIntFormula):
+        return Nothing
+
+    def evaluate_compiled(_1, _2, _3) -> ThreeValuedTruth:
+        raise NotImplementedError(
+            "This method cannot evaluate IntroduceNumericConstantFormula formulas."
+        )
+
+    return Some(evaluate_compiled)
+
+
+def compile_smt_formula(formula: Formula, _1, _2) -> Maybe[CompiledFormula]:
+    if not isinstance(formula, SMTFormula):
+        return Nothing
+
+    free_variables = formula.free_variables()
+    variables_by_name: Dict[str, Variable] = {var.name: var for var in free_variables}
+
+    if any(tree.is_open() for tree in formula.substitutions.values()):
+        return Some(lambda _1, _2, _3: ThreeValuedTruth.unknown())
+
+    z3_formula = (
+        z3_subst(
+            formula.formula,
+            {
+                z3.String(var.name): z3.StringVal(str(tree))
+                for var, tree in formula.substitutions.items()
+            },
+        )
+        if formula.substitutions
+        else formula.formula
+    )
+
+    match evaluate_z3_expression(z3_formula):
+        case Success((arg_names, translation)):
+            pass
+        case _:
+            # Z3 is needed to evaluate this formula; the instantiation of the
+            # variables is only known at evaluation time.
+            def evaluate_with_z3(
+                assignments: Assignments, reference_tree: DerivationTree, _
+            ) -> ThreeValuedTruth:
+                return evaluate_smt_formula(
+                    formula, assignments, reference_tree, None, None, None
+                ).unwrap()
+
+            return Some(evaluate_with_z3)
+
+    args = tuple(variables_by_name[arg_name] for arg_name in arg_names)
+
+    @lru_cache(maxsize=1024)
+    def evaluate_instantiation(values: Tuple[str, ...]) -> ThreeValuedTruth:
+        try:
+            return ThreeValuedTruth.from_bool(
+                translation(values) if args else translation
+            )
+        except DomainError:
+            return ThreeValuedTruth.false()
+
+    def evaluate_compiled(assignments: Assignments, _1, _2) -> ThreeValuedTruth:
+        if any(var not in assignments for var in free_variables):
+            return ThreeValuedTruth.unknown()
+
+        args_instantiation = [assignments[arg][1] for arg in args]
+        if any(inst.is_open() for inst in args_instantiation):
+            return ThreeValuedTruth.unknown()
+
+        return evaluate_instantiation(tuple(map(str, args_instantiation)))
+
+    return Some(evaluate_compiled)
+
+
+def compile_quantified_formula(
+    formula: Formula, grammar: Grammar, graph: gg.GrammarGraph
+) -> Maybe[CompiledFormula]:
+    if not isinstance(formula, QuantifiedFormula):
+        return Nothing
+
+    inner_formula = compile_formula(formula.inner_formula, grammar, graph)
+    in_variable = formula.in_variable
+    is_universal = isinstance(formula, ForallFormula)
+
+    def matches(
+        assignments: Assignments, reference_tree: DerivationTree
+    ) -> Tuple[DerivationTree, List[Assignments]]:
+        if isinstance(in_variable, DerivationTree):
+            in_path = reference_tree.find_node(in_variable)
+            assert in_path is not None
+            in_inst = reference_tree.get_subtree(in_path)
+        else:
+            assert in_variable in assignments
+            in_path, in_inst = assignments[in_variable]
+
+        return in_inst, [
+            {var: (in_path + path, tree) for var, (path, tree) in match.items()}
+            | assignments
+            for match in matches_for_quantified_formula(
+                formula, grammar, reference_tree, {}, in_path
+            )
+        ]
+
+    def has_potential_matches(
+        assignments: Assignments, reference_tree: DerivationTree, in_inst
+    ) -> bool:
+        open_leaves = list(reference_tree.open_leaves())
+        if not open_leaves:
+            return False
+
+        instantiated_formula = (
+            formula
+            if isinstance(in_variable, DerivationTree)
+            else formula.substitute_expressions({in_variable: in_inst})
+        ).substitute_expressions({v: t for v, (_, t) in assignments.items()})
+
+        return any(
+            quantified_formula_might_match(
+                instantiated_formula,
+                path_to_nonterminal,
+                reference_tree,
+                grammar,
+                graph.reachable,
+            )
+            for path_to_nonterminal, _ in open_leaves
+        )
+
+    def evaluate_compiled(
+        assignments: Assignments, reference_tree: DerivationTree, trie: SubtreesTrie
+    ) -> ThreeValuedTruth:
+        in_inst, new_assignments = matches(assignments, reference_tree)
+
+        # See evaluate_quantified_formula: If the reference tree contains open
+        # leaves that might eventually match the quantifier, the result is
+        # "unknown" for universal quantifiers, and for existential quantifiers
+        # if no instantiation satisfies the inner formula.
+        if is_universal:
+            if has_potential_matches(assignments, reference_tree, in_inst):
+                return ThreeValuedTruth.unknown()
+
+            return all_short_circuit(
+                inner_formula(new_assignment, reference_tree, trie)
+                for new_assignment in new_assignments
+            )
+
+        result = any_short_circuit(
+            inner_formula(new_assignment, reference_tree, trie)
+            for new_assignment in new_assignments
+        )
+
+        return (
+            ThreeValuedTruth.unknown()
+            if not result.is_true()
+            and has_potential_matches(assignments, reference_tree, in_inst)
+            else result
+        )
+
+    return Some(evaluate_compiled)
+
+
+def compile_structural_predicate_formula(
+    formula: Formula, _1, _2
+) -> Maybe[CompiledFormula]:
+    if not isinstance(formula, StructuralPredicateFormula):
+        return Nothing
+
+    predicate = formula.predicate
+    args = formula.args
+
+    def evaluate_compiled(
+        assignments: Assignments, reference_tree: DerivationTree, _
+    ) -> ThreeValuedTruth:
+        # Paths of tree arguments are looked up in the ID index of the reference tree.
+        arg_insts = [
+            arg
+            if isinstance(arg, str)
+            else reference_tree.find_node(arg)
+            if isinstance(arg, DerivationTree)
+            else assignments[arg][0]
+            for arg in args
+        ]
+        assert None not in arg_insts
+
+        return ThreeValuedTruth.from_bool(
+            predicate.evaluate(reference_tree, *arg_insts)
+        )
+
+    return Some(evaluate_compiled)
+
+
+def compile_semantic_predicate_formula(
+    formula: Formula, _, graph: gg.GrammarGraph
+) -> Maybe[CompiledFormula]:
+    if not isinstance(formula, SemanticPredicateFormula):
+        return Nothing
+
+    def evaluate_compiled(assignments: Assignments, _1, _2) -> ThreeValuedTruth:
+        return evaluate_semantic_predicate_formula(
+            formula, assignments, None, graph, None, None
+        ).unwrap()
+
+    return Some(evaluate_compiled)
+
+
+def compile_negated_formula(
+    formula: Formula, grammar: Grammar, graph: gg.GrammarGraph
+) -> Maybe[CompiledFormula]:
+    if not isinstance(formula, NegatedFormula):
+        return Nothing
+
+    inner_formula = compile_formula(formula.args[0], grammar, graph)
+
+    def evaluate_compiled(
+        assignments: Assignments, reference_tree: DerivationTree, trie: SubtreesTrie
+    ) -> ThreeValuedTruth:
+        return ThreeValuedTruth.not_(inner_formula(assignments, reference_tree, trie))
+
+    return Some(evaluate_compiled)
+
+
+def compile_conjunctive_formula(
+    formula: Formula, grammar: Grammar, graph: gg.GrammarGraph
+) -> Maybe[CompiledFormula]:
+    if not isinstance(formula, ConjunctiveFormula):
+        return Nothing
+
+    args = [compile_formula(arg, grammar, graph) for arg in formula.args]
+
+    def evaluate_compiled(
+        assignments: Assignments, reference_tree: DerivationTree, trie: SubtreesTrie
+    ) -> ThreeValuedTruth:
+        return all_short_circuit(arg(assignments, reference_tree, trie) for arg in args)
+
+    return Some(evaluate_compiled)
+
+
+def compile_disjunctive_formula(
+    formula: Formula, grammar: Grammar, graph: gg.GrammarGraph
+) -> Maybe[CompiledFormula]:
+    if not isinstance(formula, DisjunctiveFormula):
+        return Nothing
+
+    args = [compile_formula(arg, grammar, graph) for arg in formula.args]
+
+    def evaluate_compiled(
+        assignments: Assignments, reference_tree: DerivationTree, trie: SubtreesTrie
+    ) -> ThreeValuedTruth:
+        return any_short_circuit(arg(assignments, reference_tree, trie) for arg in args)
+
+    return Some(evaluate_compiled)
+
+
+def all_short_circuit(args: Iterable[ThreeValuedTruth]) -> ThreeValuedTruth:
+    """
+    Like :meth:`~isla.three_valued_truth.ThreeValuedTruth.all`, but stops consuming
+    the arguments once a false value is found.
+
+    :param args: The truth values to combine.
+    :return: False if any value is false, otherwise unknown if any value is unknown,
+        otherwise true.
+    """
+
+    result = ThreeValuedTruth.true()
+    for arg in args:
+        if arg.is_false():
+            return arg
+        if arg.is_unknown():
+            result = arg
+
+    return result
+
+
+def any_short_circuit(args: Iterable[ThreeValuedTruth]) -> ThreeValuedTruth:
+    """
+    Like :meth:`~isla.three_valued_truth.ThreeValuedTruth.any`, but stops consuming
+    the arguments once a true value is found.
+
+    :param args: The truth values to combine.
+    :return: True if any value is true, otherwise unknown if any value is unknown,
+        otherwise false.
+    """
+
+    result = ThreeValuedTruth.false()
+    for arg in args:
+        if arg.is_true():
+            return arg
+        if arg.is_unknown():
+            result = arg
+
+    return result
+
+
 def eliminate_quantifiers(
     formula: Formula,
     grammar: Grammar,
@@ -1186,7 +1641,28 @@ def matches_for_quantified_formula(
     grammar: Grammar,
     in_tree: Optional[DerivationTree] = None,
     initial_assignments: Optional[Dict[Variable, Tuple[Path, DerivationTree]]] = None,
+    in_path: Path = (),
 ) -> List[Dict[Variable, Tuple[Path, DerivationTree]]]:
+    """
+    Computes the matches of a quantified formula in a tree. Candidates for the bound
+    variable are obtained from the index of subtrees by node values of the tree
+    (see :meth:`~isla.derivation_tree.DerivationTree.subtrees_with_value`), which is
+    shared by all quantifiers ranging over the tree. Matches of the bind expression
+    are cached per structural hash of the matched subtree (see
+    :meth:`~isla.language.BindExpression.match_paths`).
+
+    :param formula: The quantified formula.
+    :param grammar: The grammar.
+    :param in_tree: The tree in which to search matches. Defaults to the tree in the
+        :code:`in_variable` of :code:`formula`, which then must be a tree.
+    :param initial_assignments: Assignments to add to each match.
+    :param in_path: If set, only matches at or below this path in :code:`in_tree`
+        are considered. The paths in the result are then relative to this path. This
+        way, searching matches in a subtree can make use of the index of a containing
+        tree.
+    :return: The matches, in pre-order of the subtrees matching the bound variable.
+    """
+
     assert in_tree is None or isinstance(in_tree, DerivationTree)
     if in_tree is None:
         in_tree = formula.in_variable
@@ -1198,40 +1674,28 @@ def matches_for_quantified_formula(
     if initial_assignments is None:
         initial_assignments = {}
 
-    def search_action(path: Path, tree: DerivationTree) -> None:
-        nonlocal new_assignments
+    for path, tree in in_tree.subtrees_with_value(qfd_var.n_type, in_path):
+        path = path[len(in_path) :]
 
-        node, children = tree
-        if node == qfd_var.n_type:
-            if bind_expr is not None:
-                maybe_match: Optional[
-                    Tuple[Tuple[BoundVariable, Tuple[Path, DerivationTree]]], ...
-                ]
-                maybe_match = bind_expr.match(tree, grammar)
-
-                if maybe_match is not None:
-                    maybe_match = dict(maybe_match)
-                    new_assignment = copy.copy(initial_assignments)
-                    new_assignment[qfd_var] = path, tree
-                    new_assignment.update(
-                        {v: (path + p[0], p[1]) for v, p in maybe_match.items()}
-                    )
+        if bind_expr is None:
+            new_assignment = copy.copy(initial_assignments)
+            new_assignment[qfd_var] = path, tree
+            new_assignments.append(new_assignment)
+            continue
 
-                    # The assignment is correct if there is not any non-matched leaf
-                    if all(
-                        any(
-                            match_path == leaf_path[: len(match_path)]
-                            for match_path, _ in maybe_match.values()
-                        )
-                        for leaf_path, _ in tree.leaves()
-                    ):
-                        new_assignments.append(new_assignment)
-            else:
-                new_assignment = copy.copy(initial_assignments)
-                new_assignment[qfd_var] = path, tree
-                new_assignments.append(new_assignment)
+        match_paths = bind_expr.match_paths(tree, grammar)
+        if match_paths is None:
+            continue
 
-    in_tree.traverse(search_action)
+        new_assignment = copy.copy(initial_assignments)
+        new_assignment[qfd_var] = path, tree
+        new_assignment.update(
+            {
+                var: (path + match_path, tree.get_subtree(match_path))
+                for var, match_path in match_paths
+            }
+        )
+        new_assignments.append(new_assignment)
 
     return new_assignments
 
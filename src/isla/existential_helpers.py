@@ -16,9 +16,20 @@
 # You should have received a copy of the GNU General Public License
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
 import sys
 from functools import lru_cache
-from typing import Optional, List, Tuple, cast, Union, Set, Dict
+from typing import (
+    Optional,
+    List,
+    Tuple,
+    cast,
+    Union,
+    Set,
+    Dict,
+    FrozenSet,
+    Iterator,
+)
 
 from grammar_graph.gg import GrammarGraph, NonterminalNode, Node, ChoiceNode
 from orderedset import OrderedSet
@@ -27,7 +38,6 @@ from isla import language
 from isla.helpers import (
     is_prefix,
     path_iterator,
-    dict_of_lists_to_list_of_dicts,
     assertions_activated,
     is_nonterminal,
 )
@@ -64,7 +74,8 @@ def insert_tree(
 
         assert graph.tree_is_valid(new_tree)
         assert all(
-            new_tree.find_node(node.id) is not None for _, node in in_tree.paths()
+            path is not None
+            for path in new_tree.find_nodes(node for _, node in in_tree.paths())
         )
 
         if (
@@ -76,9 +87,17 @@ def insert_tree(
             result_hashes.add(new_tree.structural_hash())
 
     graph = graph or GrammarGraph.from_grammar(non_canonical(grammar))
-    current_path = ()
 
-    while current_path is not None:
+    # Self embeddings can only result in trees containing `tree` at recursive
+    # nonterminals from which the root of `tree` is reachable; context additions
+    # only at nodes with the same root as `tree`. We skip all other positions.
+    self_embedding_nonterminals = (
+        self_embedding_nonterminals_reaching(graph, tree.value)
+        if is_nonterminal(tree.value)
+        else frozenset()
+    )
+
+    for current_path, current_tree in in_tree.paths():
         # Note: This can produce max_num_solutions * (number of insertion strategies)
         # many solutions, but, we do not divide the solution "slots" since different
         # solutions are interesting for different problems.
@@ -90,11 +109,15 @@ def insert_tree(
         if num_solutions is not None and num_solutions <= 0:
             break
 
-        if methods & DIRECT_EMBEDDING:
+        # Direct embeddings do not depend on the current path; we compute them once.
+        if methods & DIRECT_EMBEDDING and not current_path:
             add_to_result(
                 compute_direct_embeddings(tree, in_tree, grammar, graph, num_solutions)
             )
-        if methods & SELF_EMBEDDING:
+        if (
+            methods & SELF_EMBEDDING
+            and current_tree.value in self_embedding_nonterminals
+        ):
             add_to_result(
                 compute_self_embeddings(
                     current_path, tree, in_tree, grammar, graph, num_solutions
@@ -110,18 +133,36 @@ def insert_tree(
         #       Insertion by embedding is, in any case, non-destructive.
         # NOTE: Context addition is needed for XML and possibly other "nested"
         #       languages.
-        if methods & CONTEXT_ADDITION:
+        if methods & CONTEXT_ADDITION and current_tree.value == tree.value:
             add_to_result(
                 compute_context_additions(
                     current_path, tree, in_tree, grammar, graph, num_solutions
                 )
             )
 
-        current_path = in_tree.next_path(current_path)
-
     return result
 
 
+@lru_cache(maxsize=1024)
+def self_embedding_nonterminals_reaching(
+    graph: GrammarGraph, nonterminal: str
+) -> FrozenSet[str]:
+    """
+    :param graph: The grammar graph.
+    :param nonterminal: A nonterminal.
+    :return: The recursive nonterminals of the grammar from which
+        :code:`nonterminal` is reachable.
+    """
+
+    return frozenset(
+        node.symbol
+        for node in graph.all_nodes
+        if type(node) is NonterminalNode
+        and graph.reachable(node, node)
+        and graph.reachable(node, graph.get_node(nonterminal))
+    )
+
+
 def compute_context_additions(
     current_path: Path,
     tree: DerivationTree,
@@ -168,14 +209,13 @@ def compute_context_additions(
     return [
         tree
         for tree in result
-        if (
-            all(
-                tree.find_node(inserted_tree) is not None
-                for inserted_tree in all_in_tree_subtrees.values()
+        if all(
+            path is not None
+            for path in tree.find_nodes(
+                [*all_in_tree_subtrees.values(), into_tree]
+                + [node for _, node in in_tree.paths()]
             )
-            and tree.find_node(into_tree) is not None
         )
-        and all(tree.find_node(node.id) is not None for _, node in in_tree.paths())
     ]
 
 
@@ -212,13 +252,14 @@ def compute_self_embeddings(
     assert curr_tree.has_unique_ids()
     assert tree.has_unique_ids()
 
-    instantiated_self_embedding_trees: List[DerivationTree] = [
+    # Insertion results are computed lazily, only until we have enough solutions.
+    instantiated_self_embedding_trees: Iterator[DerivationTree] = (
         insert_result
         for self_embedding_tree in self_embedding_trees
         for insert_result in insert_trees(
             [curr_tree, tree], self_embedding_tree, grammar, graph, max_num_solutions
         )
-    ]
+    )
 
     for instantiated_tree in instantiated_self_embedding_trees:
         assert graph.tree_is_valid(instantiated_tree)
@@ -241,7 +282,8 @@ def compute_self_embeddings(
         assert new_tree.has_unique_ids()
 
         assert all(
-            new_tree.find_node(node.id) is not None for _, node in in_tree.paths()
+            path is not None
+            for path in new_tree.find_nodes(node for _, node in in_tree.paths())
         )
 
         results[new_tree.structural_hash()] = new_tree
@@ -289,7 +331,8 @@ def compute_direct_embeddings(
             retain_id=True,
         )
         assert all(
-            new_tree.find_node(node.id) is not None for _, node in in_tree.paths()
+            path is not None
+            for path in new_tree.find_nodes(node for _, node in in_tree.paths())
         )
         results[new_tree.structural_hash()] = new_tree
 
@@ -360,11 +403,13 @@ def insert_trees(
         t: l for t, l in possible_insertion_points.items() if l
     }
 
-    all_combinations: List[Dict[DerivationTree, Path]] = dict_of_lists_to_list_of_dicts(
-        possible_insertion_points
+    # Combinations are enumerated lazily, since we stop after enough solutions.
+    all_combinations: Iterator[Dict[DerivationTree, Path]] = (
+        dict(zip(possible_insertion_points.keys(), paths))
+        for paths in itertools.product(*possible_insertion_points.values())
     )
 
-    possible_combinations: List[Dict[DerivationTree, Path]] = [
+    possible_combinations: Iterator[Dict[DerivationTree, Path]] = (
         combination
         for combination in all_combinations
         if combination
@@ -378,7 +423,7 @@ def insert_trees(
             for idx_1, path_1 in enumerate(combination.values())
             for idx_2, path_2 in enumerate(combination.values())
         )
-    ]
+    )
 
     result: List[DerivationTree] = []
     for combination in possible_combinations:
@@ -400,8 +445,10 @@ def insert_trees(
                     assert graph.tree_is_valid(new_tree)
                     assert new_tree.has_unique_ids()
                     assert all(
-                        new_tree.find_node(node.id) is not None
-                        for _, node in tree.paths()
+                        path is not None
+                        for path in new_tree.find_nodes(
+                            node for _, node in tree.paths()
+                        )
                     )
 
                     new_result_trees.append(new_tree)
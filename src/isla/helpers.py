@@ -17,8 +17,10 @@
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
 import copy
+import hashlib
 import importlib.resources
 import itertools
+import json
 import logging
 import math
 import operator
@@ -359,6 +361,32 @@ def grammar_to_mutable(grammar: ImmutableGrammar) -> Grammar:
     return {nonterminal: list(expansion) for nonterminal, expansion in grammar}
 
 
+def grammar_hash(grammar: Grammar) -> str:
+    """
+    Computes a hash value for the given grammar that, unlike Python's :code:`hash`,
+    is stable across interpreter sessions. It can thus be used as a key for
+    persistent caches. The order of the rules does not matter.
+
+    >>> grammar_hash({"<start>": ["<a>"], "<a>": ["a", "b"]})
+    'f15248293a5d7760aa89df8f457cd9eab6c267d675f2749c9a11ee52a7107d20'
+
+    >>> (grammar_hash({"<start>": ["<a>"], "<a>": ["a", "b"]})
+    ...  == grammar_hash({"<a>": ["a", "b"], "<start>": ["<a>"]}))
+    True
+
+    >>> (grammar_hash({"<start>": ["<a>"], "<a>": ["a", "b"]})
+    ...  == grammar_hash({"<start>": ["<a>"], "<a>": ["b", "a"]}))
+    False
+
+    :param grammar: The grammar to hash.
+    :return: A hexadecimal SHA-256 hash value.
+    """
+
+    return hashlib.sha256(
+        json.dumps(grammar, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
 def nested_list_to_tuple(
     a_list: List[Union[T, List[T]]]
 ) -> Tuple[Union[T, Tuple[T, ...]], ...]:
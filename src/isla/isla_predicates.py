@@ -16,7 +16,6 @@
 # You should have received a copy of the GNU General Public License
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 import functools
 import heapq
 import random
@@ -33,11 +32,11 @@ from isla import language
 from isla.derivation_tree import DerivationTree
 from isla.existential_helpers import insert_tree, DIRECT_EMBEDDING, SELF_EMBEDDING
 from isla.helpers import (
-    delete_unreachable,
     parent_reflexive,
     parent_or_child,
     is_nonterminal,
     canonical,
+    grammar_to_immutable,
 )
 from isla.language import (
     SemPredEvalResult,
@@ -45,7 +44,7 @@ from isla.language import (
     SemanticPredicate,
     Variable,
 )
-from isla.parser import EarleyParser
+from isla.parser import earley_parser
 from isla.type_defs import Grammar, Path, ParseTree, CanonicalGrammar
 
 
@@ -581,10 +580,10 @@ def just(
 
 
 def mk_parser(grammar: Grammar):
+    immutable_grammar = grammar_to_immutable(grammar)
+
     def Parser(start: str) -> Callable[[str], List[ParseTree]]:
-        specialized_grammar = copy.deepcopy(grammar) | {"<start>": [start]}
-        specialized_grammar = delete_unreachable(specialized_grammar)
-        parser = EarleyParser(specialized_grammar)
+        parser = earley_parser(immutable_grammar, start)
 
         def result(inp: str) -> List[ParseTree]:
             return list(parser.parse(inp))
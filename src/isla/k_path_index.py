@@ -0,0 +1,155 @@
+# Copyright © 2022 CISPA Helmholtz Center for Information Security.
+# Author: Dominic Steinhöfel.
+#
+# This file is part of ISLa.
+#
+# ISLa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# ISLa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
+
+from functools import lru_cache
+from typing import Dict, Iterable, Set, Tuple
+
+from grammar_graph import gg
+from grammar_graph.gg import path_to_string
+
+KPath = Tuple[gg.Node, ...]
+
+
+class KPathIndex:
+    """
+    Numbers all k-paths (without terminal symbols) of a grammar graph such that sets
+    of k-paths can be represented as bit sets (Python integers). Bit :code:`i` is set
+    iff the i-th k-path of the grammar (in the lexicographic order of the string
+    representations of the paths) is in the set. Unions, intersections, and
+    differences of k-path sets thus become bitwise operations, and their sizes are
+    obtained by counting the set bits.
+
+    Use :func:`~isla.k_path_index.k_path_index` to obtain the (shared) index for
+    a graph and a value of k.
+
+    >>> from isla.derivation_tree import DerivationTree
+    >>> grammar = {
+    ...     "<start>": ["<a>"],
+    ...     "<a>": ["<b>", "<c>"],
+    ...     "<b>": ["b"],
+    ...     "<c>": ["c"],
+    ... }
+    >>> graph = gg.GrammarGraph.from_grammar(grammar)
+    >>> index = k_path_index(graph, 2)
+    >>> index.num_paths
+    3
+
+    >>> tree = DerivationTree.from_parse_tree(
+    ...     ("<start>", [("<a>", [("<b>", [("b", [])])])]))
+    >>> bits = index.to_bits(tree.k_paths(graph, 2, include_potential_paths=False))
+    >>> index.coverage(bits)
+    0.6666666666666666
+
+    >>> sorted(map(path_to_string, index.from_bits(index.all_bits & ~bits)))
+    ['<a> <a>-choice-2 <c>']
+
+    >>> index.num_contributed(index.all_bits, bits)
+    1
+    """
+
+    def __init__(self, graph: gg.GrammarGraph, k: int):
+        """
+        :param graph: The grammar graph whose k-paths should be numbered.
+        :param k: The length of the k-paths.
+        """
+
+        self.k = k
+        self.paths: Tuple[KPath, ...] = tuple(
+            sorted(graph.k_paths(k, include_terminals=False), key=path_to_string)
+        )
+        self.path_strings: Tuple[str, ...] = tuple(map(path_to_string, self.paths))
+
+        self.__bit_for_path: Dict[KPath, int] = {
+            path: 1 << idx for idx, path in enumerate(self.paths)
+        }
+        self.__bit_for_string: Dict[str, int] = {
+            path_string: 1 << idx for idx, path_string in enumerate(self.path_strings)
+        }
+
+        self.num_paths = len(self.paths)
+        self.all_bits = (1 << self.num_paths) - 1
+
+    def to_bits(self, paths: Iterable[KPath]) -> int:
+        """
+        :param paths: A collection of k-paths.
+        :return: The bit set of the given k-paths. Paths that are not k-paths of the
+            grammar are ignored.
+        """
+
+        result = 0
+        for path in paths:
+            result |= self.__bit_for_path.get(path, 0)
+        return result
+
+    def strings_to_bits(self, path_strings: Iterable[str]) -> int:
+        """
+        :param path_strings: A collection of k-paths in their string representation
+            (see :func:`grammar_graph.gg.path_to_string`).
+        :return: The bit set of the given k-paths. Paths that are not k-paths of the
+            grammar are ignored.
+        """
+
+        result = 0
+        for path_string in path_strings:
+            result |= self.__bit_for_string.get(path_string, 0)
+        return result
+
+    def contains_string(self, path_string: str) -> bool:
+        return path_string in self.__bit_for_string
+
+    def from_bits(self, bits: int) -> Set[KPath]:
+        """
+        :param bits: A bit set of k-paths.
+        :return: The k-paths in the bit set.
+        """
+
+        return {path for idx, path in enumerate(self.paths) if bits >> idx & 1}
+
+    def coverage(self, bits: int) -> float:
+        """
+        :param bits: A bit set of k-paths.
+        :return: The fraction of the grammar's k-paths contained in the bit set.
+        """
+
+        if not self.num_paths:
+            return 0
+
+        return bits.bit_count() / self.num_paths
+
+    @staticmethod
+    def num_contributed(bits: int, covered_bits: int) -> int:
+        """
+        :param bits: A bit set of k-paths.
+        :param covered_bits: A bit set of already covered k-paths.
+        :return: The number of k-paths in :code:`bits` not in :code:`covered_bits`.
+        """
+
+        return (bits & ~covered_bits).bit_count()
+
+
+@lru_cache(maxsize=32)
+def k_path_index(graph: gg.GrammarGraph, k: int) -> KPathIndex:
+    """
+    :param graph: A grammar graph.
+    :param k: The length of the k-paths.
+    :return: The k-path index for the given graph and k. The indices of recently used
+        graphs are cached. Since the numbering is deterministic, an index computed
+        again after being evicted from the cache numbers the k-paths in the same way.
+    """
+
+    return KPathIndex(graph, k)
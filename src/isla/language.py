@@ -16,17 +16,21 @@
 # You should have received a copy of the GNU General Public License
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
-import copy
 import dataclasses
 import functools
+import hashlib
+import io
 import itertools
 import logging
 import operator
+import os
 import pickle
 import random
 import re
 import string
-from abc import ABC, abstractmethod
+import threading
+import weakref
+from abc import ABC, ABCMeta, abstractmethod
 from dataclasses import dataclass
 from functools import reduce, lru_cache, cache
 from typing import (
@@ -44,6 +48,8 @@ from typing import (
     TypeVar,
     MutableSet,
     Mapping,
+    Any,
+    FrozenSet,
 )
 
 import antlr4
@@ -54,14 +60,14 @@ from antlr4.Token import CommonToken
 from grammar_graph import gg
 from orderedset import FrozenOrderedSet, OrderedSet
 from returns.converters import result_to_maybe
-from returns.functions import compose, tap, raise_exception
+from returns.functions import tap, raise_exception
 from returns.maybe import Nothing, Some
-from returns.pipeline import flow, is_successful
-from returns.pointfree import lash
+from returns.pipeline import is_successful
 from returns.result import safe
 from z3 import Z3Exception
 
 import isla.mexpr_parser.MexprParserListener as MexprParserListener
+from isla import __version__ as isla_version
 from isla.bnf import bnfListener
 from isla.bnf.bnfLexer import bnfLexer
 from isla.bnf.bnfParser import bnfParser
@@ -90,13 +96,14 @@ from isla.helpers import (
     powerset,
     grammar_to_immutable,
     nested_list_to_tuple,
+    grammar_hash,
 )
 from isla.isla_language import IslaLanguageListener
 from isla.isla_language.IslaLanguageLexer import IslaLanguageLexer
 from isla.isla_language.IslaLanguageParser import IslaLanguageParser
 from isla.mexpr_lexer.MexprLexer import MexprLexer
 from isla.mexpr_parser.MexprParser import MexprParser
-from isla.parser import EarleyParser, PEGParser
+from isla.parser import PEGParser, earley_parser
 from isla.type_defs import Path, Grammar, ImmutableGrammar, ImmutableList, Pair
 from isla.z3_helpers import (
     is_valid,
@@ -104,11 +111,14 @@ from isla.z3_helpers import (
     z3_subst,
     get_symbols,
     smt_expr_to_str,
+    evaluate_z3_formula,
 )
 
 SolutionState = List[Tuple["Constant", "Formula", "DerivationTree"]]
 Assignment = Tuple["Constant", "Formula", "DerivationTree"]
 
+T = TypeVar("T")
+
 language_core_logger = logging.getLogger("isla-language-core")
 
 # The below is an important optimization: In Z3's ExprRef, __eq__ is overloaded
@@ -199,7 +209,134 @@ class NameUnawareDummyVariable(DummyVariable):
         return hash(self.n_type)
 
 
+@dataclass(frozen=True)
+class MatchPattern:
+    """
+    A tree prefix of a match expression (see
+    :meth:`~isla.language.BindExpression.to_tree_prefix`) compiled for matching.
+    Each node of the pattern holds the node value to match, the patterns for the
+    children (None if the prefix tree is open at this point, such that any
+    subtree matches), and the variables bound to the node. In contrast to
+    :func:`~isla.language.match`, matching a pattern does not need to look up
+    variable paths or to copy the prefix tree, and dummy variables for adjacent
+    characters of a terminal symbol are merged once during compilation.
+
+    >>> mexpr_tree = DerivationTree.from_parse_tree(
+    ...     ("<a>", [("<b>", None), ("+", []), ("<b>", None)]))
+    >>> x, y = BoundVariable("x", "<b>"), BoundVariable("y", "<b>")
+    >>> pattern = MatchPattern.from_tree_prefix(
+    ...     mexpr_tree, {x: (0,), DummyVariable("+"): (1,), y: (2,)})
+    >>> pattern.is_complete
+    True
+
+    >>> tree = DerivationTree.from_parse_tree(
+    ...     ("<a>", [("<b>", [("1", [])]), ("+", []), ("<b>", [("2", [])])]))
+    >>> result = pattern.match(tree)
+    >>> result[x][0], str(result[x][1]), result[y][0], str(result[y][1])
+    ((0,), '1', (2,), '2')
+
+    >>> other_tree = DerivationTree.from_parse_tree(("<a>", [("<b>", None)]))
+    >>> print(pattern.match(other_tree))
+    None
+    """
+
+    value: str
+    children: Optional[Tuple["MatchPattern", ...]]
+    bound_variables: Tuple[BoundVariable, ...]
+    is_complete: bool
+
+    @staticmethod
+    def from_tree_prefix(
+        mexpr_tree: DerivationTree, mexpr_var_paths: Dict[BoundVariable, Path]
+    ) -> "MatchPattern":
+        """
+        :param mexpr_tree: A tree prefix of a match expression.
+        :param mexpr_var_paths: The paths of the variables of the match expression in
+            :code:`mexpr_tree`.
+        :return: The compiled pattern.
+        """
+
+        variables_at_path: Dict[Path, List[BoundVariable]] = {}
+        for var, path in mexpr_var_paths.items():
+            variables_at_path.setdefault(path, []).append(var)
+
+        def compile_node(path: Path, node: DerivationTree) -> MatchPattern:
+            bound_variables = variables_at_path.get(path, [])
+
+            if node.children is None:
+                return MatchPattern(
+                    node.value, None, tuple(bound_variables), bool(bound_variables)
+                )
+
+            if not node.children:
+                if not is_nonterminal(node.value) and len(bound_variables) > 1:
+                    # Dummy variables split into individual characters when creating
+                    # the tree prefix are merged for the terminal symbol.
+                    bound_variables = [
+                        DummyVariable("".join(var.n_type for var in bound_variables))
+                    ]
+
+                return MatchPattern(
+                    node.value, (), tuple(bound_variables), bool(bound_variables)
+                )
+
+            assert not bound_variables
+            children = tuple(
+                compile_node(path + (idx,), child)
+                for idx, child in enumerate(node.children)
+            )
+
+            return MatchPattern(
+                node.value,
+                children,
+                (),
+                all(child.is_complete for child in children),
+            )
+
+        return compile_node((), mexpr_tree)
+
+    def match(
+        self, tree: DerivationTree
+    ) -> Optional[Dict[BoundVariable, Tuple[Path, DerivationTree]]]:
+        """
+        :param tree: The tree to match.
+        :return: A mapping from the bound variables of this pattern to their paths and
+            subtrees in :code:`tree`, or None if there is no match.
+        """
+
+        result: Dict[BoundVariable, Tuple[Path, DerivationTree]] = {}
+        stack: List[Tuple[Path, DerivationTree, MatchPattern]] = [((), tree, self)]
+
+        while stack:
+            path, node, pattern = stack.pop()
+            if node.value != pattern.value:
+                return None
+
+            if pattern.children is None or not pattern.children:
+                # An open pattern matches any tree; a closed leaf only a closed leaf.
+                if pattern.children is not None and (
+                    node.children is None or node.children
+                ):
+                    return None
+
+                for var in pattern.bound_variables:
+                    result[var] = path, node
+
+                continue
+
+            if not node.children or len(node.children) != len(pattern.children):
+                return None
+
+            for idx in reversed(range(len(pattern.children))):
+                stack.append((path + (idx,), node.children[idx], pattern.children[idx]))
+
+        return result
+
+
 class BindExpression:
+    # The maximum number of cached results of `match`.
+    MATCH_CACHE_SIZE = 1 << 14
+
     def __init__(self, *bound_elements: Union[str, BoundVariable, List[str]]):
         self.bound_elements: List[BoundVariable | List[BoundVariable]] = []
         for bound_elem in bound_elements:
@@ -236,6 +373,21 @@ class BindExpression:
         ] = {}
         self.__flattened_elements: Dict[str, Tuple[Tuple[BoundVariable, ...], ...]] = {}
 
+        # Match expressions compiled to patterns, per nonterminal, and the results
+        # of matching (patterns and relative paths of the bound variables) indexed
+        # by the structural hashes, values, and sizes of the matched trees. The
+        # entries also hold the grammars and the matched trees, such that a hit is
+        # only used for the same grammar and a structurally equal tree.
+        self.__match_patterns: Dict[str, Tuple[MatchPattern, ...]] = {}
+        self.__match_cache: Dict[
+            Tuple[int, str, int],
+            Tuple[
+                Grammar,
+                DerivationTree,
+                Optional[Tuple[MatchPattern, Tuple[Tuple[BoundVariable, Path], ...]]],
+            ],
+        ] = {}
+
     def __add__(self, other: Union[str, "BoundVariable"]) -> "BindExpression":
         assert isinstance(other, str) or isinstance(other, BoundVariable)
         result = BindExpression(*self.bound_elements)
@@ -451,12 +603,121 @@ class BindExpression:
     def match(
         self, tree: DerivationTree, grammar: Grammar
     ) -> Optional[Dict[BoundVariable, Tuple[Path, DerivationTree]]]:
-        for mexpr_tree, mexpr_var_matches in self.to_tree_prefix(tree.value, grammar):
-            possible_match = match(tree, mexpr_tree, mexpr_var_matches)
+        """
+        Matches this bind expression against :code:`tree`. For each nonterminal, the
+        bind expression is parsed to tree prefixes and compiled to
+        :class:`~isla.language.MatchPattern` objects only once. Since the matched
+        paths only depend on the structure of :code:`tree`, the result is cached
+        per structural hash of :code:`tree`, such that structurally equal trees (in
+        different solver states or at different positions of the same tree) are
+        only matched once.
+
+        >>> bind_expression = BindExpression(
+        ...     BoundVariable("x", "<b>"), "+", BoundVariable("y", "<b>"))
+        >>> grammar = {
+        ...     "<start>": ["<a>"],
+        ...     "<a>": ["<b>+<b>", "<b>"],
+        ...     "<b>": ["1", "2"],
+        ... }
+        >>> tree = DerivationTree.from_parse_tree(
+        ...     ("<a>", [("<b>", [("1", [])]), ("+", []), ("<b>", [("2", [])])]))
+        >>> result = bind_expression.match(tree, grammar)
+        >>> [(var.n_type, path, str(subtree)) for var, (path, subtree) in result.items()]
+        [('<b>', (0,), '1'), ('+', (1,), '+'), ('<b>', (2,), '2')]
+
+        The matched subtrees are those of the given tree, also for cached results:
+
+        >>> other_tree = tree.new_ids()
+        >>> other_result = bind_expression.match(other_tree, grammar)
+        >>> other_result[BoundVariable("y", "<b>")][1] is other_tree.children[2]
+        True
+
+        :param tree: The tree to match.
+        :param grammar: The grammar of the tree.
+        :return: A mapping from the variables of the match expression to their paths
+            and subtrees in :code:`tree`, or None if there is no match.
+        """
+
+        maybe_match = self.__match_paths(tree, grammar)
+        if maybe_match is None:
+            return None
+
+        _, paths = maybe_match
+        return {var: (path, tree.get_subtree(path)) for var, path in paths}
+
+    def match_paths(
+        self, tree: DerivationTree, grammar: Grammar
+    ) -> Optional[Tuple[Tuple[BoundVariable, Path], ...]]:
+        """
+        Like :meth:`~isla.language.BindExpression.match`, but only returns
+        *complete* matches, i.e., matches where each leaf of :code:`tree` is
+        below the path of some bound variable, and only the paths of the matched
+        subtrees (relative to :code:`tree`).
+
+        >>> bind_expression = BindExpression(
+        ...     BoundVariable("x", "<b>"), "+", BoundVariable("y", "<b>"))
+        >>> grammar = {
+        ...     "<start>": ["<a>"],
+        ...     "<a>": ["<b>+<b>", "<b>"],
+        ...     "<b>": ["1", "2"],
+        ... }
+        >>> tree = DerivationTree.from_parse_tree(
+        ...     ("<a>", [("<b>", [("1", [])]), ("+", []), ("<b>", [("2", [])])]))
+        >>> [(var.n_type, path) for var, path in bind_expression.match_paths(
+        ...     tree, grammar)]
+        [('<b>', (0,)), ('+', (1,)), ('<b>', (2,))]
+
+        A structurally equal tree with different node IDs is not matched again:
+
+        >>> bind_expression.match_paths(tree.new_ids(), grammar) is (
+        ...     bind_expression.match_paths(tree, grammar))
+        True
+
+        :param tree: The tree to match.
+        :param grammar: The grammar of the tree.
+        :return: The paths of the matched subtrees, or None if there is no complete
+            match.
+        """
+
+        maybe_match = self.__match_paths(tree, grammar)
+        if maybe_match is None or not maybe_match[0].is_complete:
+            return None
+
+        return maybe_match[1]
+
+    def __match_paths(
+        self, tree: DerivationTree, grammar: Grammar
+    ) -> Optional[Tuple[MatchPattern, Tuple[Tuple[BoundVariable, Path], ...]]]:
+        key = tree.structural_hash(), tree.value, len(tree)
+        if key in self.__match_cache:
+            cached_grammar, cached_tree, cached_result = self.__match_cache[key]
+            if cached_grammar is grammar and (
+                cached_tree is tree or cached_tree.structurally_equal(tree)
+            ):
+                return cached_result
+
+        if tree.value not in self.__match_patterns:
+            self.__match_patterns[tree.value] = tuple(
+                MatchPattern.from_tree_prefix(mexpr_tree, mexpr_var_paths)
+                for mexpr_tree, mexpr_var_paths in self.to_tree_prefix(
+                    tree.value, grammar
+                )
+            )
+
+        result = None
+        for pattern in self.__match_patterns[tree.value]:
+            possible_match = pattern.match(tree)
             if possible_match:
-                return possible_match
+                result = pattern, tuple(
+                    (var, path) for var, (path, _) in possible_match.items()
+                )
+                break
 
-        return None
+        if len(self.__match_cache) >= BindExpression.MATCH_CACHE_SIZE:
+            self.__match_cache.clear()
+
+        self.__match_cache[key] = grammar, tree, result
+        return result
 
     def __repr__(self):
         return f'BindExpression({", ".join(map(repr, self.bound_elements))})'
@@ -724,7 +985,227 @@ class NoopFormulaTransformer(FormulaTransformer):
         return formula
 
 
-class Formula(ABC):
+# Prefix of the names of the attributes in which formulas cache the results of
+# `memoized_formula_method`s. Caches are excluded from pickled states and from the
+# interning keys of formulas.
+FORMULA_CACHE_PREFIX = "_cached_"
+
+
+def memoized_formula_method(
+    method: Callable[["Formula"], T]
+) -> Callable[["Formula"], T]:
+    """
+    Caches the result of a formula method without parameters (e.g.,
+    :meth:`~isla.language.Formula.free_variables`) in the formula itself. This is
+    sound since formulas are immutable.
+
+    :param method: The method to memoize.
+    :return: The memoized method.
+    """
+
+    attribute = FORMULA_CACHE_PREFIX + method.__name__.strip("_")
+
+    @functools.wraps(method)
+    def memoized(self: "Formula") -> T:
+        try:
+            return self.__dict__[attribute]
+        except KeyError:
+            result = method(self)
+            self.__dict__[attribute] = result
+            return result
+
+    return memoized
+
+
+def formula_cache(formula: "Formula", name: str) -> Dict[Any, Any]:
+    """
+    Returns a dictionary stored in the given formula for caching the results of the
+    function :code:`name` (e.g., :func:`~isla.language.convert_to_nnf`) for that
+    formula, indexed by the function's remaining arguments. Like the results of
+    :func:`~isla.language.memoized_formula_method`, these caches are not pickled.
+
+    :param formula: The formula.
+    :param name: The name of the cached function.
+    :return: The cache of the function for the given formula.
+    """
+
+    attribute = FORMULA_CACHE_PREFIX + name
+    try:
+        return formula.__dict__[attribute]
+    except KeyError:
+        result = {}
+        formula.__dict__[attribute] = result
+        return result
+
+
+# The results of the substitutions performed during the currently running outermost
+# call of `substitute_expressions` (attribute `cache`), indexed by the IDs of the
+# formula or tree and of the substitution map. The values also hold the formulas or
+# trees and the maps, such that their IDs cannot be reused while the cache exists.
+# Each thread has its own cache.
+_substitution_state = threading.local()
+
+
+def cached_substitution(
+    target: T, subst_map: Mapping, substitute: Callable[[], T]
+) -> T:
+    """
+    Substitutes :code:`subst_map` in :code:`target` (a formula or tree) using
+    :code:`substitute` once per batch of substitutions, i.e., during the outermost
+    call of :meth:`~isla.language.Formula.substitute_expressions` in the current
+    thread. Formulas are shared (see :class:`~isla.language.FormulaMeta`), and the
+    same trees occur in many formulas (e.g., as the :code:`in_variable` of all
+    quantifiers). Each of them is thus only substituted once, and the results are
+    shared, too.
+
+    :param target: The formula or tree to substitute in.
+    :param subst_map: The substitution.
+    :param substitute: The function computing the substitution result.
+    :return: The substitution result.
+    """
+
+    cache: Optional[Dict[Tuple[int, int], Tuple[Any, Mapping, Any]]] = getattr(
+        _substitution_state, "cache", None
+    )
+
+    if cache is None:
+        _substitution_state.cache = {}
+        try:
+            return cached_substitution(target, subst_map, substitute)
+        finally:
+            _substitution_state.cache = None
+
+    key = (id(target), id(subst_map))
+    if key not in cache:
+        cache[key] = (target, subst_map, substitute())
+
+    return cache[key][2]
+
+
+def substitute_tree(
+    tree: DerivationTree,
+    subst_map: Mapping[Union[Variable, DerivationTree], DerivationTree],
+) -> DerivationTree:
+    """
+    :param tree: The tree to substitute in.
+    :param subst_map: The substitution.
+    :return: :code:`tree.substitute(subst_map)`, computed once per batch of
+        substitutions (see :func:`~isla.language.cached_substitution`).
+    """
+
+    return cached_substitution(tree, subst_map, lambda: tree.substitute(subst_map))
+
+
+def prune_irrelevant_substitutions(
+    substitute_expressions: Callable[..., "Formula"]
+) -> Callable[..., "Formula"]:
+    """
+    Decorates implementations of
+    :meth:`~isla.language.Formula.substitute_expressions` such that only the
+    sub-formulas for which a substitution is relevant (see
+    :func:`~isla.language.subst_map_relevant`) are rewritten, and each of them only
+    once per batch of substitutions (see :func:`~isla.language.cached_substitution`).
+    Substituting an irrelevant map is equivalent to substituting the empty map,
+    which only normalizes a formula (e.g., evaluates ground SMT formulas). The
+    normalized formula is computed once per formula; for formulas that are already
+    normalized, it is the formula itself.
+
+    :param substitute_expressions: The substitution method to decorate.
+    :return: The decorated method.
+    """
+
+    attribute = FORMULA_CACHE_PREFIX + "substitution_normal_form"
+
+    @functools.wraps(substitute_expressions)
+    def pruned(self: "Formula", subst_map, *args, **kwargs) -> "Formula":
+        if args or kwargs:
+            return substitute_expressions(self, subst_map, *args, **kwargs)
+
+        if subst_map and subst_map_relevant(self, subst_map):
+            return cached_substitution(
+                self, subst_map, lambda: substitute_expressions(self, subst_map)
+            )
+
+        # We store None instead of the formula itself to avoid reference cycles.
+        if attribute not in self.__dict__:
+            result = substitute_expressions(self, {})
+            self.__dict__[attribute] = None if result is self else result
+
+        normal_form = self.__dict__[attribute]
+        return self if normal_form is None else normal_form
+
+    return pruned
+
+
+def interning_value(value: Any) -> Any:
+    """
+    Converts an attribute value of a formula to a hashable value for the formula's
+    interning key. In contrast to :meth:`~isla.language.BindExpression.__eq__`, the
+    resulting values for bind expressions distinguish between dummy variables.
+    Sub-formulas and predicates are represented by their identity.
+
+    >>> interning_value([BoundVariable("x", "<x>"), {"a": 1}])
+    (BoundVariable("x", "<x>"), (('a', 1),))
+
+    :param value: The attribute value.
+    :return: A hashable value that is equal for two attribute values iff they are
+        indistinguishable.
+    """
+
+    value_type = type(value)
+
+    if isinstance(value_type, FormulaMeta):
+        # Sub-formulas are interned themselves. Comparing them by `__eq__` would be
+        # too coarse, since, e.g., SMT formulas with differently typed free
+        # variables are equal.
+        return id(value)
+
+    if isinstance(value, (StructuralPredicate, SemanticPredicate)):
+        # Predicates are compared by their names and arities only, but predicates
+        # with the same name may have different evaluation functions. The formula
+        # references the predicate, so its ID is not reused while the formula lives.
+        return id(value)
+
+    if value_type is BindExpression:
+        return BindExpression, interning_value(value.bound_elements)
+
+    if value_type is dict:
+        return tuple(value.items())
+
+    if value_type in (list, tuple, set, OrderedSet):
+        return tuple(map(interning_value, value))
+
+    return value
+
+
+class FormulaMeta(ABCMeta):
+    """
+    Hash-conses formulas: Constructing a formula that is indistinguishable from a
+    live, existing formula (i.e., one with the same interning key, see
+    :meth:`~isla.language.Formula.interning_key`) returns that existing formula.
+    Equal formulas thus usually are identical, and their hashes, free variables etc.
+    are computed only once.
+
+    >>> x = Constant("x", "<x>")
+    >>> SMTFormula("(= x \\"a\\")", x) is SMTFormula("(= x \\"a\\")", x)
+    True
+    >>> SMTFormula("(= x \\"a\\")", x) is SMTFormula("(= x \\"b\\")", x)
+    False
+    """
+
+    # The table of all live formulas, indexed by their interning keys.
+    interned_formulas: weakref.WeakValueDictionary[
+        Tuple, "Formula"
+    ] = weakref.WeakValueDictionary()
+
+    def __call__(cls, *args, **kwargs):
+        formula = super().__call__(*args, **kwargs)
+        return FormulaMeta.interned_formulas.setdefault(
+            formula.interning_key(), formula
+        )
+
+
+class Formula(ABC, metaclass=FormulaMeta):
     @abstractmethod
     def bound_variables(self) -> FrozenOrderedSet[BoundVariable]:
         """Non-recursive: Only non-empty for quantified formulas"""
@@ -740,6 +1221,11 @@ class Formula(ABC):
         """Trees that were substituted for variables."""
         raise NotImplementedError()
 
+    @memoized_formula_method
+    def variables(self) -> FrozenOrderedSet[Variable]:
+        """Recursive: All free and bound variables."""
+        return VariablesCollector.collect(self)
+
     @abstractmethod
     def substitute_variables(self, subst_map: Mapping[Variable, Variable]) -> "Formula":
         raise NotImplementedError()
@@ -763,13 +1249,64 @@ class Formula(ABC):
         raise NotImplementedError()
 
     @abstractmethod
-    def __hash__(self):
+    def compute_hash(self) -> int:
+        """
+        :return: The hash value of this formula. Called at most once per formula,
+            see :meth:`~isla.language.Formula.__hash__`. Formulas that are equal
+            according to :meth:`~isla.language.Formula.equals` must have the same
+            hash value.
+        """
         raise NotImplementedError()
 
     @abstractmethod
-    def __eq__(self, other: "Formula"):
+    def equals(self, other: "Formula") -> bool:
+        """
+        Structural equality. Called by :meth:`~isla.language.Formula.__eq__` for
+        distinct formulas with equal hash values only.
+
+        :param other: The formula to compare this formula to.
+        :return: True iff this formula is equal to :code:`other`.
+        """
         raise NotImplementedError()
 
+    @memoized_formula_method
+    def __hash__(self):
+        return self.compute_hash()
+
+    def __eq__(self, other):
+        return self is other or (
+            isinstance(other, Formula)
+            and hash(self) == hash(other)
+            and self.equals(other)
+        )
+
+    def interning_key(self) -> Tuple:
+        """
+        The interning key of a formula comprises all its attributes, including those
+        ignored by :meth:`~isla.language.Formula.__eq__` (like the IDs of the trees
+        already matched by a universal formula). Formulas with the same interning key
+        are indistinguishable and thus shared (see :class:`~isla.language.FormulaMeta`).
+
+        :return: The interning key of this formula.
+        """
+
+        # The attributes of formulas of the same type are always initialized in the
+        # same order, so we can omit the attribute names.
+        return (type(self),) + tuple(
+            interning_value(value)
+            for attribute, value in self.__dict__.items()
+            if not attribute.startswith(FORMULA_CACHE_PREFIX)
+        )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Cached hash values must not survive pickling, since hashes of strings
+        # differ between Python processes.
+        return {
+            attribute: value
+            for attribute, value in self.__dict__.items()
+            if not attribute.startswith(FORMULA_CACHE_PREFIX)
+        }
+
     def __and__(self, other: "Formula"):
         if self == other:
             return self
@@ -798,16 +1335,16 @@ class Formula(ABC):
         if self == other:
             return self
 
-        if isinstance(self, SMTFormula) and z3.is_true(self.formula):
+        if isinstance(self, SMTFormula) and self.is_true:
             return self
 
-        if isinstance(other, SMTFormula) and z3.is_true(other.formula):
+        if isinstance(other, SMTFormula) and other.is_true:
             return other
 
-        if isinstance(self, SMTFormula) and z3.is_false(self.formula):
+        if isinstance(self, SMTFormula) and self.is_false:
             return other
 
-        if isinstance(other, SMTFormula) and z3.is_false(other.formula):
+        if isinstance(other, SMTFormula) and other.is_false:
             return self
 
         if isinstance(self, NegatedFormula) and self.args[0] == other:
@@ -936,6 +1473,7 @@ class StructuralPredicateFormula(Formula):
             *[arg if arg not in subst_map else subst_map[arg] for arg in self.args],
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> "StructuralPredicateFormula":
@@ -958,16 +1496,18 @@ class StructuralPredicateFormula(Formula):
                 new_args.append(subst_map[tree])
                 continue
 
-            new_args.append(tree.substitute({k: v for k, v in subst_map.items()}))
+            new_args.append(substitute_tree(tree, subst_map))
 
         return StructuralPredicateFormula(self.predicate, *new_args)
 
     def bound_variables(self) -> FrozenOrderedSet[BoundVariable]:
         return FrozenOrderedSet([])
 
+    @memoized_formula_method
     def free_variables(self) -> FrozenOrderedSet[Variable]:
         return FrozenOrderedSet([arg for arg in self.args if isinstance(arg, Variable)])
 
+    @memoized_formula_method
     def tree_arguments(self) -> FrozenOrderedSet[DerivationTree]:
         return FrozenOrderedSet(
             [arg for arg in self.args if isinstance(arg, DerivationTree)]
@@ -982,10 +1522,10 @@ class StructuralPredicateFormula(Formula):
     def __len__(self):
         return 1
 
-    def __hash__(self):
+    def compute_hash(self) -> int:
         return hash((type(self).__name__, self.predicate, tuple(self.args)))
 
-    def __eq__(self, other):
+    def equals(self, other: Formula) -> bool:
         return type(self) is type(other) and (self.predicate, self.args) == (
             other.predicate,
             other.args,
@@ -1141,6 +1681,7 @@ class SemanticPredicateFormula(Formula):
             *[arg if arg not in subst_map else subst_map[arg] for arg in self.args],
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> "SemanticPredicateFormula":
@@ -1168,16 +1709,18 @@ class SemanticPredicateFormula(Formula):
                 new_args.append(tree_id_subst_map[tree.id])
                 continue
 
-            new_args.append(tree.substitute({k: v for k, v in subst_map.items()}))
+            new_args.append(substitute_tree(tree, subst_map))
 
         return SemanticPredicateFormula(self.predicate, *new_args)
 
     def bound_variables(self) -> FrozenOrderedSet[BoundVariable]:
         return FrozenOrderedSet([])
 
+    @memoized_formula_method
     def free_variables(self) -> FrozenOrderedSet[Variable]:
         return FrozenOrderedSet([arg for arg in self.args if isinstance(arg, Variable)])
 
+    @memoized_formula_method
     def tree_arguments(self) -> FrozenOrderedSet[DerivationTree]:
         return FrozenOrderedSet(
             [arg for arg in self.args if isinstance(arg, DerivationTree)]
@@ -1192,10 +1735,10 @@ class SemanticPredicateFormula(Formula):
     def __len__(self):
         return 1
 
-    def __hash__(self):
+    def compute_hash(self) -> int:
         return hash((type(self).__name__, self.predicate, self.args))
 
-    def __eq__(self, other):
+    def equals(self, other: Formula) -> bool:
         return (
             isinstance(other, SemanticPredicateFormula)
             and self.predicate == other.predicate
@@ -1227,12 +1770,14 @@ class PropositionalCombinator(Formula, ABC):
     def bound_variables(self) -> FrozenOrderedSet[BoundVariable]:
         return reduce(operator.or_, [arg.bound_variables() for arg in self.args])
 
+    @memoized_formula_method
     def free_variables(self) -> FrozenOrderedSet[Variable]:
         result: FrozenOrderedSet[Variable] = FrozenOrderedSet([])
         for arg in self.args:
             result = result | arg.free_variables()
         return result
 
+    @memoized_formula_method
     def tree_arguments(self) -> FrozenOrderedSet[DerivationTree]:
         result: FrozenOrderedSet[DerivationTree] = FrozenOrderedSet([])
         for arg in self.args:
@@ -1245,10 +1790,10 @@ class PropositionalCombinator(Formula, ABC):
     def __repr__(self):
         return f"{type(self).__name__}({', '.join(map(repr, self.args))})"
 
-    def __hash__(self):
+    def compute_hash(self) -> int:
         return hash((type(self).__name__, self.args))
 
-    def __eq__(self, other):
+    def equals(self, other: Formula) -> bool:
         return type(self) is type(other) and self.args == other.args
 
 
@@ -1277,6 +1822,7 @@ class NegatedFormula(PropositionalCombinator):
             *[arg.substitute_variables(subst_map) for arg in self.args]
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> "NegatedFormula":
@@ -1284,9 +1830,6 @@ class NegatedFormula(PropositionalCombinator):
             *[arg.substitute_expressions(subst_map) for arg in self.args]
         )
 
-    def __hash__(self):
-        return hash((type(self).__name__, self.args))
-
     def __str__(self):
         return f"¬({self.args[0]})"
 
@@ -1305,6 +1848,7 @@ class ConjunctiveFormula(PropositionalCombinator):
             [arg.substitute_variables(subst_map) for arg in self.args],
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> Formula:
@@ -1324,10 +1868,21 @@ class ConjunctiveFormula(PropositionalCombinator):
             ConjunctiveFormula(*[arg.transform(transformer) for arg in self.args])
         )
 
-    def __hash__(self):
-        return hash((type(self).__name__, self.args))
+    def compute_hash(self) -> int:
+        # Consistent with `equals`, which compares the flattened conjunctions.
+        return hash((type(self).__name__, self.flattened_args_hash()))
 
-    def __eq__(self, other):
+    @memoized_formula_method
+    def flattened_args_hash(self) -> Tuple[int, int]:
+        """
+        :return: A hash of the conjuncts in :code:`split_conjunction(self)`, which is
+            computed from the cached hashes of nested conjunctions, and the number of
+            these conjuncts.
+        """
+
+        return flattened_args_hash(self)
+
+    def equals(self, other: Formula) -> bool:
         return split_conjunction(self) == split_conjunction(other)
 
     def __str__(self):
@@ -1348,6 +1903,7 @@ class DisjunctiveFormula(PropositionalCombinator):
             [arg.substitute_variables(subst_map) for arg in self.args],
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> Formula:
@@ -1367,16 +1923,67 @@ class DisjunctiveFormula(PropositionalCombinator):
             DisjunctiveFormula(*[arg.transform(transformer) for arg in self.args])
         )
 
-    def __hash__(self):
-        return hash((type(self).__name__, self.args))
+    def compute_hash(self) -> int:
+        # Consistent with `equals`, which compares the flattened disjunctions.
+        return hash((type(self).__name__, self.flattened_args_hash()))
 
-    def __eq__(self, other):
+    @memoized_formula_method
+    def flattened_args_hash(self) -> Tuple[int, int]:
+        """
+        :return: A hash of the disjuncts in :code:`split_disjunction(self)`, which is
+            computed from the cached hashes of nested disjunctions, and the number of
+            these disjuncts.
+        """
+
+        return flattened_args_hash(self)
+
+    def equals(self, other: Formula) -> bool:
         return split_disjunction(self) == split_disjunction(other)
 
     def __str__(self):
         return f"({' ∨ '.join(map(str, self.args))})"
 
 
+def flattened_args_hash(
+    formula: ConjunctiveFormula | DisjunctiveFormula,
+) -> Tuple[int, int]:
+    """
+    Computes a polynomial hash of the arguments of the given conjunction or
+    disjunction, where nested conjunctions (disjunctions) are flattened. For a
+    flattened sequence :math:`h_1, \\dots, h_n` of argument hashes, this is
+    :math:`\\sum_i h_i \\cdot B^{n-i} \\bmod P`. The hash of a concatenation can thus
+    be obtained from the hashes of its parts, such that deeply nested conjunctions
+    do not have to be flattened.
+
+    >>> a = SMTFormula("(= x \\"a\\")", Constant("x", "<x>"))
+    >>> b = SMTFormula("(= x \\"b\\")", Constant("x", "<x>"))
+    >>> c = SMTFormula("(= x \\"c\\")", Constant("x", "<x>"))
+    >>> flattened_args_hash((a & b) & c) == flattened_args_hash(a & (b & c))
+    True
+    >>> flattened_args_hash((a & b) & c) == flattened_args_hash(a & (c & b))
+    False
+
+    :param formula: A conjunction or disjunction.
+    :return: The hash of the flattened arguments and their number.
+    """
+
+    modulus = (1 << 61) - 1
+    base = 1_000_003
+
+    result = 0
+    num_args = 0
+    for arg in formula.args:
+        if type(arg) is type(formula):
+            arg_hash, arg_num_args = arg.flattened_args_hash()
+        else:
+            arg_hash, arg_num_args = hash(arg) % modulus, 1
+
+        result = (result * pow(base, arg_num_args, modulus) + arg_hash) % modulus
+        num_args += arg_num_args
+
+    return result, num_args
+
+
 @cache
 def smt_atom(val: bool) -> "SMTFormula":
     return SMTFormula(z3.BoolVal(val))
@@ -1422,9 +2029,6 @@ class SMTFormula(Formula):
                 decls={var.name: var.to_smt() for var in declared_symbols},
             )[0]
 
-        self.is_false = z3.is_false(self.formula)
-        self.is_true = z3.is_true(self.formula)
-
         self.free_variables_ = FrozenOrderedSet(free_variables)
         self.instantiated_variables = instantiated_variables or FrozenOrderedSet([])
         self.substitutions: Dict[Variable, DerivationTree] = substitutions or {}
@@ -1447,9 +2051,21 @@ class SMTFormula(Formula):
 
         self.auto_subst = auto_subst
 
+    @property
+    @memoized_formula_method
+    def is_false(self) -> bool:
+        return z3.is_false(self.formula)
+
+    @property
+    @memoized_formula_method
+    def is_true(self) -> bool:
+        return z3.is_true(self.formula)
+
     def __getstate__(self) -> Dict[str, bytes]:
         result: Dict[str, bytes] = {
-            f: pickle.dumps(v) for f, v in self.__dict__.items() if f != "formula"
+            f: pickle.dumps(v)
+            for f, v in super().__getstate__().items()
+            if f != "formula"
         }
         # result["formula"] = self.formula.sexpr().encode("utf-8")
         result["formula"] = smt_expr_to_str(self.formula).encode("utf-8")
@@ -1499,6 +2115,7 @@ class SMTFormula(Formula):
             auto_subst=self.auto_subst,
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self,
         subst_map: Dict[Union[Variable, DerivationTree], DerivationTree],
@@ -1553,6 +2170,29 @@ class SMTFormula(Formula):
             ]
         )
 
+        new_free_variables: FrozenOrderedSet[Variable] = FrozenOrderedSet(
+            [
+                variable
+                for variable in self.free_variables_
+                if variable not in var_subst_map
+            ]
+        )
+
+        is_ground = len(new_free_variables) + len(new_instantiated_variables) == 0
+
+        if self.auto_eval and is_ground:
+            # Formula is ground, we can evaluate it! If possible, we do so natively,
+            # without constructing the instantiated Z3 formula.
+            match evaluate_z3_formula(
+                self.formula,
+                tuple(
+                    (variable.name, str(tree))
+                    for variable, tree in complete_substitutions.items()
+                ),
+            ):
+                case Some(result):
+                    return smt_atom(result.to_bool())
+
         new_smt_formula: z3.BoolRef = cast(
             z3.BoolRef,
             z3_subst(
@@ -1564,19 +2204,7 @@ class SMTFormula(Formula):
             ),
         )
 
-        new_free_variables: FrozenOrderedSet[Variable] = FrozenOrderedSet(
-            [
-                variable
-                for variable in self.free_variables_
-                if variable not in var_subst_map
-            ]
-        )
-
-        if (
-            self.auto_eval
-            and len(new_free_variables) + len(new_instantiated_variables) == 0
-        ):
-            # Formula is ground, we can evaluate it!
+        if self.auto_eval and is_ground:
             return smt_atom(is_valid(new_smt_formula).to_bool())
 
         return SMTFormula(
@@ -1588,6 +2216,7 @@ class SMTFormula(Formula):
             auto_subst=self.auto_subst,
         )
 
+    @memoized_formula_method
     def tree_arguments(self) -> FrozenOrderedSet[DerivationTree]:
         return FrozenOrderedSet(self.substitutions.values())
 
@@ -1601,15 +2230,34 @@ class SMTFormula(Formula):
         visitor.visit_smt_formula(self)
 
     def transform(self, transformer: FormulaTransformer) -> Formula:
-        return transformer.transform_smt_formula(
-            SMTFormula(
-                self.formula,
-                *self.free_variables_,
-                instantiated_variables=self.instantiated_variables,
-                substitutions=self.substitutions,
-                auto_eval=self.auto_eval,
-                auto_subst=self.auto_subst,
-            )
+        return transformer.transform_smt_formula(self)
+
+    def with_flags(
+        self, auto_eval: Optional[bool] = None, auto_subst: Optional[bool] = None
+    ) -> "SMTFormula":
+        """
+        Returns a copy of this formula with the given values of the :code:`auto_eval`
+        and :code:`auto_subst` flags. The copy shares the Z3 term of this formula.
+
+        >>> x = Constant("x", "<x>")
+        >>> f = SMTFormula('(= x "a")', x)
+        >>> f.with_flags(auto_eval=False).auto_eval
+        False
+        >>> f.with_flags() is f
+        True
+
+        :param auto_eval: The new value of the :code:`auto_eval` flag, if any.
+        :param auto_subst: The new value of the :code:`auto_subst` flag, if any.
+        :return: The updated formula.
+        """
+
+        return SMTFormula(
+            self.formula,
+            *self.free_variables_,
+            instantiated_variables=self.instantiated_variables,
+            substitutions=self.substitutions,
+            auto_eval=self.auto_eval if auto_eval is None else auto_eval,
+            auto_subst=self.auto_subst if auto_subst is None else auto_subst,
         )
 
     # NOTE: Combining SMT formulas with and/or is not that easy due to tree
@@ -1703,16 +2351,18 @@ class SMTFormula(Formula):
             )
             return f"({self.formula}, {subst_string})"
 
-    def __eq__(self, other):
+    def equals(self, other: Formula) -> bool:
         return (
             isinstance(other, SMTFormula)
             and self.formula == other.formula
             and self.substitutions == other.substitutions
         )
 
-    def __hash__(self):
+    def compute_hash(self) -> int:
+        # The substitutions are hashed as a set, since `equals` compares them as
+        # dictionaries, i.e., independently of their order.
         return hash(
-            (type(self).__name__, self.formula, tuple(self.substitutions.items()))
+            (type(self).__name__, self.formula, frozenset(self.substitutions.items()))
         )
 
 
@@ -1720,7 +2370,25 @@ def subst_map_relevant(
     formula: Formula,
     subst_map: Dict[Union[Variable, DerivationTree], DerivationTree],
 ) -> bool:
-    return formula.free_variables().intersection(subst_map.keys()) or any(
+    """
+    A substitution is relevant for a formula if it substitutes one of the formula's
+    (free or bound) variables or a (sub)tree of one of its tree arguments. Both are
+    cached in the formula, and trees are looked up in the (cached) ID index of the
+    tree arguments.
+
+    :param formula: The formula.
+    :param subst_map: The substitution.
+    :return: True iff the substitution might change the formula.
+    """
+
+    substituted_variables = [
+        variable for variable in subst_map if isinstance(variable, Variable)
+    ]
+
+    return (
+        substituted_variables
+        and not formula.variables().isdisjoint(substituted_variables)
+    ) or any(
         tree_arg.find_node(subst_tree) is not None
         for tree_arg in formula.tree_arguments()
         for subst_tree in subst_map
@@ -1737,6 +2405,7 @@ class NumericQuantifiedFormula(Formula, ABC):
         """Non-recursive: Only non-empty for quantified formulas"""
         return FrozenOrderedSet([self.bound_variable])
 
+    @memoized_formula_method
     def free_variables(self) -> FrozenOrderedSet[Variable]:
         """Recursive."""
         return self.inner_formula.free_variables().difference(self.bound_variables())
@@ -1744,6 +2413,7 @@ class NumericQuantifiedFormula(Formula, ABC):
     def tree_arguments(self) -> FrozenOrderedSet[DerivationTree]:
         return self.inner_formula.tree_arguments()
 
+    @memoized_formula_method
     def __len__(self):
         return 1 + len(self.inner_formula)
 
@@ -1758,6 +2428,7 @@ class ExistsIntFormula(NumericQuantifiedFormula):
             self.inner_formula.substitute_variables(subst_map),
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> "Formula":
@@ -1778,10 +2449,10 @@ class ExistsIntFormula(NumericQuantifiedFormula):
             )
         )
 
-    def __hash__(self):
+    def compute_hash(self) -> int:
         return hash((type(self).__name__, self.bound_variable, self.inner_formula))
 
-    def __eq__(self, other):
+    def equals(self, other: Formula) -> bool:
         return (
             isinstance(other, ExistsIntFormula)
             and self.bound_variable == other.bound_variable
@@ -1807,6 +2478,7 @@ class ForallIntFormula(NumericQuantifiedFormula):
             self.inner_formula.substitute_variables(subst_map),
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> "Formula":
@@ -1827,10 +2499,10 @@ class ForallIntFormula(NumericQuantifiedFormula):
             )
         )
 
-    def __hash__(self):
+    def compute_hash(self) -> int:
         return hash((type(self).__name__, self.bound_variable, self.inner_formula))
 
-    def __eq__(self, other):
+    def equals(self, other: Formula) -> bool:
         return (
             isinstance(other, ForallIntFormula)
             and self.bound_variable == other.bound_variable
@@ -1878,6 +2550,7 @@ class QuantifiedFormula(Formula, ABC):
             else self.bind_expression.bound_variables()
         )
 
+    @memoized_formula_method
     def free_variables(self) -> FrozenOrderedSet[Variable]:
         return (
             FrozenOrderedSet(
@@ -1886,16 +2559,21 @@ class QuantifiedFormula(Formula, ABC):
             | self.inner_formula.free_variables()
         ) - self.bound_variables()
 
+    @memoized_formula_method
     def tree_arguments(self) -> FrozenOrderedSet[DerivationTree]:
-        result = FrozenOrderedSet([])
-        if isinstance(self.in_variable, DerivationTree):
-            result.add(self.in_variable)
-        result.update(self.inner_formula.tree_arguments())
-        return result
+        return (
+            FrozenOrderedSet(
+                [self.in_variable]
+                if isinstance(self.in_variable, DerivationTree)
+                else []
+            )
+            | self.inner_formula.tree_arguments()
+        )
 
     def is_already_matched(self, tree: DerivationTree) -> bool:
         return False
 
+    @memoized_formula_method
     def __len__(self):
         result = 1 + len(self.inner_formula)
         if self.bind_expression:
@@ -1908,7 +2586,7 @@ class QuantifiedFormula(Formula, ABC):
             f'{repr(self.inner_formula)}{"" if self.bind_expression is None else ", " + repr(self.bind_expression)})'
         )
 
-    def __hash__(self):
+    def compute_hash(self) -> int:
         return hash(
             (
                 type(self).__name__,
@@ -1919,7 +2597,7 @@ class QuantifiedFormula(Formula, ABC):
             )
         )
 
-    def __eq__(self, other):
+    def equals(self, other: Formula) -> bool:
         return type(self) is type(other) and (
             self.bound_variable,
             self.in_variable,
@@ -1978,6 +2656,7 @@ class ForallFormula(QuantifiedFormula):
             id=self.id,
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> Formula:
@@ -1985,7 +2664,7 @@ class ForallFormula(QuantifiedFormula):
         if self.in_variable in subst_map:
             new_in_variable = subst_map[new_in_variable]
         elif isinstance(new_in_variable, DerivationTree):
-            new_in_variable = new_in_variable.substitute(subst_map)
+            new_in_variable = substitute_tree(new_in_variable, subst_map)
 
         new_inner_formula = self.inner_formula.substitute_expressions(subst_map)
 
@@ -2080,6 +2759,7 @@ class ExistsFormula(QuantifiedFormula):
             else self.bind_expression.substitute_variables(subst_map),
         )
 
+    @prune_irrelevant_substitutions
     def substitute_expressions(
         self, subst_map: Dict[Union[Variable, DerivationTree], DerivationTree]
     ) -> Formula:
@@ -2087,7 +2767,7 @@ class ExistsFormula(QuantifiedFormula):
         if self.in_variable in subst_map:
             new_in_variable = subst_map[new_in_variable]
         elif isinstance(new_in_variable, DerivationTree):
-            new_in_variable = new_in_variable.substitute(subst_map)
+            new_in_variable = substitute_tree(new_in_variable, subst_map)
 
         return ExistsFormula(
             self.bound_variable,
@@ -2333,30 +3013,45 @@ def replace_formula(  # noqa: C901
 
 
 def convert_to_nnf(formula: Formula, negate=False) -> Formula:
-    """Pushes negations inside the formula."""
+    """
+    Pushes negations inside the formula. The results are cached in the (shared)
+    formulas. Furthermore, the results are marked as being in negation normal form,
+    such that normalizing them again does not cost anything.
+
+    >>> x = Constant("x", "<x>")
+    >>> formula = -(SMTFormula('(= x "a")', x) & SMTFormula('(= x "b")', x))
+    >>> print(convert_to_nnf(formula))
+    (Not(x == "a") ∨ Not(x == "b"))
+    >>> convert_to_nnf(convert_to_nnf(formula)) is convert_to_nnf(formula)
+    True
+
+    :param formula: The formula to convert.
+    :param negate: True iff the negation of the formula should be converted.
+    :return: The formula (or its negation) in negation normal form.
+    """
 
-    def raise_not_implemented_error(_=Nothing) -> Maybe[Formula]:
+    cache = formula_cache(formula, "nnf")
+    if negate in cache:
+        return cache[negate]
+
+    for convert in (
+        convert_negated_formula_to_nnf,
+        convert_conjunctive_formula_to_nnf,
+        convert_disjunctive_formula_to_nnf,
+        convert_structural_predicate_formula_to_nnf,
+        convert_smt_formula_to_nnf,
+        convert_exists_int_formula_to_nnf,
+        convert_quantified_formula_to_nnf,
+    ):
+        match convert(formula, negate):
+            case Some(result):
+                break
+    else:
         raise NotImplementedError(f"Unexpected formula type {type(formula).__name__}")
 
-    return (
-        flow(
-            Nothing,
-            *map(
-                compose(lambda f: lambda _: f(formula, negate), lash),
-                [
-                    convert_negated_formula_to_nnf,
-                    convert_conjunctive_formula_to_nnf,
-                    convert_disjunctive_formula_to_nnf,
-                    convert_structural_predicate_formula_to_nnf,
-                    convert_smt_formula_to_nnf,
-                    convert_exists_int_formula_to_nnf,
-                    convert_quantified_formula_to_nnf,
-                ],
-            ),
-        )
-        .lash(raise_not_implemented_error)
-        .unwrap()
-    )
+    cache[negate] = result
+    formula_cache(result, "nnf").setdefault(False, result)
+    return result
 
 
 def convert_negated_formula_to_nnf(formula: Formula, negate: bool) -> Maybe[Formula]:
@@ -2494,42 +3189,133 @@ def convert_quantified_formula_to_nnf(formula: Formula, negate: bool) -> Maybe[F
         )
 
 
-def convert_to_dnf(formula: Formula, deep: bool = True) -> Formula:
+def convert_to_dnf(
+    formula: Formula, deep: bool = True, max_disjuncts: Optional[int] = None
+) -> Formula:
+    """
+    Converts a formula in negation normal form to disjunctive normal form. The
+    results are cached in the (shared) formulas.
+
+    >>> x = Constant("x", "<x>")
+    >>> a, b, c, d = [SMTFormula(f'(= x "{s}")', x) for s in "abcd"]
+    >>> for disjunct in split_disjunction(convert_to_dnf((a | b) & (c | d))):
+    ...     print(disjunct)
+    (x == "a" ∧ x == "c")
+    (x == "a" ∧ x == "d")
+    (x == "b" ∧ x == "c")
+    (x == "b" ∧ x == "d")
+
+    The number of disjuncts in the result grows exponentially with the number of
+    disjunctive conjuncts. With :code:`max_disjuncts`, only so many disjunctive
+    conjuncts are multiplied out that the result has at most :code:`max_disjuncts`
+    disjuncts (or, if the first disjunctive conjunct exceeds that number, that
+    conjunct alone). The remaining disjunctive conjuncts are kept, and can be split
+    by converting the resulting disjuncts again.
+
+    >>> for disjunct in split_disjunction(
+    ...     convert_to_dnf((a | b) & (c | d), max_disjuncts=3)
+    ... ):
+    ...     print(disjunct)
+    (x == "a" ∧ (x == "c" ∨ x == "d"))
+    (x == "b" ∧ (x == "c" ∨ x == "d"))
+
+    :param formula: The formula to convert.
+    :param deep: If True, the formulas inside quantifiers are converted, too.
+    :param max_disjuncts: The maximum number of disjuncts created by multiplying out
+        a conjunction, or None if the number of disjuncts should be unbounded.
+    :return: The formula in (possibly only partial) disjunctive normal form.
+    """
+
     assert not isinstance(formula, NegatedFormula) or not isinstance(
         formula.args[0], PropositionalCombinator
     ), "Convert to NNF before converting to DNF"
 
+    cache = formula_cache(formula, "dnf")
+    key = (deep, max_disjuncts)
+    if key in cache:
+        return cache[key]
+
+    result = compute_dnf(formula, deep, max_disjuncts)
+    cache[key] = result
+
+    # Shallow DNFs without remaining disjunctive conjuncts and their disjuncts do
+    # not change when they are converted again.
+    if not deep:
+        disjuncts = split_disjunction(result)
+        if not any(
+            isinstance(conjunct, DisjunctiveFormula)
+            for disjunct in disjuncts
+            for conjunct in split_conjunction(disjunct)
+        ):
+            for normalized_formula in [result] + disjuncts:
+                formula_cache(normalized_formula, "dnf").setdefault(
+                    key, normalized_formula
+                )
+
+    return result
+
+
+def compute_dnf(
+    formula: Formula, deep: bool, max_disjuncts: Optional[int] = None
+) -> Formula:
     if isinstance(formula, ConjunctiveFormula):
+        conjuncts = split_conjunction(formula)
         disjuncts_list = [
-            split_disjunction(convert_to_dnf(arg)) for arg in formula.args
+            split_disjunction(convert_to_dnf(conjunct, max_disjuncts=max_disjuncts))
+            for conjunct in conjuncts
         ]
 
         if all(len(elem) == 1 for elem in disjuncts_list):
             return formula
 
+        num_disjuncts = 1
+        for idx, disjuncts in enumerate(disjuncts_list):
+            if len(disjuncts) == 1:
+                continue
+
+            if (
+                max_disjuncts is not None
+                and num_disjuncts > 1
+                and num_disjuncts * len(disjuncts) > max_disjuncts
+            ):
+                # This conjunct is split later.
+                disjuncts_list[idx] = [conjuncts[idx]]
+                continue
+
+            num_disjuncts *= len(disjuncts)
+
         return reduce(
             lambda a, b: a | b,
             [
                 reduce(
                     lambda a, b: a & b,
-                    FrozenOrderedSet(split_conjunction(left & right)),
+                    FrozenOrderedSet(
+                        [
+                            conjunct
+                            for disjunct in combination
+                            for conjunct in split_conjunction(disjunct)
+                        ]
+                    ),
                     true(),
                 )
-                for left, right in itertools.product(*disjuncts_list)
+                for combination in itertools.product(*disjuncts_list)
             ],
             false(),
         )
     elif isinstance(formula, DisjunctiveFormula):
         return reduce(
             lambda a, b: a | b,
-            [convert_to_dnf(subformula) for subformula in formula.args],
+            [
+                convert_to_dnf(subformula, max_disjuncts=max_disjuncts)
+                for subformula in formula.args
+            ],
             false(),
         )
     elif deep and isinstance(formula, ForallFormula):
         return ForallFormula(
             formula.bound_variable,
             formula.in_variable,
-            convert_to_dnf(formula.inner_formula),
+            convert_to_dnf(formula.inner_formula, max_disjuncts=max_disjuncts),
             formula.bind_expression,
             formula.already_matched,
         )
@@ -2537,7 +3323,7 @@ def convert_to_dnf(formula: Formula, deep: bool = True) -> Formula:
         return ExistsFormula(
             formula.bound_variable,
             formula.in_variable,
-            convert_to_dnf(formula.inner_formula),
+            convert_to_dnf(formula.inner_formula, max_disjuncts=max_disjuncts),
             formula.bind_expression,
         )
     else:
@@ -3962,18 +4748,297 @@ class ISLaEmitter(IslaLanguageListener.IslaLanguageListener):
             return "unknown constant" not in str(exc)
 
 
+# The maximum number of parsed formulas kept by `parse_isla`.
+MAX_PARSED_FORMULAS = 1024
+
+# The version of the format of serialized formulas (see `serialize_isla`). Increase it
+# when the pickled representation of formulas changes in an incompatible way.
+SERIALIZATION_FORMAT_VERSION = 1
+
+# Serialized formulas start with this header. Formulas serialized by other versions of
+# ISLa or in other formats are not loaded.
+SERIALIZATION_HEADER = (
+    f"ISLa formula {SERIALIZATION_FORMAT_VERSION} {isla_version}\n".encode("utf-8")
+)
+
+# Parsed formulas, indexed by the text, a hash of the grammar, and the predicates.
+# Predicates are compared by name only, but predicates with the same name may have
+# different evaluation functions; we thus pair them with their IDs.
+_parsed_formulas: Dict[
+    Tuple[
+        str,
+        Optional[str],
+        FrozenSet[Tuple[StructuralPredicate, int]],
+        FrozenSet[Tuple[SemanticPredicate, int]],
+    ],
+    Formula,
+] = {}
+
+
 def parse_isla(
     inp: str,
     grammar: Optional[Grammar | str] = None,
     structural_predicates: Optional[Set[StructuralPredicate]] = None,
     semantic_predicates: Optional[Set[SemanticPredicate]] = None,
+    cache_dir: Optional[str] = None,
 ) -> Formula:
-    lexer = IslaLanguageLexer(InputStream(inp))
-    parser = IslaLanguageParser(antlr4.CommonTokenStream(lexer))
-    parser._errHandler = BailPrintErrorStrategy()
-    isla_emitter = ISLaEmitter(grammar, structural_predicates, semantic_predicates)
-    antlr4.ParseTreeWalker().walk(isla_emitter, parser.start())
-    return isla_emitter.result
+    """
+    Parses an ISLa constraint. Parsed constraints are cached, indexed by the text,
+    the grammar, and the predicates. Repeatedly parsing the same constraint thus
+    only runs the (slow) ANTLR parser once. Like freshly parsed formulas, the
+    returned formulas are equal, but their universal quantifiers have distinct IDs.
+
+    >>> grammar = {"<start>": ["<digit>"], "<digit>": list("0123456789")}
+    >>> formula = parse_isla('forall <digit> d in start: d = "7"', grammar)
+    >>> print(unparse_isla(formula))
+    forall <digit> d in start:
+      (= d "7")
+
+    >>> other_formula = parse_isla('forall <digit> d in start: d = "7"', grammar)
+    >>> formula == other_formula and formula.id != other_formula.id
+    True
+
+    :param inp: The constraint to parse.
+    :param grammar: The grammar of the constrained language, if any.
+    :param structural_predicates: The structural predicates used in the constraint.
+    :param semantic_predicates: The semantic predicates used in the constraint.
+    :param cache_dir: A directory for persisting parsed constraints in serialized
+        form (see :func:`~isla.language.serialize_isla`). Constraints parsed before,
+        e.g., by another process, are loaded from there without running the parser.
+        Files written by other versions of ISLa are ignored. Loading a file executes
+        code (it is unpickled), so the directory must only be writable by trusted
+        users.
+    :return: The parsed constraint.
+    """
+
+    structural_predicates = frozenset(structural_predicates or ())
+    semantic_predicates = frozenset(semantic_predicates or ())
+    key = (
+        inp,
+        None
+        if grammar is None
+        else (grammar if isinstance(grammar, str) else grammar_hash(grammar)),
+        frozenset((predicate, id(predicate)) for predicate in structural_predicates),
+        frozenset((predicate, id(predicate)) for predicate in semantic_predicates),
+    )
+
+    if key in _parsed_formulas:
+        return with_fresh_quantifier_ids(_parsed_formulas[key])
+
+    cache_file: Optional[str] = (
+        None
+        if cache_dir is None
+        else os.path.join(
+            cache_dir,
+            hashlib.sha256(
+                "\0".join(
+                    [SERIALIZATION_HEADER.decode("utf-8"), inp, key[1] or ""]
+                    + sorted(str(predicate) for predicate in structural_predicates)
+                    + sorted(str(predicate) for predicate in semantic_predicates)
+                ).encode("utf-8")
+            ).hexdigest()
+            + ".isla.pickle",
+        )
+    )
+
+    def load_cache_file() -> Formula:
+        with open(cache_file, "rb") as file:
+            return deserialize_isla(
+                file.read(), structural_predicates, semantic_predicates
+            )
+
+    # Outdated or damaged cache files are ignored (and overwritten).
+    loaded_formula: Maybe[Formula] = (
+        Nothing
+        if cache_file is None
+        else result_to_maybe(
+            safe(
+                exceptions=(
+                    OSError,
+                    EOFError,
+                    AttributeError,
+                    ImportError,
+                    pickle.UnpicklingError,
+                )
+            )(load_cache_file)()
+        )
+    )
+
+    match loaded_formula:
+        case Some(formula):
+            result = formula
+        case _:
+            lexer = IslaLanguageLexer(InputStream(inp))
+            parser = IslaLanguageParser(antlr4.CommonTokenStream(lexer))
+            parser._errHandler = BailPrintErrorStrategy()
+            isla_emitter = ISLaEmitter(
+                grammar, structural_predicates, semantic_predicates
+            )
+            antlr4.ParseTreeWalker().walk(isla_emitter, parser.start())
+            result = isla_emitter.result
+
+            if cache_file is not None:
+                store_parsed_formula(result, cache_file)
+
+    if len(_parsed_formulas) >= MAX_PARSED_FORMULAS:
+        del _parsed_formulas[next(iter(_parsed_formulas))]
+    _parsed_formulas[key] = result
+
+    return result
+
+
+def store_parsed_formula(formula: Formula, path: str) -> None:
+    """
+    Stores the serialized formula in the given file. The file is written
+    atomically, such that concurrent processes never read partially written files.
+    Formulas that cannot be serialized are not stored.
+
+    :param formula: The formula to store.
+    :param path: The path of the file.
+    """
+
+    try:
+        data = serialize_isla(formula)
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def with_fresh_quantifier_ids(formula: Formula) -> Formula:
+    """
+    :param formula: A formula.
+    :return: The formula with fresh IDs for all its universal quantifiers.
+    """
+
+    class FreshIdTransformer(NoopFormulaTransformer):
+        def transform_forall_formula(self, sub_formula: ForallFormula) -> Formula:
+            return ForallFormula(
+                sub_formula.bound_variable,
+                sub_formula.in_variable,
+                sub_formula.inner_formula,
+                sub_formula.bind_expression,
+                sub_formula.already_matched,
+            )
+
+    return formula.transform(FreshIdTransformer())
+
+
+class FormulaPickler(pickle.Pickler):
+    """
+    Pickles formulas, referring to predicates by their names. Predicates are
+    resolved when unpickling (see :class:`~isla.language.FormulaUnpickler`), since
+    their evaluation functions are generally not picklable.
+    """
+
+    def persistent_id(self, obj: Any) -> Optional[Tuple[str, str]]:
+        if isinstance(obj, StructuralPredicate):
+            return "structural", obj.name
+        if isinstance(obj, SemanticPredicate):
+            return "semantic", obj.name
+        return None
+
+
+class FormulaUnpickler(pickle.Unpickler):
+    def __init__(
+        self,
+        file: io.BytesIO,
+        structural_predicates: Iterable[StructuralPredicate],
+        semantic_predicates: Iterable[SemanticPredicate],
+    ):
+        super().__init__(file)
+        self.predicates: Dict[
+            Tuple[str, str], StructuralPredicate | SemanticPredicate
+        ] = {
+            ("structural", predicate.name): predicate
+            for predicate in structural_predicates
+        } | {
+            ("semantic", predicate.name): predicate for predicate in semantic_predicates
+        }
+
+    def persistent_load(
+        self, pid: Tuple[str, str]
+    ) -> StructuralPredicate | SemanticPredicate:
+        try:
+            return self.predicates[pid]
+        except KeyError:
+            raise pickle.UnpicklingError(f"Unknown {pid[0]} predicate {pid[1]}")
+
+
+def serialize_isla(formula: Formula) -> bytes:
+    """
+    Serializes a formula into a pre-parsed form that can be loaded using
+    :func:`~isla.language.deserialize_isla` without running the ISLa parser.
+    Predicates are only stored by name. The result starts with a header
+    identifying the ISLa version and the serialization format.
+
+    >>> from isla.isla_predicates import BEFORE_PREDICATE
+    >>> grammar = {"<start>": ["<digit><digit>"], "<digit>": list("0123456789")}
+    >>> formula = parse_isla(
+    ...     'forall <digit> d in start: exists <digit> e in start: before(e, d)',
+    ...     grammar,
+    ...     structural_predicates={BEFORE_PREDICATE},
+    ... )
+    >>> data = serialize_isla(formula)
+    >>> deserialize_isla(data, {BEFORE_PREDICATE}) == formula
+    True
+
+    Formulas with unknown predicates cannot be loaded:
+
+    >>> deserialize_isla(data)
+    Traceback (most recent call last):
+    ...
+    _pickle.UnpicklingError: Unknown structural predicate before
+
+    :param formula: The formula to serialize.
+    :return: The serialized formula.
+    """
+
+    result = io.BytesIO()
+    result.write(SERIALIZATION_HEADER)
+    FormulaPickler(result).dump(formula)
+    return result.getvalue()
+
+
+def deserialize_isla(
+    data: bytes,
+    structural_predicates: Optional[Iterable[StructuralPredicate]] = None,
+    semantic_predicates: Optional[Iterable[SemanticPredicate]] = None,
+) -> Formula:
+    """
+    Loads a formula serialized with :func:`~isla.language.serialize_isla`. The
+    universal quantifiers of the result get fresh IDs. Raises a
+    :code:`pickle.UnpicklingError` if the formula was serialized by another version
+    of ISLa or in another format. Since the formula is unpickled, loading it can
+    execute arbitrary code: Only load data from trusted sources.
+
+    >>> deserialize_isla(b"ISLa formula 0 0.0.0\\n")
+    Traceback (most recent call last):
+    ...
+    _pickle.UnpicklingError: Formula serialized by another ISLa version or format
+
+    :param data: The serialized formula.
+    :param structural_predicates: The structural predicates used in the formula.
+    :param semantic_predicates: The semantic predicates used in the formula.
+    :return: The formula.
+    """
+
+    if not data.startswith(SERIALIZATION_HEADER):
+        raise pickle.UnpicklingError(
+            "Formula serialized by another ISLa version or format"
+        )
+
+    return with_fresh_quantifier_ids(
+        FormulaUnpickler(
+            io.BytesIO(data[len(SERIALIZATION_HEADER) :]),
+            structural_predicates or (),
+            semantic_predicates or (),
+        ).load()
+    )
 
 
 class BnfEmitter(bnfListener.bnfListener):
@@ -4219,9 +5284,6 @@ def get_conjuncts(formula: Formula) -> List[Formula]:
     ]
 
 
-T = TypeVar("T")
-
-
 def fresh_variable(
     used: MutableSet[Variable | str],
     base_name: str,
@@ -4338,13 +5400,7 @@ def is_valid_combination(
     in_nonterminals = [in_nonterminal] if in_nonterminal else grammar.keys()
 
     for nonterminal in in_nonterminals:
-        if nonterminal == "<start>":
-            specialized_grammar = grammar
-        else:
-            specialized_grammar = copy.deepcopy(grammar) | {"<start>": [nonterminal]}
-            specialized_grammar = delete_unreachable(specialized_grammar)
-
-        parser = EarleyParser(specialized_grammar)
+        parser = earley_parser(immutable_grammar, nonterminal)
 
         for _ in range(3):
             inp = "".join(
@@ -4356,7 +5412,7 @@ def is_valid_combination(
                 ]
             )
             try:
-                next(iter(parser.parse(inp)))
+                parser.parse_first(inp)
             except SyntaxError:
                 break
         else:
@@ -4365,20 +5421,40 @@ def is_valid_combination(
     return False
 
 
-def set_smt_auto_eval(formula: Formula, auto_eval: bool = False):
-    class AutoEvalVisitor(FormulaVisitor):
-        def visit_smt_formula(self, formula: SMTFormula):
-            formula.auto_eval = auto_eval
+def set_smt_auto_eval(formula: Formula, auto_eval: bool = False) -> Formula:
+    """
+    Since formulas are shared (see :class:`~isla.language.FormulaMeta`), this
+    function does not change the SMT formulas inside :code:`formula`, but returns an
+    updated copy.
+
+    :param formula: The formula to update.
+    :param auto_eval: The new value of the auto_eval flag of all SMT formulas.
+    :return: :code:`formula` with updated SMT formulas.
+    """
 
-    formula.accept(AutoEvalVisitor())
+    class AutoEvalTransformer(NoopFormulaTransformer):
+        def transform_smt_formula(self, sub_formula: SMTFormula) -> Formula:
+            return sub_formula.with_flags(auto_eval=auto_eval)
 
+    return formula.transform(AutoEvalTransformer())
 
-def set_smt_auto_subst(formula: Formula, auto_subst: bool = False):
-    class AutoSubstVisitor(FormulaVisitor):
-        def visit_smt_formula(self, formula: SMTFormula):
-            formula.auto_subst = auto_subst
 
-    formula.accept(AutoSubstVisitor())
+def set_smt_auto_subst(formula: Formula, auto_subst: bool = False) -> Formula:
+    """
+    Since formulas are shared (see :class:`~isla.language.FormulaMeta`), this
+    function does not change the SMT formulas inside :code:`formula`, but returns an
+    updated copy.
+
+    :param formula: The formula to update.
+    :param auto_subst: The new value of the auto_subst flag of all SMT formulas.
+    :return: :code:`formula` with updated SMT formulas.
+    """
+
+    class AutoSubstTransformer(NoopFormulaTransformer):
+        def transform_smt_formula(self, sub_formula: SMTFormula) -> Formula:
+            return sub_formula.with_flags(auto_subst=auto_subst)
+
+    return formula.transform(AutoSubstTransformer())
 
 
 def match(
@@ -4559,13 +5635,13 @@ def parse_match_expression_earley(
     """
 
     # Should we address ambiguities and return multiple parse trees?
-    earley_parser = EarleyParser(
-        grammar_to_match_expr_grammar(in_nonterminal, immutable_grammar)
+    parser = earley_parser(
+        grammar_to_immutable(
+            grammar_to_match_expr_grammar(in_nonterminal, immutable_grammar)
+        )
     )
 
-    match safe(
-        lambda: DerivationTree.from_parse_tree(next(earley_parser.parse(inp)))
-    )():
+    match safe(lambda: DerivationTree.from_parse_tree(parser.parse_first(inp)))():
         case Success(result):
             return Some(result if in_nonterminal == "<start>" else result.children[0])
         case Failure(_):
@@ -30,13 +30,34 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import codecs
 import itertools
+import mmap
 import random
 from functools import lru_cache
-from typing import Tuple, Iterable, Generator, List, Dict, Collection
-
-from isla.helpers import tree_to_string, RE_NONTERMINAL
-from isla.type_defs import Grammar, ParseTree, CanonicalGrammar
+from typing import (
+    Tuple,
+    Iterable,
+    Generator,
+    List,
+    Dict,
+    Collection,
+    Set,
+    Iterator,
+    Optional,
+    Any,
+    Union,
+    TextIO,
+    BinaryIO,
+)
+
+from isla.helpers import (
+    tree_to_string,
+    RE_NONTERMINAL,
+    delete_unreachable,
+    grammar_to_mutable,
+)
+from isla.type_defs import Grammar, ParseTree, CanonicalGrammar, ImmutableGrammar
 
 START_SYMBOL = "<start>"
 
@@ -415,6 +436,694 @@ class EarleyParser(Parser):
             col.add(state.advance())
 
 
+class IndexedState(State):
+    """
+    An Earley state whose identity (used for deduplication in chart columns) is
+    computed once when the state is created.
+    """
+
+    __slots__ = ("name", "expr", "dot", "s_col", "e_col", "key", "hash")
+
+    def __init__(self, name, expr, dot, s_col, e_col=None):
+        # We do not call the super constructor, which is comparatively expensive.
+        self.name, self.expr, self.dot = name, expr, dot
+        self.s_col, self.e_col = s_col, e_col
+        self.key = (name, expr, dot, s_col.index)
+        self.hash = hash(self.key)
+
+    def copy(self):
+        return IndexedState(self.name, self.expr, self.dot, self.s_col, self.e_col)
+
+    def _t(self):
+        return self.key
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def advance(self):
+        return IndexedState(self.name, self.expr, self.dot + 1, self.s_col)
+
+
+class IndexedColumn(Column):
+    """
+    A chart column that indexes its states by the symbol after the dot (for
+    unfinished states) and by their names (for finished states). It also records
+    the nonterminals that were already predicted in this column.
+    """
+
+    def __init__(self, index, letter):
+        super().__init__(index, letter)
+        self.waiting_for: Dict[str, List[IndexedState]] = {}
+        self.finished_states: Dict[str, List[IndexedState]] = {}
+        self.predicted: Set[str] = set()
+
+    def add(self, state):
+        existing = self._unique.get(state)
+        if existing is not None:
+            return existing
+
+        self._unique[state] = state
+        self.states.append(state)
+        state.e_col = self
+
+        if state.dot < len(state.expr):
+            self.waiting_for.setdefault(state.expr[state.dot], []).append(state)
+        else:
+            self.finished_states.setdefault(state.name, []).append(state)
+
+        return state
+
+
+class IndexedEarleyParser(EarleyParser):
+    """
+    A drop-in replacement for :class:`~isla.parser.EarleyParser` producing the
+    same parse trees in the same order. Instead of scanning whole chart columns,
+    it looks up the states waiting for a completed nonterminal and the finished
+    states for a nonterminal in per-column indices
+    (see :class:`~isla.parser.IndexedColumn`). For each nonterminal, the
+    nonterminals that have to be predicted along with it are computed once. As
+    in the original parser, nullable nonterminals are skipped at prediction time
+    (following Aycock and Horspool), such that no column has to be revisited.
+
+    >>> grammar = {
+    ...     "<start>": ["<csv>"],
+    ...     "<csv>": ["<line>", "<line>\\n<csv>"],
+    ...     "<line>": ["<field>", "<field>;<line>"],
+    ...     "<field>": ["", "<char><field>"],
+    ...     "<char>": ["a", "b"],
+    ... }
+    >>> inp = "ab;;b\\na"
+    >>> tree = next(IndexedEarleyParser(grammar).parse(inp))
+    >>> tree == next(EarleyParser(grammar).parse(inp))
+    True
+    >>> tree_to_string(tree) == inp
+    True
+    """
+
+    def __init__(self, grammar, **kwargs):
+        super().__init__(grammar, **kwargs)
+
+        # For each nonterminal, we split the items to predict into those starting
+        # with a terminal symbol, indexed by that symbol, and the remaining ones.
+        # Items starting with a terminal symbol only need to be added if that
+        # symbol is the next letter of the input; otherwise, they cannot be
+        # completed. The start symbol is an exception since the states for it
+        # determine the longest parsed prefix.
+        self.prediction_closure: Dict[str, Tuple[Tuple[str, Tuple[str, ...]], ...]] = {}
+        self.terminal_prediction_closure: Dict[
+            str, Dict[str, Tuple[Tuple[str, Tuple[str, ...]], ...]]
+        ] = {}
+        for nonterminal in self.cgrammar:
+            items: List[Tuple[str, Tuple[str, ...]]] = []
+            terminal_items: Dict[str, List[Tuple[str, Tuple[str, ...]]]] = {}
+            for name, alt in self.compute_prediction_closure(nonterminal):
+                if alt and alt[0] not in self.cgrammar and name != self._start_symbol:
+                    terminal_items.setdefault(alt[0], []).append((name, alt))
+                else:
+                    items.append((name, alt))
+
+            self.prediction_closure[nonterminal] = tuple(items)
+            self.terminal_prediction_closure[nonterminal] = {
+                letter: tuple(letter_items)
+                for letter, letter_items in terminal_items.items()
+            }
+
+    def compute_prediction_closure(
+        self, nonterminal: str
+    ) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+        """
+        :param nonterminal: A nonterminal.
+        :return: The (name, expansion) pairs of all items that are added to a
+            column when predicting the given nonterminal, i.e., the expansions of
+            the nonterminal itself and of all nonterminals that can appear at the
+            beginning of these expansions (after nullable nonterminals).
+        """
+
+        predicted = [nonterminal]
+        seen = {nonterminal}
+        idx = 0
+        while idx < len(predicted):
+            for alternative in self.cgrammar[predicted[idx]]:
+                for symbol in alternative:
+                    if symbol not in self.cgrammar:
+                        break
+                    if symbol not in seen:
+                        seen.add(symbol)
+                        predicted.append(symbol)
+                    if symbol not in self.epsilon:
+                        break
+            idx += 1
+
+        return tuple(
+            (symbol, tuple(alternative))
+            for symbol in predicted
+            for alternative in self.cgrammar[symbol]
+        )
+
+    def chart_parse(self, words, start):
+        alt = tuple(*self.cgrammar[start])
+        chart = [IndexedColumn(i, tok) for i, tok in enumerate([None, *words])]
+        chart[0].add(IndexedState(start, alt, 0, chart[0]))
+        return self.fill_chart(chart)
+
+    def earley_complete(self, col, state):
+        # If the parent column is the current one, the list of waiting states might
+        # grow during the iteration, which is intended.
+        for st in state.s_col.waiting_for.get(state.name, ()):
+            col.add(st.advance())
+
+    def fill_chart(self, chart):
+        cgrammar = self.cgrammar
+        for i, col in enumerate(chart):
+            next_col = chart[i + 1] if i + 1 < len(chart) else None
+            next_letter = next_col.letter if next_col is not None else None
+            for state in col.states:
+                if state.dot >= len(state.expr):
+                    self.earley_complete(col, state)
+                else:
+                    sym = state.expr[state.dot]
+                    if sym in cgrammar:
+                        self.predict_with_lookahead(col, sym, state, next_letter)
+                    elif next_col is not None and sym == next_letter:
+                        next_col.add(state.advance())
+            if self.log:
+                print(col, "\n")
+        return chart
+
+    def predict_with_lookahead(self, col, sym, state, next_letter):
+        if sym not in col.predicted:
+            col.predicted.add(sym)
+            for name, alt in self.prediction_closure[sym]:
+                col.predicted.add(name)
+                col.add(IndexedState(name, alt, 0, col))
+            for name, alt in self.terminal_prediction_closure[sym].get(next_letter, ()):
+                col.predicted.add(name)
+                col.add(IndexedState(name, alt, 0, col))
+        if sym in self.epsilon:
+            col.add(state.advance())
+
+    def parse_paths(self, named_expr, chart, frm, til):
+        def paths(state, start, k, e):
+            if not e:
+                return [[(state, k)]] if start == frm else []
+            else:
+                return [
+                    [(state, k)] + r for r in self.parse_paths(e, chart, frm, start)
+                ]
+
+        *expr, var = named_expr
+        if var not in self.cgrammar:
+            starts = (
+                [(var, til - len(var), "t")]
+                if til > 0 and chart[til].letter == var
+                else []
+            )
+        else:
+            starts = [
+                (s, s.s_col.index, "n") for s in chart[til].finished_states.get(var, ())
+            ]
+
+        return [p for s, start, k in starts for p in paths(s, start, k, expr)]
+
+    def parse(self, text) -> Generator:
+        """
+        Lazily enumerates the parse trees of :code:`text`, in the same order as
+        :meth:`~isla.parser.EarleyParser.parse`. The trees are extracted from a
+        :class:`~isla.parser.SharedPackedParseForest`, such that subtrees are only
+        computed once.
+
+        :param text: The input to parse.
+        :return: A generator of parse trees.
+        """
+
+        start = self.finished_start_state(text)
+        forest = SharedPackedParseForest(self.cgrammar, self.table)
+        for tree in forest.trees(start):
+            yield self.prune_tree(tree)
+
+    def parse_first(self, text: str) -> ParseTree:
+        """
+        Returns the first parse tree of :code:`text` (i.e., the result of
+        :code:`next(self.parse(text))`). This only computes one alternative for
+        each node of the tree and does not keep the state required for
+        enumerating further trees. In contrast to :meth:`parse`, this method
+        never runs into an infinite recursion for grammars with cycles (like
+        :code:`<a> ::= <a> | "a"`).
+
+        >>> grammar = {"<start>": ["<a>"], "<a>": ["<a>", "<a><a>", "a", ""]}
+        >>> IndexedEarleyParser(grammar).parse_first("aa")
+        ('<start>', [('<a>', [('<a>', [('a', [])]), ('<a>', [('a', [])])])])
+
+        :param text: The input to parse.
+        :return: The first parse tree.
+        """
+
+        start = self.finished_start_state(text)
+        forest = SharedPackedParseForest(self.cgrammar, self.table)
+        tree = forest.first_tree(start)
+        assert tree is not None
+        return self.prune_tree(tree)
+
+    def finished_start_state(self, text: str) -> "IndexedState":
+        cursor, states = self.parse_prefix(text)
+        start = next((s for s in states if s.finished()), None)
+
+        if cursor < len(text) or not start:
+            raise SyntaxError("at " + repr(text[cursor:]))
+
+        return start
+
+
+class RecognizerColumn(IndexedColumn):
+    """
+    A chart column of an :class:`~isla.parser.IncrementalEarleyRecognizer`, which
+    additionally caches the results of Leo's optimization.
+    """
+
+    def __init__(self, index, letter):
+        super().__init__(index, letter)
+        self.leo_items: Dict[str, Optional[IndexedState]] = {}
+
+
+class IncrementalEarleyRecognizer:
+    """
+    Recognizes inputs of an :class:`~isla.parser.IndexedEarleyParser`'s grammar
+    incrementally: The input is fed in chunks, and after each chunk, the
+    recognizer reports the length of the longest prefix that can still be
+    extended to a word of the language (:code:`viable_prefix_length`) and the
+    length of the longest prefix that is a word of the language
+    (:code:`accepted_prefix_length`, :code:`-1` if there is none). No parse
+    trees are constructed, and the recognizer does not keep a reference to the
+    whole chart: A chart column is only retained while it is the origin of a
+    state that is still relevant for later columns.
+
+    >>> grammar = {
+    ...     "<start>": ["<lines>"],
+    ...     "<lines>": ["<line>", "<line>\\n<lines>"],
+    ...     "<line>": ["a", "a<line>"],
+    ... }
+    >>> recognizer = IncrementalEarleyRecognizer(IndexedEarleyParser(grammar))
+    >>> recognizer.feed("aa\\na")
+    True
+    >>> recognizer.feed("a\\n")
+    True
+    >>> recognizer.viable_prefix_length, recognizer.accepted_prefix_length
+    (6, 5)
+    >>> recognizer.feed("b")
+    False
+    >>> recognizer.viable_prefix_length, recognizer.finish()
+    (6, False)
+    """
+
+    def __init__(self, parser: "IndexedEarleyParser"):
+        """
+        :param parser: The parser providing the grammar.
+        """
+
+        self.parser = parser
+        self.start_symbol = parser.start_symbol()
+        self.viable_prefix_length = 0
+        self.accepted_prefix_length = -1
+        self.failed = False
+
+        # The current column is only processed once the next letter is known,
+        # since predictions are filtered by the next letter.
+        self.__column = RecognizerColumn(0, None)
+        alt = tuple(*parser.cgrammar[self.start_symbol])
+        self.__column.add(IndexedState(self.start_symbol, alt, 0, self.__column))
+
+    def feed(self, text: str) -> bool:
+        """
+        Feeds the next chunk of the input.
+
+        :param text: The next chunk.
+        :return: :code:`False` iff the input fed so far is no prefix of a word
+            in the language anymore.
+        """
+
+        if self.failed:
+            return False
+
+        for letter in text:
+            column = self.__column
+            self.__process(column, letter)
+
+            next_column = RecognizerColumn(column.index + 1, letter)
+            for state in column.waiting_for.get(letter, ()):
+                next_column.add(state.advance())
+
+            if not next_column.states:
+                self.failed = True
+                return False
+
+            self.__column = next_column
+            self.viable_prefix_length = next_column.index
+
+        return True
+
+    def finish(self) -> bool:
+        """
+        Signals the end of the input.
+
+        :return: :code:`True` iff the whole input fed so far is a word of the
+            language.
+        """
+
+        if self.failed:
+            return False
+
+        self.__process(self.__column, None)
+        return self.accepted_prefix_length == self.__column.index
+
+    def __process(self, column: "RecognizerColumn", next_letter: Optional[str]) -> None:
+        cgrammar = self.parser.cgrammar
+        for state in column.states:
+            if state.dot >= len(state.expr):
+                self.__complete(column, state)
+            else:
+                sym = state.expr[state.dot]
+                if sym in cgrammar:
+                    self.parser.predict_with_lookahead(column, sym, state, next_letter)
+
+        if any(
+            not state.s_col.index
+            for state in column.finished_states.get(self.start_symbol, ())
+        ):
+            self.accepted_prefix_length = column.index
+
+    def __complete(self, column: "RecognizerColumn", state: IndexedState) -> None:
+        if state.s_col is not column:
+            top = self.__leo_item(state.s_col, state.name)
+            if top is not None:
+                column.add(IndexedState(top.name, top.expr, top.dot, top.s_col))
+                return
+
+        self.parser.earley_complete(column, state)
+
+    def __leo_item(
+        self, column: "RecognizerColumn", symbol: str
+    ) -> Optional[IndexedState]:
+        """
+        Implements Leo's optimization for right recursion: If the only state in
+        the (already processed) :code:`column` waiting for :code:`symbol` has
+        :code:`symbol` as its last symbol, completing :code:`symbol` just
+        completes that state. In that case, the result is the topmost finished
+        state of the resulting chain of completions, which is added directly
+        instead of all intermediate states.
+
+        :param column: The origin column of the completed state.
+        :param symbol: The name of the completed state.
+        :return: The topmost finished state or :code:`None` if the completion is
+            not deterministic.
+        """
+
+        if symbol in column.leo_items:
+            return column.leo_items[symbol]
+
+        result = None
+        waiting = column.waiting_for.get(symbol, ())
+        if len(waiting) == 1 and waiting[0].dot == len(waiting[0].expr) - 1:
+            parent = waiting[0]
+            if parent.s_col is not column:
+                result = self.__leo_item(parent.s_col, parent.name)
+            if result is None:
+                result = parent.advance()
+
+        column.leo_items[symbol] = result
+        return result
+
+    def feed_stream(
+        self, stream: Union[TextIO, BinaryIO, mmap.mmap], chunk_size: int = 1 << 16
+    ) -> bool:
+        """
+        Feeds the contents of a text file, binary file, or memory-mapped file
+        (decoded as UTF-8) chunk by chunk and finishes the input. Reading stops
+        as soon as the input read so far cannot be extended to a word of the
+        language anymore.
+
+        >>> import io
+        >>> grammar = {"<start>": ["<as>"], "<as>": ["a", "a<as>"]}
+        >>> recognizer = IncrementalEarleyRecognizer(IndexedEarleyParser(grammar))
+        >>> recognizer.feed_stream(io.BytesIO(b"a" * 1000), chunk_size=64)
+        True
+
+        :param stream: The input source.
+        :param chunk_size: The number of bytes or characters read at once.
+        :return: :code:`True` iff the whole contents of the stream are a word of
+            the language.
+        """
+
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        while chunk := stream.read(chunk_size):
+            text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if not self.feed(text):
+                return False
+
+        if not self.feed(decoder.decode(b"", final=True)):
+            return False
+
+        return self.finish()
+
+
+class LazySequence:
+    """
+    A sequence whose elements are computed on demand by an iterator and cached.
+    Different consumers can thus share the computed elements. Requesting an
+    element while the sequence is computing its next element (i.e., in a
+    cyclic dependency) yields :code:`None`, as does requesting an element
+    beyond the end of the sequence.
+
+    >>> seq = LazySequence(iter(range(3)))
+    >>> seq.get(1), seq.items
+    (1, [0, 1])
+    >>> list(seq), seq.get(5)
+    ([0, 1, 2], None)
+    """
+
+    __slots__ = ("iterator", "items", "computing")
+
+    def __init__(self, iterator: Iterator):
+        self.iterator: Optional[Iterator] = iterator
+        self.items: List = []
+        self.computing = False
+
+    def get(self, idx: int) -> Optional[Any]:
+        items = self.items
+        while len(items) <= idx:
+            if self.iterator is None or self.computing:
+                return None
+
+            self.computing = True
+            try:
+                items.append(next(self.iterator))
+            except StopIteration:
+                self.iterator = None
+                return None
+            finally:
+                self.computing = False
+
+        return items[idx]
+
+    def __iter__(self):
+        idx = 0
+        while (item := self.get(idx)) is not None:
+            yield item
+            idx += 1
+
+
+Child = Union["IndexedState", str]
+
+
+class SharedPackedParseForest:
+    """
+    A shared packed parse forest (SPPF) for an Earley chart computed by an
+    :class:`~isla.parser.IndexedEarleyParser`. Symbol nodes are the finished
+    Earley states; their packed alternatives are the ways to split the span of
+    the state among the symbols of its expansion. These alternatives are
+    computed from "intermediate" nodes covering prefixes of expansions, which
+    are shared between all states (and alternatives) with a common prefix.
+
+    All nodes are computed lazily and only once. The parse trees of a state
+    are cached in a :class:`~isla.parser.LazySequence`, such that each
+    subsequent tree only costs the construction of its root node.
+    """
+
+    def __init__(self, cgrammar: CanonicalGrammar, chart: List["IndexedColumn"]):
+        self.cgrammar = cgrammar
+        self.chart = chart
+        self.__paths: Dict[Tuple[Tuple[str, ...], int, int, int], LazySequence] = {}
+        # States are only unique within a chart column; we thus additionally
+        # distinguish them by their end column.
+        self.__trees: Dict[Tuple[Tuple, int], LazySequence] = {}
+        self.__first_trees: Dict[Tuple[Tuple, int], Optional[ParseTree]] = {}
+
+    def paths(
+        self, expr: Tuple[str, ...], length: int, frm: int, til: int
+    ) -> LazySequence:
+        """
+        :param expr: An expansion.
+        :param length: The length of the considered prefix of the expansion.
+        :param frm: The start index of the span.
+        :param til: The end index of the span.
+        :return: The ways to derive the first :code:`length` symbols of
+            :code:`expr` spanning from :code:`frm` to :code:`til`. Each such
+            way is a tuple of finished states (for nonterminals) and terminal
+            symbols.
+        """
+
+        key = (expr, length, frm, til)
+        result = self.__paths.get(key)
+        if result is None:
+            result = LazySequence(self.__compute_paths(expr, length, frm, til))
+            self.__paths[key] = result
+
+        return result
+
+    def __compute_paths(
+        self, expr: Tuple[str, ...], length: int, frm: int, til: int
+    ) -> Iterator[Tuple[Child, ...]]:
+        if not length:
+            if frm == til:
+                yield ()
+            return
+
+        var = expr[length - 1]
+        if var not in self.cgrammar:
+            if til - len(var) >= frm and self.chart[til].letter == var:
+                for path in self.paths(expr, length - 1, frm, til - len(var)):
+                    yield path + (var,)
+            return
+
+        for state in self.chart[til].finished_states.get(var, ()):
+            start = state.s_col.index
+            if start < frm:
+                continue
+            for path in self.paths(expr, length - 1, frm, start):
+                yield path + (state,)
+
+    def state_paths(self, state: IndexedState) -> LazySequence:
+        return self.paths(
+            state.expr, len(state.expr), state.s_col.index, state.e_col.index
+        )
+
+    def trees(self, state: IndexedState) -> LazySequence:
+        """
+        :param state: A finished state.
+        :return: The parse trees for the state (before pruning).
+        """
+
+        key = (state.key, state.e_col.index)
+        result = self.__trees.get(key)
+        if result is None:
+            result = LazySequence(self.__compute_trees(state))
+            self.__trees[key] = result
+
+        return result
+
+    def __compute_trees(self, state: IndexedState) -> Iterator[ParseTree]:
+        if not state.expr or self.state_paths(state).get(0) is None:
+            yield state.name, []
+            return
+
+        # As in the original parser, the trees for one path combine the i-th
+        # trees of all children, until one child runs out of trees.
+        for path in self.state_paths(state):
+            children = [
+                self.trees(child) if isinstance(child, IndexedState) else child
+                for child in path
+            ]
+
+            idx = 0
+            while True:
+                subtrees = []
+                for child in children:
+                    if isinstance(child, LazySequence):
+                        subtree = child.get(idx)
+                    else:
+                        subtree = (child, []) if not idx else None
+                    if subtree is None:
+                        break
+                    subtrees.append(subtree)
+                else:
+                    yield state.name, subtrees
+                    idx += 1
+                    continue
+                break
+
+    def first_tree(self, state: IndexedState) -> Optional[ParseTree]:
+        """
+        :param state: A finished state.
+        :return: The first parse tree for the state (before pruning), or
+            :code:`None` if the state only has infinite derivations.
+        """
+
+        key = (state.key, state.e_col.index)
+        if key in self.__first_trees:
+            return self.__first_trees[key]
+
+        # Guard against cyclic derivations.
+        self.__first_trees[key] = None
+
+        result: Optional[ParseTree] = None
+        if not state.expr or self.state_paths(state).get(0) is None:
+            result = (state.name, [])
+        else:
+            for path in self.state_paths(state):
+                subtrees = [
+                    self.first_tree(child)
+                    if isinstance(child, IndexedState)
+                    else (child, [])
+                    for child in path
+                ]
+                if all(subtree is not None for subtree in subtrees):
+                    result = (state.name, subtrees)
+                    break
+
+        self.__first_trees[key] = result
+        return result
+
+
+@lru_cache(maxsize=128)
+def earley_parser(
+    grammar: ImmutableGrammar, nonterminal: str = START_SYMBOL
+) -> IndexedEarleyParser:
+    """
+    Returns an Earley parser (an :class:`~isla.parser.IndexedEarleyParser`) for the
+    given grammar. If :code:`nonterminal` is not
+    the start symbol, the parser is created for the sub-grammar starting with
+    that nonterminal; the parsed trees then have an additional root
+    :code:`<start>` node with the actual result as its only child.
+
+    Parsers are created once per grammar and nonterminal and reused afterward.
+    This saves the preprocessing of the grammar (e.g., the computation of
+    nullable nonterminals) for each parsed input.
+
+    >>> from isla.helpers import grammar_to_immutable
+    >>> grammar = {"<start>": ["<a>"], "<a>": ["a<a>", ""]}
+    >>> parser = earley_parser(grammar_to_immutable(grammar), "<a>")
+    >>> next(parser.parse("aa"))
+    ('<start>', [('<a>', [('a', []), ('<a>', [('a', []), ('<a>', [])])])])
+
+    >>> parser is earley_parser(grammar_to_immutable(grammar), "<a>")
+    True
+
+    :param grammar: The grammar, in immutable form (see
+        :func:`~isla.helpers.grammar_to_immutable`).
+    :param nonterminal: The nonterminal to start parsing with.
+    :return: The parser.
+    """
+
+    specialized_grammar = grammar_to_mutable(grammar)
+    if nonterminal != START_SYMBOL:
+        specialized_grammar |= {START_SYMBOL: [nonterminal]}
+        specialized_grammar = delete_unreachable(specialized_grammar)
+
+    return IndexedEarleyParser(specialized_grammar)
+
+
 class SimpleExtractor:
     def __init__(self, parser, text):
         self.parser = parser
@@ -41,6 +41,7 @@ from grammar_graph.gg import path_to_string
 import isla.derivation_tree
 from isla.fuzzer import GrammarCoverageFuzzer
 from isla.helpers import tree_to_string
+from isla.k_path_index import KPathIndex, k_path_index
 from isla.solver import ISLaSolver
 from isla.type_defs import Grammar, ParseTree
 
@@ -461,12 +462,8 @@ class Evaluator:
             precision[job] = valid_inputs / total_inputs
 
             # Analyze diversity: Fraction of covered k-paths
-            all_kpaths: Dict[int, Set[str]] = {
-                k: {
-                    path_to_string(p)
-                    for p in self.graph.k_paths(k, include_terminals=False)
-                }
-                for k in self.kvalues
+            all_kpaths: Dict[int, KPathIndex] = {
+                k: k_path_index(self.graph, k) for k in self.kvalues
             }
 
             diversity[job] = self.__analyze_diversity(all_kpaths, cur, job, sids)
@@ -531,7 +528,7 @@ class Evaluator:
 
     def __analyze_diversity(
         self,
-        all_kpaths: Dict[int, Set[str]],
+        all_kpaths: Dict[int, KPathIndex],
         cur: Cursor,
         job: str,
         sids: Tuple[int, ...],
@@ -635,16 +632,19 @@ class Evaluator:
                     (job, sid, k),
                 )
 
-                paths: Set[str] = set()
+                index = all_kpaths[k]
+                covered_bits: int = 0
                 for row in cur:
                     for path in next(ijson.items(row[0].encode("utf-8"), "")):
-                        if path not in all_kpaths[k]:
+                        if not index.contains_string(path):
                             if path in tar_kpath_fix_map:
                                 for fixed_path in tar_kpath_fix_map[path]:
-                                    assert (
-                                        fixed_path in all_kpaths[k]
+                                    assert index.contains_string(
+                                        fixed_path
                                     ), f"Fixed path {fixed_path} is broken"
-                                    paths.add(fixed_path)
+                                covered_bits |= index.strings_to_bits(
+                                    tar_kpath_fix_map[path]
+                                )
                             else:
                                 print(
                                     f"For {job}, session {sid}, k={k}, found a covered path that is not "
@@ -654,17 +654,22 @@ class Evaluator:
 
                             continue
 
-                        paths.add(path)
+                        covered_bits |= index.strings_to_bits([path])
 
                 if self.do_print_missing_kpaths:
-                    missing_paths = all_kpaths[k].difference(paths)
+                    missing_paths = set(
+                        map(
+                            path_to_string,
+                            index.from_bits(index.all_bits & ~covered_bits),
+                        )
+                    )
                     if missing_paths:
                         print(f'Missing {k}-paths for session {sid} of job "{job}":')
                         print("\n".join(map(lambda p: f"- {p}", missing_paths)))
                     else:
                         print(f'No missing {k}-paths for sesson {sid} of job "{job}"')
 
-                diversity_by_k[k] = len(paths) / len(all_kpaths[k])
+                diversity_by_k[k] = index.coverage(covered_bits)
 
             diversity_by_sid[sid] = sum(diversity_by_k.values()) / len(diversity_by_k)
 
@@ -722,15 +727,7 @@ def make_input_generator(
     | Grammar
 ) -> Generator[isla.derivation_tree.DerivationTree, None, None]:
     if isinstance(generator, ISLaSolver):
-
-        def gen():
-            while True:
-                try:
-                    yield generator.solve()
-                except TimeoutError | StopIteration:
-                    return
-
-        return gen()
+        return generator.solutions()
 
     elif isinstance(generator, dict):
         # grammar
@@ -21,7 +21,10 @@ import functools
 import heapq
 import itertools
 import logging
+import hashlib
 import math
+import multiprocessing
+import os
 import operator
 import random
 import sys
@@ -29,6 +32,7 @@ import time
 from abc import ABC
 from dataclasses import dataclass
 from functools import reduce, lru_cache, partial
+from queue import Empty
 from typing import (
     Dict,
     List,
@@ -38,7 +42,9 @@ from typing import (
     Union,
     cast,
     Callable,
+    Generator,
     Iterable,
+    Iterator,
     Sequence,
 )
 
@@ -55,7 +61,7 @@ from returns.functions import compose, tap
 from returns.maybe import Nothing, Some
 from returns.pipeline import flow, is_successful
 from returns.pointfree import lash
-from returns.result import safe, Success
+from returns.result import safe, Success, Failure, Result
 
 import isla.isla_shortcuts as sc
 import isla.three_valued_truth
@@ -66,6 +72,7 @@ from isla.evaluator import (
     quantified_formula_might_match,
     get_toplevel_quantified_formulas,
     eliminate_quantifiers,
+    PreparedFormula,
 )
 from isla.evaluator import matches_for_quantified_formula
 from isla.existential_helpers import (
@@ -95,12 +102,15 @@ from isla.helpers import (
     compute_nullable_nonterminals,
     eassert,
     merge_dict_of_sets,
+    grammar_hash,
+    grammar_to_immutable,
 )
 from isla.isla_predicates import (
     STANDARD_STRUCTURAL_PREDICATES,
     STANDARD_SEMANTIC_PREDICATES,
     COUNT_PREDICATE,
 )
+from isla.k_path_index import KPathIndex, k_path_index
 from isla.language import (
     VariablesCollector,
     split_conjunction,
@@ -118,9 +128,11 @@ from isla.language import (
     fresh_constant,
 )
 from isla.mutator import Mutator
-from isla.parser import EarleyParser
+from isla.parser import EarleyParser, earley_parser
+from isla.three_valued_truth import ThreeValuedTruth
 from isla.type_defs import Grammar, Path, ImmutableList, CanonicalGrammar
 from isla.z3_helpers import (
+    IncrementalZ3Solver,
     z3_solve,
     z3_subst,
     z3_eq,
@@ -167,7 +179,7 @@ class SolutionState:
     def __hash__(self):
         if self.__hash is None:
             result = hash((self.constraint, self.tree))
-            object.__setattr__(self, "__hash", result)
+            object.__setattr__(self, "_SolutionState__hash", result)
             return result
 
         return self.__hash
@@ -298,11 +310,31 @@ class SolverDefaults:
     initial_tree: Maybe[DerivationTree] = Nothing
     enable_optimized_z3_queries: bool = True
     start_symbol: Optional[str] = None
+    workers: int = 1
+    regex_cache_dir: Optional[str] = None
+    max_dnf_disjuncts: Optional[int] = 64
+    constraint_cache_dir: Optional[str] = None
 
 
 _DEFAULTS = SolverDefaults()
 
 
+# The solver used by the worker processes of ISLaSolver.check_batch.
+_check_batch_solver: Optional["ISLaSolver"] = None
+
+
+def init_check_batch_worker(solver: "ISLaSolver") -> None:
+    global _check_batch_solver
+    _check_batch_solver = solver
+
+
+def run_check_batch_worker(
+    inp: DerivationTree | str,
+) -> Result[ThreeValuedTruth, SyntaxError]:
+    assert _check_batch_solver is not None
+    return _check_batch_solver.check_batch_input(inp)
+
+
 class ISLaSolver:
     """
     The solver class for ISLa formulas/constraints. Its top-level methods are
@@ -351,6 +383,10 @@ class ISLaSolver:
         initial_tree: Maybe[DerivationTree] = _DEFAULTS.initial_tree,
         enable_optimized_z3_queries: bool = _DEFAULTS.enable_optimized_z3_queries,
         start_symbol: Optional[str] = _DEFAULTS.start_symbol,
+        workers: int = _DEFAULTS.workers,
+        regex_cache_dir: Optional[str] = _DEFAULTS.regex_cache_dir,
+        max_dnf_disjuncts: Optional[int] = _DEFAULTS.max_dnf_disjuncts,
+        constraint_cache_dir: Optional[str] = _DEFAULTS.constraint_cache_dir,
     ):
         """
         The constructor of :class:`~isla.solver.ISLaSolver` accepts a large number of
@@ -444,6 +480,31 @@ class ISLaSolver:
           a start symbol different form `<start>`. If `start_symbol` is provided, a tree
           consisting of a single root node with the value of `start_symbol` is chosen as
           initial tree.
+        :param workers: The number of worker processes used by
+          :meth:`~isla.solver.ISLaSolver.solve`. For values greater than 1, the solver
+          explores the search space sequentially until the queue contains at least
+          `workers` states, distributes these states over the worker processes, and
+          returns the solutions found by all workers as a single stream without
+          (structurally) duplicate solutions. Requires the "fork" process start method;
+          otherwise, the solver falls back to sequential solving.
+        :param regex_cache_dir: A directory for persisting the regular expressions
+          that ISLa computes for the syntax of nonterminals (see
+          `grammar_unwinding_threshold`). Regular expressions are stored in SMT-LIB
+          format, keyed by a hash of the grammar, the nonterminal, and the unwinding
+          threshold, and loaded when needed. Solvers for the same grammar (e.g., in
+          different processes) thus only compute a regular expression once. If not
+          set, regular expressions are only cached in memory.
+        :param max_dnf_disjuncts: The maximum number of states into which the solver
+          splits a state by multiplying out the disjunctions in its constraint. If
+          more states would result, the remaining disjunctions are split when the
+          resulting states are processed. If set to None, all disjunctions are
+          multiplied out at once.
+        :param constraint_cache_dir: A directory for persisting parsed constraints
+          (see :func:`~isla.language.parse_isla`). If :code:`formula` is a string
+          that has been parsed before (e.g., by another process) for the same
+          grammar and predicates, it is loaded from there in a pre-parsed form.
+          Within one process, parsed constraints are cached in any case. Loading
+          executes code stored in the directory, which must thus be trusted.
         """
         self.logger = logging.getLogger(type(self).__name__)
 
@@ -479,8 +540,13 @@ class ISLaSolver:
 
         self.graph = GrammarGraph.from_grammar(self.grammar)
         self.canonical_grammar = canonical(self.grammar)
+        self.immutable_grammar = grammar_to_immutable(self.grammar)
         self.timeout_seconds = timeout_seconds
         self.start_time: Optional[int] = None
+        # An absolute point in time (as returned by :func:`time.time`) after which
+        # :meth:`~isla.solver.ISLaSolver.solve` raises a :class:`TimeoutError`. Set
+        # by :meth:`~isla.solver.ISLaSolver.solutions`.
+        self.deadline: Optional[float] = None
         self.global_fuzzer = global_fuzzer
         self.fuzzer = fuzzer_factory(self.grammar)
         self.fuzzer_factory = fuzzer_factory
@@ -489,6 +555,24 @@ class ISLaSolver:
         )
         self.grammar_unwinding_threshold = grammar_unwinding_threshold
         self.enable_optimized_z3_queries = enable_optimized_z3_queries
+        self.max_dnf_disjuncts = max_dnf_disjuncts
+        self.constraint_cache_dir = constraint_cache_dir
+
+        assert workers >= 1, f"The number of workers must be positive, got {workers}"
+        self.workers = workers
+        if self.workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            self.logger.warning(
+                "Parallel solving requires the 'fork' start method, which is not "
+                + "available on this platform; falling back to a single worker."
+            )
+            self.workers = 1
+
+        # Only used in parallel mode (workers > 1).
+        self.worker_processes: Optional[List[multiprocessing.Process]] = None
+        self.worker_results: Optional[multiprocessing.Queue] = None
+        self.worker_results_size: int = 2 * self.workers
+        self.num_finished_workers: int = 0
+        self.parallel_solution_hashes: Set[int] = set()
 
         if activate_unsat_support and tree_insertion_methods is None:
             self.tree_insertion_methods = 0
@@ -521,7 +605,11 @@ class ISLaSolver:
             if formula is None
             else (
                 parse_isla(
-                    formula, self.grammar, structural_predicates, semantic_predicates
+                    formula,
+                    self.grammar,
+                    structural_predicates,
+                    semantic_predicates,
+                    cache_dir=constraint_cache_dir,
                 )
                 if isinstance(formula, str)
                 else formula
@@ -529,6 +617,9 @@ class ISLaSolver:
         )
 
         self.formula = ensure_unique_bound_variables(formula)
+        self.prepared_formula = PreparedFormula(
+            self.formula, self.grammar, graph=self.graph
+        )
 
         top_constants: Set[language.Constant] = set(
             [
@@ -593,8 +684,12 @@ class ISLaSolver:
         self.last_cost_recomputation: int = 0
 
         self.regex_cache = {}
+        self.grammar_digest: Optional[str] = None
+        self.regex_cache_dir = regex_cache_dir
+        if self.regex_cache_dir is not None:
+            os.makedirs(self.regex_cache_dir, exist_ok=True)
 
-        self.solutions: List[DerivationTree] = []
+        self.pending_solutions: List[DerivationTree] = []
 
         # Debugging stuff
         self.debug = debug
@@ -629,6 +724,9 @@ class ISLaSolver:
         if self.timeout_seconds is not None and self.start_time is None:
             self.start_time = int(time.time())
 
+        if self.workers > 1:
+            return self.solve_in_parallel()
+
         while self.queue:
             self.step_cnt += 1
 
@@ -641,78 +739,316 @@ class ISLaSolver:
             #     print(f"Dumping state to {out_file}")
             #     exit()
 
-            if self.timeout_seconds is not None:
-                if int(time.time()) - self.start_time > self.timeout_seconds:
-                    self.logger.debug("TIMEOUT")
-                    raise TimeoutError(self.timeout_seconds)
+            self.check_timeout()
 
-            if self.solutions:
-                solution = self.solutions.pop(0)
+            if self.pending_solutions:
+                solution = self.pending_solutions.pop(0)
                 self.logger.debug('Found solution "%s"', solution)
                 return solution
 
-            cost: int
-            state: SolutionState
-            cost, state = heapq.heappop(self.queue)
+            self.process_next_state()
 
-            self.current_level = state.level
-            self.tree_hashes_in_queue.discard(state.tree.structural_hash())
-            self.state_hashes_in_queue.discard(hash(state))
-
-            if self.debug:
-                self.current_state = state
-                self.state_tree.setdefault(state, [])
-            self.logger.debug(
-                "Polling new state (%s, %s) (hash %d, cost %f)",
-                state.constraint,
-                state.tree.to_string(show_open_leaves=True, show_ids=True),
-                hash(state),
-                cost,
-            )
-            self.logger.debug("Queue length: %s", len(self.queue))
-
-            assert not isinstance(state.constraint, language.DisjunctiveFormula)
-
-            # Instantiate all top-level structural predicate formulas.
-            state = self.instantiate_structural_predicates(state)
-
-            # Apply the first elimination function that is applicable.
-            # The later ones are ignored.
-            def process_and_extend_solutions(
-                result_states: List[SolutionState],
-            ) -> Nothing:
-                assert result_states is not None
-                self.solutions.extend(self.process_new_states(result_states))
-                return Nothing
-
-            flow(
-                Nothing,
-                *map(
-                    compose(lambda f: (lambda _: f(state)), lash),
-                    [
-                        self.noop_on_false_constraint,
-                        self.eliminate_existential_integer_quantifiers,
-                        self.instantiate_universal_integer_quantifiers,
-                        self.match_all_universal_formulas,
-                        self.expand_to_match_quantifiers,
-                        self.eliminate_all_semantic_formulas,
-                        self.eliminate_all_ready_semantic_predicate_formulas,
-                        self.eliminate_and_match_first_existential_formula_and_expand,
-                        self.assert_remaining_formulas_are_lazy_binding_semantic,
-                        self.finish_unconstrained_trees,
-                        self.expand,
-                    ],
-                ),
-            ).bind(process_and_extend_solutions)
-
-        if self.solutions:
-            solution = self.solutions.pop(0)
+        if self.pending_solutions:
+            solution = self.pending_solutions.pop(0)
             self.logger.debug('Found solution "%s"', solution)
             return solution
         else:
             self.logger.debug("UNSAT")
             raise StopIteration()
 
+    def solutions(
+        self,
+        limit: Optional[int] = None,
+        deadline: Optional[float] = None,
+        as_strings: bool = False,
+        buffer_size: Optional[int] = None,
+    ) -> Generator[DerivationTree | str, None, None]:
+        """
+        Lazily yields solutions to the given ISLa formula. In contrast to
+        :meth:`~isla.solver.ISLaSolver.solve`, this generator does not signal the end
+        of the search by exceptions: It simply stops when no more solution can be
+        found, the :code:`limit` of solutions is reached, or a timeout occurred.
+        Exceptions other than :class:`StopIteration` and :class:`TimeoutError`
+        are passed on.
+
+        Solutions are only computed when requested. Thus, a consumer that is slower
+        than the solver does not cause solutions to pile up. In parallel mode (more
+        than one worker), the workers block as soon as :code:`buffer_size` solutions
+        are waiting to be consumed.
+
+        Closing the generator (e.g., by leaving a :code:`for` loop early) cancels the
+        search: Running worker processes are terminated. In sequential mode, the
+        search can be resumed by calling :meth:`~isla.solver.ISLaSolver.solve` or
+        :meth:`~isla.solver.ISLaSolver.solutions` again.
+
+        >>> grammar = {"<start>": ["<digit>"], "<digit>": list("0123456789")}
+        >>> solver = ISLaSolver(grammar, 'str.to.int(<digit>) > 6')
+        >>> sorted(solver.solutions(as_strings=True))
+        ['7', '8', '9']
+
+        >>> solver = ISLaSolver(grammar, 'str.to.int(<digit>) > 6')
+        >>> len(list(solver.solutions(limit=2)))
+        2
+
+        :param limit: The maximum number of solutions to yield; unbounded if
+          :code:`None`.
+        :param deadline: An absolute point in time, as returned by
+          :func:`time.time`, after which no further solutions are computed. This is
+          checked in addition to the :code:`timeout_seconds`
+          :meth:`constructor <isla.solver.ISLaSolver.__init__>` parameter.
+        :param as_strings: If :code:`True`, solutions are yielded as strings
+          instead of derivation trees.
+        :param buffer_size: The maximum number of solutions found by worker
+          processes that may wait for being consumed. Only has an effect in parallel
+          mode if the workers have not yet been started. Defaults to twice the
+          number of workers.
+        :return: A generator of solutions.
+        """
+
+        assert limit is None or limit >= 0
+        assert buffer_size is None or buffer_size > 0
+
+        if buffer_size is not None and self.worker_processes is None:
+            self.worker_results_size = buffer_size
+
+        num_solutions = 0
+        try:
+            while limit is None or num_solutions < limit:
+                if deadline is not None and time.time() > deadline:
+                    return
+
+                self.deadline = deadline
+                try:
+                    solution = self.solve()
+                except (StopIteration, TimeoutError):
+                    return
+                finally:
+                    self.deadline = None
+
+                num_solutions += 1
+                yield str(solution) if as_strings else solution
+        finally:
+            self.terminate_workers()
+
+    def check_timeout(self) -> None:
+        """
+        Raises a :class:`TimeoutError` if the timeout passed to the
+        :meth:`constructor <isla.solver.ISLaSolver.__init__>` expired or the
+        deadline set by :meth:`~isla.solver.ISLaSolver.solutions` has passed.
+        """
+
+        if self.timeout_seconds is not None:
+            if int(time.time()) - self.start_time > self.timeout_seconds:
+                self.logger.debug("TIMEOUT")
+                raise TimeoutError(self.timeout_seconds)
+
+        if self.deadline is not None and time.time() > self.deadline:
+            self.logger.debug("DEADLINE")
+            raise TimeoutError(self.deadline)
+
+    def process_next_state(self) -> None:
+        """
+        Pops the state with the lowest cost from the queue and applies the first
+        applicable elimination function to it. New states are added to the queue;
+        found solutions are appended to :code:`self.pending_solutions`.
+        """
+
+        cost: int
+        state: SolutionState
+        cost, state = heapq.heappop(self.queue)
+
+        self.current_level = state.level
+        self.tree_hashes_in_queue.discard(state.tree.structural_hash())
+        self.state_hashes_in_queue.discard(hash(state))
+
+        if self.debug:
+            self.current_state = state
+            self.state_tree.setdefault(state, [])
+        self.logger.debug(
+            "Polling new state (%s, %s) (hash %d, cost %f)",
+            state.constraint,
+            state.tree.to_string(show_open_leaves=True, show_ids=True),
+            hash(state),
+            cost,
+        )
+        self.logger.debug("Queue length: %s", len(self.queue))
+
+        assert not isinstance(state.constraint, language.DisjunctiveFormula)
+
+        # Instantiate all top-level structural predicate formulas.
+        state = self.instantiate_structural_predicates(state)
+
+        # Apply the first elimination function that is applicable.
+        # The later ones are ignored.
+        def process_and_extend_solutions(
+            result_states: List[SolutionState],
+        ) -> Nothing:
+            assert result_states is not None
+            self.pending_solutions.extend(self.process_new_states(result_states))
+            return Nothing
+
+        flow(
+            Nothing,
+            *map(
+                compose(lambda f: (lambda _: f(state)), lash),
+                [
+                    self.noop_on_false_constraint,
+                    self.split_remaining_disjunctions,
+                    self.eliminate_existential_integer_quantifiers,
+                    self.instantiate_universal_integer_quantifiers,
+                    self.match_all_universal_formulas,
+                    self.expand_to_match_quantifiers,
+                    self.eliminate_all_semantic_formulas,
+                    self.eliminate_all_ready_semantic_predicate_formulas,
+                    self.eliminate_and_match_first_existential_formula_and_expand,
+                    self.assert_remaining_formulas_are_lazy_binding_semantic,
+                    self.finish_unconstrained_trees,
+                    self.expand,
+                ],
+            ),
+        ).bind(process_and_extend_solutions)
+
+    def solve_in_parallel(self) -> DerivationTree:
+        """
+        The parallel variant of :meth:`~isla.solver.ISLaSolver.solve`, which is used
+        if the solver was created with more than one worker. The solver first explores
+        the search space sequentially until the queue contains at least
+        :code:`self.workers` states. Then, it distributes the queue over
+        :code:`self.workers` forked processes (round-robin by ascending cost), each of
+        which continues the search on its share of the states. Solutions found by the
+        workers are merged into one stream; structurally equal solutions are only
+        returned once.
+
+        :return: A solution for the ISLa formula passed to the
+          :class:`isla.solver.ISLaSolver`.
+        """
+
+        while True:
+            try:
+                self.check_timeout()
+            except TimeoutError:
+                self.terminate_workers()
+                raise
+
+            if self.pending_solutions:
+                solution = self.pending_solutions.pop(0)
+                if solution.structural_hash() in self.parallel_solution_hashes:
+                    continue
+
+                self.parallel_solution_hashes.add(solution.structural_hash())
+                self.logger.debug('Found solution "%s"', solution)
+                return solution
+
+            if self.worker_processes is None:
+                if not self.queue:
+                    self.logger.debug("UNSAT")
+                    raise StopIteration()
+
+                if len(self.queue) < self.workers:
+                    self.step_cnt += 1
+                    self.process_next_state()
+                else:
+                    self.start_workers()
+
+                continue
+
+            if self.num_finished_workers >= len(self.worker_processes):
+                self.logger.debug("UNSAT")
+                raise StopIteration()
+
+            try:
+                result = self.worker_results.get(timeout=1)
+            except Empty:
+                if not any(process.is_alive() for process in self.worker_processes):
+                    # All workers terminated, some of them without signaling.
+                    self.num_finished_workers = len(self.worker_processes)
+                continue
+
+            if result is None:
+                self.num_finished_workers += 1
+            elif isinstance(result, Exception):
+                self.terminate_workers()
+                raise result
+            else:
+                self.pending_solutions.append(result)
+
+    def start_workers(self) -> None:
+        """
+        Distributes the states in the queue over :code:`self.workers` new worker
+        processes, which are started by this method. Afterward, the queue of this
+        solver is empty.
+        """
+
+        assert self.worker_processes is None
+        entries = sorted(self.queue)
+        self.queue = []
+        self.tree_hashes_in_queue = set()
+        self.state_hashes_in_queue = set()
+
+        self.logger.debug(
+            "Distributing %d states over %d workers", len(entries), self.workers
+        )
+
+        context = multiprocessing.get_context("fork")
+        # The bound on the result queue makes workers wait for the consumer instead
+        # of piling up solutions that are never requested.
+        self.worker_results = context.Queue(maxsize=self.worker_results_size)
+        self.num_finished_workers = 0
+        self.worker_processes = [
+            context.Process(
+                target=self.run_worker,
+                args=(entries[idx :: self.workers],),
+                daemon=True,
+            )
+            for idx in range(self.workers)
+        ]
+
+        for process in self.worker_processes:
+            process.start()
+
+    def run_worker(self, queue_entries: List[Tuple[float, SolutionState]]) -> None:
+        """
+        The entry point of a worker process. Continues the (sequential) search from
+        the given queue entries and passes all found solutions to the parent process.
+        A :code:`None` value signals that the worker is done.
+
+        :param queue_entries: The share of the queue assigned to this worker.
+        """
+
+        self.workers = 1
+        self.queue = list(queue_entries)
+        heapq.heapify(self.queue)
+        self.tree_hashes_in_queue = {
+            state.tree.structural_hash() for _, state in queue_entries
+        }
+        self.state_hashes_in_queue = {hash(state) for _, state in queue_entries}
+
+        try:
+            while True:
+                self.worker_results.put(self.solve())
+        except (StopIteration, TimeoutError):
+            pass
+        except Exception as exc:
+            # Not all exceptions can be pickled; we pass a generic representation.
+            self.worker_results.put(
+                RuntimeError(
+                    f"Exception in solver worker ({type(exc).__name__}): {exc}"
+                )
+            )
+
+        self.worker_results.put(None)
+
+    def terminate_workers(self) -> None:
+        """
+        Terminates all worker processes that are still running. Does nothing if
+        no workers were started.
+        """
+
+        for process in self.worker_processes or []:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
     def check(self, inp: DerivationTree | str) -> bool:
         """
         Evaluates whether the given derivation tree satisfies the constraint passed to
@@ -732,13 +1068,87 @@ class ISLaSolver:
 
         assert isinstance(inp, DerivationTree)
 
-        result = evaluate(self.formula, inp, self.grammar)
+        result = self.prepared_formula.evaluate(inp)
 
         if result.is_unknown():
             raise UnknownResultError()
         else:
             return bool(result)
 
+    def check_batch(
+        self,
+        inputs: Iterable[DerivationTree | str],
+        processes: int = 1,
+        chunk_size: int = 16,
+    ) -> Iterator[Result[ThreeValuedTruth, SyntaxError]]:
+        """
+        Evaluates whether the given inputs satisfy the constraint passed to the
+        solver. In contrast to calling :meth:`~isla.solver.ISLaSolver.check` for
+        each input, unknown results are returned and not raised, and the verdicts
+        are produced lazily, in the order of the inputs. The constraint is only
+        prepared for evaluation once (see :class:`~isla.evaluator.PreparedFormula`).
+
+        >>> grammar = {
+        ...     "<start>": ["<digits>"],
+        ...     "<digits>": ["<digit>", "<digit><digits>"],
+        ...     "<digit>": list("0123456789"),
+        ... }
+        >>> solver = ISLaSolver(grammar, 'exists <digit> d in start: d = "0"')
+        >>> [
+        ...     result.map(bool).value_or(None)
+        ...     for result in solver.check_batch(["102", "12", "1x", "0"])
+        ... ]
+        [True, False, None, True]
+
+        :param inputs: The inputs to evaluate, either readily parsed or as strings.
+        :param processes: The number of processes in which inputs are parsed and
+          evaluated. For values greater than 1, inputs are distributed over a pool of
+          forked worker processes. Requires the "fork" process start method;
+          otherwise, the inputs are processed sequentially.
+        :param chunk_size: The number of inputs sent to a worker process at once.
+        :return: For each input, the truth value of the constraint, or a
+          `SyntaxError` if the input is a string that could not be parsed.
+        """
+
+        if processes <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            yield from map(self.check_batch_input, inputs)
+            return
+
+        context = multiprocessing.get_context("fork")
+        # With the "fork" start method, the solver is passed to the workers without
+        # pickling it; only the inputs and the verdicts are pickled.
+        with context.Pool(
+            processes, initializer=init_check_batch_worker, initargs=(self,)
+        ) as pool:
+            # `Pool.imap` consumes its whole input iterable eagerly. We pass the
+            # inputs in windows to keep the memory consumption for large (lazily
+            # read) corpora bounded.
+            inputs = iter(inputs)
+            window_size = 4 * processes * chunk_size
+            while window := list(itertools.islice(inputs, window_size)):
+                yield from pool.imap(run_check_batch_worker, window, chunk_size)
+
+    def check_batch_input(
+        self, inp: DerivationTree | str
+    ) -> Result[ThreeValuedTruth, SyntaxError]:
+        """
+        Evaluates one input of :meth:`~isla.solver.ISLaSolver.check_batch`.
+
+        :param inp: The input to evaluate, either readily parsed or as a string.
+        :return: The truth value of the constraint, or a `SyntaxError` if the input
+          could not be parsed.
+        """
+
+        if isinstance(inp, str):
+            try:
+                inp = DerivationTree.from_parse_tree(
+                    earley_parser(self.immutable_grammar).parse_first(inp)
+                )
+            except SyntaxError as err:
+                return Failure(err)
+
+        return Success(self.prepared_formula.evaluate(inp))
+
     def parse(
         self,
         inp: str,
@@ -761,14 +1171,9 @@ class ISLaSolver:
             failed parse.
         :return: A parsed `DerivationTree`.
         """
-        grammar = copy.deepcopy(self.grammar)
-        if nonterminal != "<start>":
-            grammar |= {"<start>": [nonterminal]}
-            grammar = delete_unreachable(grammar)
-
-        parser = EarleyParser(grammar)
+        parser = earley_parser(self.immutable_grammar, nonterminal)
         try:
-            parse_tree = next(parser.parse(inp))
+            parse_tree = parser.parse_first(inp)
             if nonterminal != "<start>":
                 parse_tree = parse_tree[1][0]
             tree = DerivationTree.from_parse_tree(parse_tree)
@@ -812,8 +1217,7 @@ class ISLaSolver:
             lambda c: self.formula.substitute_expressions({c: inp})
         ).unwrap()
 
-        set_smt_auto_eval(formula, False)
-        set_smt_auto_subst(formula, False)
+        formula = set_smt_auto_subst(set_smt_auto_eval(formula, False), False)
 
         qfr_free = eliminate_quantifiers(
             formula,
@@ -934,6 +1338,10 @@ class ISLaSolver:
         initial_tree: Maybe[DerivationTree] = Nothing,
         enable_optimized_z3_queries: Maybe[bool] = Nothing,
         start_symbol: Optional[str] = None,
+        workers: Maybe[int] = Nothing,
+        regex_cache_dir: Maybe[str] = Nothing,
+        max_dnf_disjuncts: Maybe[Optional[int]] = Nothing,
+        constraint_cache_dir: Maybe[str] = Nothing,
     ):
         result = ISLaSolver(
             grammar=grammar.value_or(self.grammar),
@@ -972,6 +1380,12 @@ class ISLaSolver:
                 self.enable_optimized_z3_queries
             ),
             start_symbol=start_symbol,
+            workers=workers.value_or(self.workers),
+            regex_cache_dir=regex_cache_dir.value_or(self.regex_cache_dir),
+            max_dnf_disjuncts=max_dnf_disjuncts.value_or(self.max_dnf_disjuncts),
+            constraint_cache_dir=constraint_cache_dir.value_or(
+                self.constraint_cache_dir
+            ),
         )
 
         result.regex_cache = self.regex_cache
@@ -2407,19 +2821,25 @@ class ISLaSolver:
         solutions: List[
             Dict[Union[language.Constant, DerivationTree], DerivationTree]
         ] = []
-        internal_solutions: List[Dict[language.Constant, z3.StringVal]] = []
+
+        # We set up one incremental Z3 session for all instantiations: The language
+        # constraints etc. are asserted only once, and each round only adds the
+        # formula excluding the previous solution.
+        (
+            formulas,
+            fresh_var_map,
+            length_vars,
+            int_vars,
+        ) = self.smt_formulas_with_language_constraints(
+            constants,
+            tuple([smt_formula.formula for smt_formula in smt_formulas]),
+            tree_substitutions,
+        )
+        z3_session = IncrementalZ3Solver(formulas)
 
         num_instantiations = max_instantiations or self.max_number_smt_instantiations
         for _ in range(num_instantiations):
-            (
-                solver_result,
-                maybe_model,
-            ) = self.solve_smt_formulas_with_language_constraints(
-                constants,
-                tuple([smt_formula.formula for smt_formula in smt_formulas]),
-                tree_substitutions,
-                internal_solutions,
-            )
+            solver_result, maybe_z3_model = z3_session.check()
 
             if solver_result != z3.sat:
                 if not solutions:
@@ -2427,7 +2847,14 @@ class ISLaSolver:
                 else:
                     return solutions
 
-            assert maybe_model is not None
+            assert maybe_z3_model is not None
+
+            maybe_model = {
+                var: self.extract_model_value(
+                    var, maybe_z3_model, fresh_var_map, length_vars, int_vars
+                )
+                for var in constants
+            }
 
             new_solution = {
                 tree_substitutions.get(constant, constant): maybe_model[constant]
@@ -2447,7 +2874,11 @@ class ISLaSolver:
             else:
                 solutions.append(new_solution)
                 if new_internal_solution:
-                    internal_solutions.append(new_internal_solution)
+                    z3_session.add(
+                        self.solution_exclusion_formula(
+                            new_internal_solution, fresh_var_map, length_vars, int_vars
+                        )
+                    )
                 else:
                     # Again, for a trivial solution (e.g., True), the assignment
                     # can be empty.
@@ -2462,6 +2893,62 @@ class ISLaSolver:
         tree_substitutions: Dict[language.Variable, DerivationTree],
         solutions_to_exclude: List[Dict[language.Variable, z3.StringVal]],
     ) -> Tuple[z3.CheckSatResult, Dict[language.Variable, DerivationTree]]:
+        (
+            formulas,
+            fresh_var_map,
+            length_vars,
+            int_vars,
+        ) = self.smt_formulas_with_language_constraints(
+            variables, smt_formulas, tree_substitutions
+        )
+
+        formulas.extend(
+            [
+                self.solution_exclusion_formula(
+                    prev_solution, fresh_var_map, length_vars, int_vars
+                )
+                for prev_solution in solutions_to_exclude
+            ]
+        )
+
+        sat_result, maybe_model = z3_solve(formulas)
+
+        if sat_result != z3.sat:
+            return sat_result, {}
+
+        assert maybe_model is not None
+
+        return sat_result, {
+            var: self.extract_model_value(
+                var, maybe_model, fresh_var_map, length_vars, int_vars
+            )
+            for var in variables
+        }
+
+    def smt_formulas_with_language_constraints(
+        self,
+        variables: Set[language.Variable],
+        smt_formulas: ImmutableList[z3.BoolRef],
+        tree_substitutions: Dict[language.Variable, DerivationTree],
+    ) -> Tuple[
+        List[z3.BoolRef],
+        Dict[language.Variable, z3.ExprRef],
+        Set[language.Variable],
+        Set[language.Variable],
+    ]:
+        """
+        Computes the Z3 formulas to pass to the SMT solver for solving
+        :code:`smt_formulas`: The formulas themselves (where length and int variables
+        are replaced by fresh integer variables), the language constraints for the
+        involved variables, and range constraints for the fresh variables.
+
+        :param variables: The variables in :code:`smt_formulas`.
+        :param smt_formulas: The SMT formulas to solve.
+        :param tree_substitutions: Substitutions of variables by derivation trees.
+        :return: The Z3 formulas, the map from length and int variables to their fresh
+          integer variables, the length variables, and the int variables.
+        """
+
         # We disable optimized Z3 queries if the SMT formulas contain "too concrete"
         # substitutions, that is, substitutions with a tree that is not merely an
         # open leaf. Example: we have a constrained `str.len(<chars>) < 10` and a
@@ -2561,8 +3048,28 @@ class ISLaSolver:
                 )
             )
 
-        for prev_solution in solutions_to_exclude:
-            prev_solution_formula = z3_and(
+        return formulas, fresh_var_map, length_vars, int_vars
+
+    def solution_exclusion_formula(
+        self,
+        prev_solution: Dict[language.Variable, z3.StringVal],
+        fresh_var_map: Dict[language.Variable, z3.ExprRef],
+        length_vars: Set[language.Variable],
+        int_vars: Set[language.Variable],
+    ) -> z3.BoolRef:
+        """
+        Computes a formula excluding the given previous solution.
+
+        :param prev_solution: The solution to exclude.
+        :param fresh_var_map: A map from variables to fresh variables for "length" or
+                              "int" variables.
+        :param length_vars: The "length" variables.
+        :param int_vars: The "int" variables.
+        :return: The negated conjunction of the equations describing the solution.
+        """
+
+        return z3.Not(
+            z3_and(
                 [
                     self.previous_solution_formula(
                         var, string_val, fresh_var_map, length_vars, int_vars
@@ -2570,22 +3077,7 @@ class ISLaSolver:
                     for var, string_val in prev_solution.items()
                 ]
             )
-
-            formulas.append(z3.Not(prev_solution_formula))
-
-        sat_result, maybe_model = z3_solve(formulas)
-
-        if sat_result != z3.sat:
-            return sat_result, {}
-
-        assert maybe_model is not None
-
-        return sat_result, {
-            var: self.extract_model_value(
-                var, maybe_model, fresh_var_map, length_vars, int_vars
-            )
-            for var in variables
-        }
+        )
 
     @staticmethod
     def previous_solution_formula(
@@ -3310,10 +3802,10 @@ class ISLaSolver:
                     old_start_time = self.start_time
                     old_timeout_seconds = self.timeout_seconds
                     old_queue = list(self.queue)
-                    old_solutions = list(self.solutions)
+                    old_solutions = list(self.pending_solutions)
 
                     self.queue = []
-                    self.solutions = []
+                    self.pending_solutions = []
                     check_state = SolutionState(existential_formula, new_state.tree)
                     heapq.heappush(self.queue, (0, check_state))
                     self.start_time = int(time.time())
@@ -3333,7 +3825,7 @@ class ISLaSolver:
                         self.start_time = old_start_time
                         self.timeout_seconds = old_timeout_seconds
                         self.queue = old_queue
-                        self.solutions = old_solutions
+                        self.pending_solutions = old_solutions
 
             self.currently_unsat_checking = False
 
@@ -3438,11 +3930,11 @@ class ISLaSolver:
         self.logger.info(
             f"Recomputing costs in queue after {self.step_cnt} solver steps"
         )
-        old_queue = list(self.queue)
-        self.queue = []
-        for _, state in old_queue:
-            cost = self.compute_cost(state)
-            heapq.heappush(self.queue, (cost, state))
+        # Only the global k-path coverage part of the costs has to be recomputed (the
+        # other components are cached by the cost computer). Heapifying the re-scored
+        # list is linear in the size of the queue.
+        self.queue = [(self.compute_cost(state), state) for _, state in self.queue]
+        heapq.heapify(self.queue)
 
     def assert_no_dangling_smt_formula_argument_trees(
         self, state: SolutionState
@@ -3500,8 +3992,33 @@ class ISLaSolver:
         # solver.add(z3_formula)
         # return solver.check() == z3.unsat
 
+    def split_remaining_disjunctions(
+        self, state: SolutionState
+    ) -> Maybe[List[SolutionState]]:
+        """
+        Splits states whose constraints still contain disjunctions. This happens if
+        multiplying out all disjunctions in a constraint would have resulted in more
+        than :code:`max_dnf_disjuncts` states (see
+        :meth:`~isla.solver.ISLaSolver.establish_invariant`).
+
+        :param state: The state to split.
+        :return: The split states, or Nothing if there are no disjunctions to split.
+        """
+
+        if not any(
+            isinstance(conjunct, language.DisjunctiveFormula)
+            for conjunct in split_conjunction(state.constraint)
+        ):
+            return Nothing
+
+        return Some(self.establish_invariant(state))
+
     def establish_invariant(self, state: SolutionState) -> List[SolutionState]:
-        formula = convert_to_dnf(convert_to_nnf(state.constraint), deep=False)
+        formula = convert_to_dnf(
+            convert_to_nnf(state.constraint),
+            deep=False,
+            max_disjuncts=self.max_dnf_disjuncts,
+        )
         return [
             SolutionState(disjunct, state.tree)
             for disjunct in split_disjunction(formula)
@@ -3633,6 +4150,10 @@ class ISLaSolver:
             ]
             return self.regex_cache.setdefault(nonterminal, z3.Concat(*result_elements))
 
+        maybe_stored_regex = self.load_regular_expression(nonterminal)
+        if is_successful(maybe_stored_regex):
+            return self.regex_cache.setdefault(nonterminal, maybe_stored_regex.unwrap())
+
         regex_conv = RegexConverter(
             self.grammar,
             compress_unions=True,
@@ -3682,9 +4203,90 @@ class ISLaSolver:
                 prev.add(new_inp)
 
         self.regex_cache[nonterminal] = z3_regex
+        self.store_regular_expression(nonterminal, z3_regex)
 
         return z3_regex
 
+    def regex_cache_file(self, nonterminal: str) -> Maybe[str]:
+        """
+        :param nonterminal: The nonterminal whose regular expression is requested.
+        :return: The path to the file storing the regular expression for
+          :code:`nonterminal` in the regular expression cache directory, or
+          :code:`Nothing` if no such directory was specified.
+        """
+
+        if self.regex_cache_dir is None:
+            return Nothing
+
+        if self.grammar_digest is None:
+            self.grammar_digest = grammar_hash(self.grammar)
+
+        key = f"{self.grammar_digest}:{nonterminal}:{self.grammar_unwinding_threshold}"
+        file_name = hashlib.sha256(key.encode("utf-8")).hexdigest() + ".smt2"
+
+        return Some(os.path.join(self.regex_cache_dir, file_name))
+
+    def load_regular_expression(self, nonterminal: str) -> Maybe[z3.ReRef]:
+        """
+        Loads the regular expression for :code:`nonterminal` from the regular
+        expression cache directory, if it has been stored there before.
+
+        :param nonterminal: The nonterminal whose regular expression is requested.
+        :return: The stored regular expression, if any.
+        """
+
+        def parse_regex_file(path: str) -> z3.ReRef:
+            with open(path, "r", encoding="utf-8") as regex_file:
+                # The file contains a constraint `(str.in_re c <regex>)`.
+                return z3.parse_smt2_string(regex_file.read())[0].arg(1)
+
+        result = self.regex_cache_file(nonterminal).bind(
+            lambda path: result_to_maybe(
+                safe(exceptions=(OSError, IndexError, z3.Z3Exception))(
+                    parse_regex_file
+                )(path)
+            )
+        )
+
+        if is_successful(result):
+            self.logger.debug(
+                "Loaded regular expression for nonterminal %s from cache", nonterminal
+            )
+
+        return result
+
+    def store_regular_expression(self, nonterminal: str, regex: z3.ReRef) -> None:
+        """
+        Stores the regular expression for :code:`nonterminal` in SMT-LIB format in the
+        regular expression cache directory, if one was specified. The file is written
+        atomically, such that concurrent solvers never read partially written files.
+
+        :param nonterminal: The nonterminal the regular expression belongs to.
+        :param regex: The regular expression to store.
+        """
+
+        def write_regex_file(path: str) -> None:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as regex_file:
+                regex_file.write(
+                    f"; Regular expression for {nonterminal} (unwinding threshold "
+                    + f"{self.grammar_unwinding_threshold})\n"
+                    + "(declare-const c String)\n"
+                    + f"(assert (str.in_re c {regex.sexpr()}))\n"
+                )
+            os.replace(tmp_path, path)
+
+        match self.regex_cache_file(nonterminal):
+            case Some(path):
+                try:
+                    write_regex_file(path)
+                except OSError as exc:
+                    self.logger.warning(
+                        "Could not store regular expression for %s: %s",
+                        nonterminal,
+                        exc,
+                    )
+
 
 class CostComputer(ABC):
     def compute_cost(self, state: SolutionState) -> float:
@@ -3708,6 +4310,11 @@ class CostComputer(ABC):
         raise NotImplementedError()
 
 
+# The maximum number of states whose costs are cached by a
+# `GrammarBasedBlackboxCostComputer` (see `_state_costs`).
+MAX_CACHED_STATE_COSTS = 10000
+
+
 class GrammarBasedBlackboxCostComputer(CostComputer):
     def __init__(
         self,
@@ -3719,13 +4326,19 @@ class GrammarBasedBlackboxCostComputer(CostComputer):
         self.cost_settings = cost_settings
         self.graph = graph
 
-        self.covered_k_paths: Set[Tuple[gg.Node, ...]] = set()
+        # The globally covered k-paths, as a bit set w.r.t. the `KPathIndex` for
+        # the graph and `cost_settings.k` (see the `covered_k_paths` property).
+        self.covered_k_path_bits: int = 0
         self.rounds_with_no_new_coverage = 0
         self.reset_coverage_after_n_round_with_no_coverage = (
             reset_coverage_after_n_round_with_no_coverage
         )
         self.symbol_costs: Optional[Dict[str, int]] = symbol_costs
 
+        # The results of `_state_costs`, indexed by the states. When the cache is
+        # full, the oldest entry is removed.
+        self.state_costs_cache: Dict[SolutionState, Tuple[float, float, float]] = {}
+
         self.logger = logging.getLogger(type(self).__name__)
 
     def __repr__(self):
@@ -3738,21 +4351,7 @@ class GrammarBasedBlackboxCostComputer(CostComputer):
         )
 
     def compute_cost(self, state: SolutionState) -> float:
-        # How costly is it to finish the tree?
-        tree_closing_cost = self.compute_tree_closing_cost(state.tree)
-
-        # Quantifiers are expensive (universal formulas have to be matched, tree insertion for existential
-        # formulas is even more costly). TODO: Penalize nested quantifiers more.
-        constraint_cost = sum(
-            [
-                idx * (2 if isinstance(f, language.ExistsFormula) else 1) + 1
-                for c in get_quantifier_chains(state.constraint)
-                for idx, f in enumerate(c)
-            ]
-        )
-
-        # k-Path coverage: Fewer covered -> higher penalty
-        k_cov_cost = self._compute_k_coverage_cost(state)
+        tree_closing_cost, constraint_cost, k_cov_cost = self._state_costs(state)
 
         # Covered k-paths: Fewer contributed -> higher penalty
         global_k_path_cost = self._compute_global_k_coverage_cost(state)
@@ -3783,6 +4382,44 @@ class GrammarBasedBlackboxCostComputer(CostComputer):
 
         return result
 
+    def _state_costs(self, state: SolutionState) -> Tuple[float, float, float]:
+        """
+        Computes the cost components that only depend on the given state, and not on
+        the globally covered k-paths. We cache them such that re-scoring the queue
+        (see :meth:`~isla.solver.ISLaSolver.recompute_costs`) only has to update the
+        global k-path coverage cost.
+
+        :param state: The state for which to compute the costs.
+        :return: The tree closing cost, the constraint cost, and the k-path coverage
+            cost.
+        """
+
+        if state in self.state_costs_cache:
+            return self.state_costs_cache[state]
+
+        # How costly is it to finish the tree?
+        tree_closing_cost = self.compute_tree_closing_cost(state.tree)
+
+        # Quantifiers are expensive (universal formulas have to be matched, tree insertion for existential
+        # formulas is even more costly). TODO: Penalize nested quantifiers more.
+        constraint_cost = sum(
+            [
+                idx * (2 if isinstance(f, language.ExistsFormula) else 1) + 1
+                for c in get_quantifier_chains(state.constraint)
+                for idx, f in enumerate(c)
+            ]
+        )
+
+        # k-Path coverage: Fewer covered -> higher penalty
+        k_cov_cost = self._compute_k_coverage_cost(state)
+
+        if len(self.state_costs_cache) >= MAX_CACHED_STATE_COSTS:
+            del self.state_costs_cache[next(iter(self.state_costs_cache))]
+
+        result = tree_closing_cost, constraint_cost, k_cov_cost
+        self.state_costs_cache[state] = result
+        return result
+
     def signal_tree_output(self, tree: DerivationTree) -> None:
         self._update_covered_k_paths(tree)
 
@@ -3791,35 +4428,38 @@ class GrammarBasedBlackboxCostComputer(CostComputer):
             self.symbol_costs = compute_symbol_costs(self.graph)
         return self.symbol_costs
 
+    @property
+    def covered_k_paths(self) -> Set[Tuple[gg.Node, ...]]:
+        return self._k_path_index().from_bits(self.covered_k_path_bits)
+
+    def _k_path_index(self) -> KPathIndex:
+        return k_path_index(self.graph, self.cost_settings.k)
+
     def _update_covered_k_paths(self, tree: DerivationTree):
         if self.cost_settings.weight_vector.low_global_k_path_coverage_penalty > 0:
-            old_covered_k_paths = copy.copy(self.covered_k_paths)
+            old_covered_k_path_bits = self.covered_k_path_bits
 
-            self.covered_k_paths.update(
-                tree.k_paths(
-                    self.graph, self.cost_settings.k, include_potential_paths=False
-                )
+            self.covered_k_path_bits |= tree.k_path_bits(
+                self.graph, self.cost_settings.k, include_potential_paths=False
             )
 
-            if old_covered_k_paths == self.covered_k_paths:
+            if old_covered_k_path_bits == self.covered_k_path_bits:
                 self.rounds_with_no_new_coverage += 1
 
-            graph_paths = self.graph.k_paths(
-                self.cost_settings.k, include_terminals=False
-            )
+            index = self._k_path_index()
             if (
                 self.rounds_with_no_new_coverage
                 >= self.reset_coverage_after_n_round_with_no_coverage
-                or self.covered_k_paths == graph_paths
+                or self.covered_k_path_bits == index.all_bits
             ):
-                if self.covered_k_paths == graph_paths:
+                if self.covered_k_path_bits == index.all_bits:
                     self.logger.debug("ALL PATHS COVERED")
                 else:
                     self.logger.debug(
                         "COVERAGE RESET SINCE NO CHANGE IN COVERED PATHS SINCE %d "
                         + "ROUNDS (%d path(s) uncovered)",
                         self.reset_coverage_after_n_round_with_no_coverage,
-                        len(graph_paths) - len(self.covered_k_paths),
+                        index.num_paths - self.covered_k_path_bits.bit_count(),
                     )
 
                     # uncovered_paths = (
@@ -3837,7 +4477,7 @@ class GrammarBasedBlackboxCostComputer(CostComputer):
                     #     )
                     # )
 
-                self.covered_k_paths = set()
+                self.covered_k_path_bits = 0
             else:
                 pass
                 # uncovered_paths = (
@@ -3864,21 +4504,15 @@ class GrammarBasedBlackboxCostComputer(CostComputer):
         if self.cost_settings.weight_vector.low_global_k_path_coverage_penalty == 0:
             return 0
 
-        tree_k_paths = state.tree.k_paths(
+        index = self._k_path_index()
+        tree_k_path_bits = state.tree.k_path_bits(
             self.graph, self.cost_settings.k, include_potential_paths=False
         )
-        all_graph_k_paths = self.graph.k_paths(
-            self.cost_settings.k, include_terminals=False
-        )
 
-        contributed_k_paths = {
-            path
-            for path in all_graph_k_paths
-            if path in tree_k_paths and path not in self.covered_k_paths
-        }
-
-        num_contributed_k_paths = len(contributed_k_paths)
-        num_missing_k_paths = len(all_graph_k_paths) - len(self.covered_k_paths)
+        num_contributed_k_paths = index.num_contributed(
+            tree_k_path_bits, self.covered_k_path_bits
+        )
+        num_missing_k_paths = index.num_paths - self.covered_k_path_bits.bit_count()
 
         # self.logger.debug(
         #     'k-Paths contributed by input %s:\n%s',
@@ -3897,16 +4531,12 @@ class GrammarBasedBlackboxCostComputer(CostComputer):
 
         # return 1 - (num_contributed_k_paths / num_missing_k_paths)
 
-        potential_tree_k_paths = state.tree.k_paths(
+        potential_tree_k_path_bits = state.tree.k_path_bits(
             self.graph, self.cost_settings.k, include_potential_paths=True
         )
-        contributed_k_paths = {
-            path
-            for path in all_graph_k_paths
-            if path in potential_tree_k_paths and path not in self.covered_k_paths
-        }
-
-        num_contributed_potential_k_paths = len(contributed_k_paths)
+        num_contributed_potential_k_paths = index.num_contributed(
+            potential_tree_k_path_bits, self.covered_k_path_bits
+        )
 
         if not num_missing_k_paths:
             return 0
@@ -3924,7 +4554,9 @@ class GrammarBasedBlackboxCostComputer(CostComputer):
             return 0
 
         coverages = []
-        for k in range(1, self.cost_settings.k + 1):
+        # We start with the largest k: The tree computes the concrete k-paths for all
+        # smaller values in the same pass.
+        for k in reversed(range(1, self.cost_settings.k + 1)):
             coverage = state.tree.k_coverage(
                 self.graph, k, include_potential_paths=False
             )
@@ -4230,12 +4862,9 @@ class EvaluatePredicateFormulasTransformer(NoopFormulaTransformer):
         # True (or False in a negation scope); in that case, we replace
         # it by "true." Otherwise, we keep it for later analysis.
 
-        instantiated_formula = copy.deepcopy(sub_formula)
-        set_smt_auto_subst(instantiated_formula, True)
-        set_smt_auto_eval(instantiated_formula, True)
-        instantiated_formula = instantiated_formula.substitute_expressions(
-            sub_formula.substitutions, force=True
-        )
+        instantiated_formula = set_smt_auto_eval(
+            set_smt_auto_subst(sub_formula, True), True
+        ).substitute_expressions(sub_formula.substitutions, force=True)
 
         assert instantiated_formula in {sc.true(), sc.false()}
 
@@ -17,7 +17,6 @@
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 import itertools
 import logging
-import operator
 import random
 import re
 import sys
@@ -37,13 +36,14 @@ from typing import (
     Iterable,
     Sequence,
     Mapping,
+    Any,
 )
 
 import z3
 from returns.converters import result_to_maybe
 from returns.functions import compose
 from returns.maybe import Maybe, Some, Nothing
-from returns.pipeline import flow
+from returns.pipeline import flow, is_successful
 from returns.pointfree import lash
 from returns.result import Success, Failure, Result
 from z3.z3 import _coerce_exprs
@@ -112,21 +112,30 @@ def evaluate_z3_expression(
                     evaluate_z3_re_union,
                     evaluate_z3_re_comp,
                     evaluate_z3_re_full_set,
+                    evaluate_z3_re_full_char_set,
+                    evaluate_z3_re_empty_set,
                     # Boolean Combinations
                     evaluate_z3_not,
                     evaluate_z3_and,
                     evaluate_z3_or,
+                    evaluate_z3_implies,
+                    evaluate_z3_ite,
                     # Comparisons
                     evaluate_z3_eq,
+                    evaluate_z3_distinct,
                     evaluate_z3_lt,
                     evaluate_z3_le,
                     evaluate_z3_gt,
                     evaluate_z3_ge,
+                    evaluate_z3_str_lt,
+                    evaluate_z3_str_le,
                     # Arithmetic Operations
                     evaluate_z3_add,
                     evaluate_z3_sub,
+                    evaluate_z3_uminus,
                     evaluate_z3_mul,
                     evaluate_z3_div,
+                    evaluate_z3_idiv,
                     evaluate_z3_mod,
                     evaluate_z3_pow,
                     # String Operations
@@ -134,7 +143,15 @@ def evaluate_z3_expression(
                     evaluate_z3_seq_concat,
                     evaluate_z3_seq_at,
                     evaluate_z3_seq_extract,
+                    evaluate_z3_seq_prefix,
+                    evaluate_z3_seq_suffix,
+                    evaluate_z3_seq_contains,
+                    evaluate_z3_seq_index,
+                    evaluate_z3_seq_replace,
                     evaluate_z3_str_to_code,
+                    evaluate_z3_str_from_code,
+                    evaluate_z3_int_to_str,
+                    evaluate_z3_str_is_digit,
                     # Fallback
                     not_implemented_failure,
                 ],
@@ -270,12 +287,23 @@ def evaluate_z3_seq_in_re(
 
     return Some(
         construct_result(
-            lambda args: re.match(f"^{args[1]}$", args[0]) is not None,
+            lambda args: compile_regex(args[1]).fullmatch(args[0]) is not None,
             children_results,
         )
     )
 
 
+@lru_cache(maxsize=1024)
+def compile_regex(regex: str) -> re.Pattern:
+    """
+    :param regex: A Python regular expression obtained from a Z3 regular expression.
+    :return: The compiled regular expression. As in Z3, :code:`.` matches any
+        character, including newlines.
+    """
+
+    return re.compile(regex, re.DOTALL)
+
+
 def evaluate_z3_re_star(
     expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
 ) -> Maybe[Z3EvalResult]:
@@ -356,6 +384,21 @@ def evaluate_z3_re_full_set(expr: z3.ExprRef, _) -> Maybe[Z3EvalResult]:
     return Some(((), ".*?"))
 
 
+def evaluate_z3_re_full_char_set(expr: z3.ExprRef, _) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_RE_FULL_CHAR_SET:
+        return Nothing
+
+    return Some(((), "."))
+
+
+def evaluate_z3_re_empty_set(expr: z3.ExprRef, _) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_RE_EMPTY_SET:
+        return Nothing
+
+    # A negative lookahead for the empty string never matches.
+    return Some(((), "(?!)"))
+
+
 # Boolean Combinations
 def evaluate_z3_not(
     expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
@@ -373,7 +416,7 @@ def evaluate_z3_and(
         return Nothing
 
     return Some(
-        construct_result(lambda args: reduce(operator.and_, args), children_results)
+        construct_lazy_result(lambda args: all(arg() for arg in args), children_results)
     )
 
 
@@ -384,7 +427,32 @@ def evaluate_z3_or(
         return Nothing
 
     return Some(
-        construct_result(lambda args: reduce(operator.or_, args), children_results)
+        construct_lazy_result(lambda args: any(arg() for arg in args), children_results)
+    )
+
+
+def evaluate_z3_implies(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if not z3.is_implies(expr):
+        return Nothing
+
+    return Some(
+        construct_lazy_result(lambda args: not args[0]() or args[1](), children_results)
+    )
+
+
+def evaluate_z3_ite(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if not z3.is_app_of(expr, z3.Z3_OP_ITE):
+        return Nothing
+
+    # Only the branch that is taken is evaluated.
+    return Some(
+        construct_lazy_result(
+            lambda args: args[1]() if args[0]() else args[2](), children_results
+        )
     )
 
 
@@ -398,6 +466,17 @@ def evaluate_z3_eq(
     return Some(construct_result(lambda args: args[0] == args[1], children_results))
 
 
+def evaluate_z3_distinct(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if not z3.is_distinct(expr):
+        return Nothing
+
+    return Some(
+        construct_result(lambda args: len(set(args)) == len(args), children_results)
+    )
+
+
 def evaluate_z3_lt(
     expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
 ) -> Maybe[Z3EvalResult]:
@@ -434,6 +513,25 @@ def evaluate_z3_ge(
     return Some(construct_result(lambda args: args[0] >= args[1], children_results))
 
 
+def evaluate_z3_str_lt(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_STRING_LT:
+        return Nothing
+
+    # Python compares strings lexicographically by code points, like SMT-LIB.
+    return Some(construct_result(lambda args: args[0] < args[1], children_results))
+
+
+def evaluate_z3_str_le(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_STRING_LE:
+        return Nothing
+
+    return Some(construct_result(lambda args: args[0] <= args[1], children_results))
+
+
 # Arithmetic Operations
 def evaluate_z3_add(
     expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
@@ -453,6 +551,15 @@ def evaluate_z3_sub(
     return Some(construct_result(lambda args: args[0] - args[1], children_results))
 
 
+def evaluate_z3_uminus(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if not z3.is_app_of(expr, z3.Z3_OP_UMINUS):
+        return Nothing
+
+    return Some(construct_result(lambda args: -args[0], children_results))
+
+
 def evaluate_z3_mul(
     expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
 ) -> Maybe[Z3EvalResult]:
@@ -475,13 +582,35 @@ def evaluate_z3_div(
     )
 
 
+def evaluate_z3_idiv(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if not z3.is_idiv(expr):
+        return Nothing
+
+    def constructor(args):
+        # SMT-LIB integer division is Euclidean: The remainder is never negative.
+        if args[1] == 0:
+            raise DomainError("Division by zero.")
+        return (args[0] - args[0] % abs(args[1])) // args[1]
+
+    return Some(construct_result(constructor, children_results))
+
+
 def evaluate_z3_mod(
     expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
 ) -> Maybe[Z3EvalResult]:
     if not z3.is_mod(expr):
         return Nothing
 
-    return Some(construct_result(lambda args: args[0] % args[1], children_results))
+    def constructor(args):
+        # As in SMT-LIB, the result is never negative (in Python, it has the sign
+        # of the divisor).
+        if args[1] == 0:
+            raise DomainError("Division by zero.")
+        return args[0] % abs(args[1])
+
+    return Some(construct_result(constructor, children_results))
 
 
 def evaluate_z3_pow(
@@ -522,9 +651,13 @@ def evaluate_z3_seq_at(
     if expr.decl().kind() != z3.Z3_OP_SEQ_AT:
         return Nothing
 
+    # As in SMT-LIB, the result is empty if the index is out of bounds.
     return Some(
         construct_result(
-            lambda args: cast(str, args[0])[cast(int, args[1])], children_results
+            lambda args: cast(str, args[0])[cast(int, args[1])]
+            if 0 <= cast(int, args[1]) < len(cast(str, args[0]))
+            else "",
+            children_results,
         )
     )
 
@@ -535,11 +668,89 @@ def evaluate_z3_seq_extract(
     if expr.decl().kind() != z3.Z3_OP_SEQ_EXTRACT:
         return Nothing
 
+    # As in SMT-LIB, the result is empty for negative offsets and lengths.
     return Some(
         construct_result(
             lambda args: cast(str, args[0])[
                 cast(int, args[1]) : cast(int, args[1]) + cast(int, args[2])
-            ],
+            ]
+            if cast(int, args[1]) >= 0 and cast(int, args[2]) > 0
+            else "",
+            children_results,
+        )
+    )
+
+
+def evaluate_z3_seq_prefix(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_SEQ_PREFIX:
+        return Nothing
+
+    return Some(
+        construct_result(
+            lambda args: cast(str, args[1]).startswith(cast(str, args[0])),
+            children_results,
+        )
+    )
+
+
+def evaluate_z3_seq_suffix(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_SEQ_SUFFIX:
+        return Nothing
+
+    return Some(
+        construct_result(
+            lambda args: cast(str, args[1]).endswith(cast(str, args[0])),
+            children_results,
+        )
+    )
+
+
+def evaluate_z3_seq_contains(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_SEQ_CONTAINS:
+        return Nothing
+
+    return Some(
+        construct_result(
+            lambda args: cast(str, args[1]) in cast(str, args[0]), children_results
+        )
+    )
+
+
+def evaluate_z3_seq_index(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_SEQ_INDEX:
+        return Nothing
+
+    def constructor(args):
+        string, substring = cast(str, args[0]), cast(str, args[1])
+        offset = cast(int, args[2]) if len(args) > 2 else 0
+        if not 0 <= offset <= len(string):
+            return -1
+        return string.find(substring, offset)
+
+    return Some(construct_result(constructor, children_results))
+
+
+def evaluate_z3_seq_replace(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_SEQ_REPLACE:
+        return Nothing
+
+    # Replaces the first occurrence. For an empty pattern, the replacement is
+    # prepended, both in Python and in SMT-LIB.
+    return Some(
+        construct_result(
+            lambda args: cast(str, args[0]).replace(
+                cast(str, args[1]), cast(str, args[2]), 1
+            ),
             children_results,
         )
     )
@@ -555,9 +766,53 @@ def evaluate_z3_str_to_code(
         len(children_results) == 1
     ), f"Unexpected argument length {len(children_results)}"
 
+    # As in SMT-LIB, the result is -1 for strings that are not single characters.
+    return Some(
+        construct_result(
+            lambda args: ord(args[0]) if len(args[0]) == 1 else -1,
+            children_results,
+        )
+    )
+
+
+def evaluate_z3_str_from_code(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_STR_FROM_CODE:
+        return Nothing
+
+    # Z3 supports the code points up to 0x2FFFF; for other values, the result is
+    # the empty string.
+    return Some(
+        construct_result(
+            lambda args: chr(args[0]) if 0 <= args[0] <= 0x2FFFF else "",
+            children_results,
+        )
+    )
+
+
+def evaluate_z3_int_to_str(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().kind() != z3.Z3_OP_INT_TO_STR:
+        return Nothing
+
+    return Some(
+        construct_result(
+            lambda args: str(args[0]) if args[0] >= 0 else "", children_results
+        )
+    )
+
+
+def evaluate_z3_str_is_digit(
+    expr: z3.ExprRef, children_results: Tuple[Z3EvalResult, ...]
+) -> Maybe[Z3EvalResult]:
+    if expr.decl().name() != "str.is_digit":
+        return Nothing
+
     return Some(
         construct_result(
-            lambda args: ord(args[0]),
+            lambda args: len(args[0]) == 1 and "0" <= args[0] <= "9",
             children_results,
         )
     )
@@ -576,30 +831,161 @@ def construct_result(
             tuple([child_result for _, child_result in children_results])
         )
 
+    # For each child, the positions of its parameters in `params`, or None if the
+    # child is a constant. Computed once, not for each instantiation.
+    children: Tuple[Tuple[Optional[Tuple[int, ...]], Any], ...] = tuple(
+        (
+            tuple(params.index(str(child_param)) for child_param in child_params)
+            if child_params
+            else None,
+            child_result,
+        )
+        for child_params, child_result in children_results
+    )
+
     def closure(var_insts: Tuple[str, ...]) -> bool | int | str:
         assert len(var_insts) == len(params)
-        instantiated_children_results: Tuple[bool | int | str, ...] = ()
-        for child_params, child_result in children_results:
-            if not child_params:
-                assert type(child_result) in {bool, int, str}
-                instantiated_children_results += (cast(bool | int | str, child_result),)
-                continue
-
-            instantiated_child_params: Tuple[str] = cast(Tuple[str], ())
-            for child_param in child_params:
-                instantiated_child_params += (
-                    var_insts[params.index(str(child_param))],
-                )
+        instantiated_children_results: Tuple[bool | int | str, ...] = tuple(
+            child_result
+            if param_indices is None
+            else child_result(tuple(var_insts[idx] for idx in param_indices))
+            for param_indices, child_result in children
+        )
 
-            eval_child_result = child_result(instantiated_child_params)
-            assert type(eval_child_result) in {bool, int, str}
-            instantiated_children_results += (eval_child_result,)
+        assert all(
+            type(child_result) in {bool, int, float, str}
+            for child_result in instantiated_children_results
+        )
 
         return constructor(instantiated_children_results)
 
     return params, closure
 
 
+def construct_lazy_result(
+    constructor: Callable[
+        [Tuple[Callable[[], bool | int | str], ...]], bool | int | str
+    ],
+    children_results: Tuple[Z3EvalResult, ...],
+) -> Z3EvalResult:
+    """
+    Like :func:`~isla.z3_helpers.construct_result`, but passes functions computing
+    the children's values to the constructor. Children whose values are not needed
+    (e.g., the branch of an :code:`ite` that is not taken) are thus not evaluated,
+    and cannot raise a :class:`~isla.z3_helpers.DomainError`.
+
+    :param constructor: Computes the result from the functions computing the
+        children's values.
+    :param children_results: The results for the children.
+    :return: The result.
+    """
+
+    params: Tuple[str, ...] = tuple(
+        set([param for child_params, _ in children_results for param in child_params])
+    )
+
+    def constant(value: bool | int | str) -> Callable[[], bool | int | str]:
+        return lambda: value
+
+    if not params:
+        return (), constructor(
+            tuple(constant(child_result) for _, child_result in children_results)
+        )
+
+    children: Tuple[Tuple[Optional[Tuple[int, ...]], Any], ...] = tuple(
+        (
+            tuple(params.index(str(child_param)) for child_param in child_params)
+            if child_params
+            else None,
+            child_result,
+        )
+        for child_params, child_result in children_results
+    )
+
+    def closure(var_insts: Tuple[str, ...]) -> bool | int | str:
+        assert len(var_insts) == len(params)
+
+        def instantiated(
+            param_indices: Optional[Tuple[int, ...]], child_result: Any
+        ) -> Callable[[], bool | int | str]:
+            if param_indices is None:
+                return constant(child_result)
+
+            return lambda: child_result(tuple(var_insts[idx] for idx in param_indices))
+
+        return constructor(
+            tuple(
+                instantiated(param_indices, child_result)
+                for param_indices, child_result in children
+            )
+        )
+
+    return params, closure
+
+
+@lru_cache(maxsize=1 << 14)
+def evaluate_z3_formula(
+    formula: z3.BoolRef, instantiation: Tuple[Tuple[str, str], ...] = ()
+) -> Maybe[ThreeValuedTruth]:
+    """
+    Evaluates an SMT formula natively, i.e., without calling Z3's solver or
+    constructing new Z3 expressions, for the given values of its (string) variables.
+    Results are cached for each formula and instantiation.
+
+    >>> x, y = z3.Strings("x y")
+    >>> formula = z3.And(
+    ...     z3.Length(x) > 1,
+    ...     z3.InRe(y, z3.Plus(z3.Range("0", "9"))),
+    ...     z3.PrefixOf(z3.SubString(x, 0, 1), y),
+    ... )
+    >>> evaluate_z3_formula(formula, (("x", "12"), ("y", "123")))
+    <Some: TRUE>
+    >>> evaluate_z3_formula(formula, (("x", "12"), ("y", "23")))
+    <Some: FALSE>
+
+    Values that are outside the domain of a function make the formula false.
+
+    >>> evaluate_z3_formula(z3.StrToInt(x) > 1, (("x", ""),))
+    <Some: FALSE>
+
+    Branches of conditionals and implications that are not taken are not evaluated.
+
+    >>> evaluate_z3_formula(
+    ...     z3.If(z3_eq(x, z3.StringVal("")), 0, z3.StrToInt(x)) >= 0, (("x", ""),))
+    <Some: TRUE>
+
+    If the formula contains uninstantiated variables or operations that cannot be
+    evaluated natively, the result is Nothing.
+
+    >>> evaluate_z3_formula(formula, (("x", "12"),))
+    <Nothing>
+
+    :param formula: The formula to evaluate.
+    :param instantiation: Pairs of variable names and their values.
+    :return: The truth value of the formula, or Nothing if the formula could not be
+        evaluated natively.
+    """
+
+    try:
+        translation = evaluate_z3_expression(formula)
+        if not is_successful(translation):
+            return Nothing
+
+        params, result = translation.unwrap()
+        if not params:
+            return Some(ThreeValuedTruth.from_bool(result))
+
+        values = dict(instantiation)
+        if any(param not in values for param in params):
+            return Nothing
+
+        return Some(
+            ThreeValuedTruth.from_bool(result(tuple(values[param] for param in params)))
+        )
+    except DomainError:
+        return Some(ThreeValuedTruth.false())
+
+
 def z3_solve(
     formulas: Iterable[z3.BoolRef], timeout_ms=500
 ) -> Tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
@@ -641,6 +1027,59 @@ def z3_solve(
     return result, model
 
 
+class IncrementalZ3Solver:
+    """
+    A Z3 solver session for solving the same base formulas repeatedly, each time
+    with some additional constraints (e.g., excluding previously found solutions).
+    The base formulas are asserted only once; :meth:`add` only asserts the new
+    constraint to the underlying Z3 solver, whose internal state (e.g., learned
+    lemmas) is retained between the calls of :meth:`check`.
+
+    >>> x = z3.Int("x")
+    >>> solver = IncrementalZ3Solver([x > 0, x < 3])
+    >>> result, model = solver.check()
+    >>> result
+    sat
+    >>> solver.add(x != model[x])
+    >>> result, other_model = solver.check()
+    >>> result
+    sat
+    >>> sorted([model[x].as_long(), other_model[x].as_long()])
+    [1, 2]
+    >>> solver.add(x != other_model[x])
+    >>> solver.check()
+    (unsat, None)
+
+    If the session yields an "unknown" result, we fall back to :func:`z3_solve`,
+    which retries with fresh solvers, different seeds, and a shuffled order of the
+    formulas.
+    """
+
+    def __init__(self, formulas: Iterable[z3.BoolRef], timeout_ms=500):
+        self.formulas: List[z3.BoolRef] = list(formulas)
+        self.timeout_ms = timeout_ms
+
+        self.solver = z3.Solver()
+        if timeout_ms is not None:
+            self.solver.set("timeout", timeout_ms)
+        for formula in self.formulas:
+            self.solver.add(formula)
+
+    def add(self, formula: z3.BoolRef) -> None:
+        self.formulas.append(formula)
+        self.solver.add(formula)
+
+    def check(self) -> Tuple[z3.CheckSatResult, Optional[z3.ModelRef]]:
+        result = self.solver.check()
+
+        if result == z3.sat:
+            return result, self.solver.model()
+        elif result == z3.unsat:
+            return result, None
+
+        return z3_solve(self.formulas, timeout_ms=self.timeout_ms)
+
+
 class DomainError(RuntimeError):
     def __init__(self, msg: str, *args):
         super().__init__(msg, *args)
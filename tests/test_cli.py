@@ -19,6 +19,7 @@
 import io
 import json
 import os
+import sqlite3
 import string
 import tempfile
 import unittest
@@ -156,6 +157,51 @@ exists <assgn> assgn:
         grammar_file_2.close()
         constraint_file.close()
 
+    def test_solve_assgn_lang_parallel(self):
+        grammar_file = write_grammar_file(LANG_GRAMMAR)
+
+        constraint = """
+exists <assgn> assgn:
+  (before(assgn, <assgn>) and <assgn>.<rhs>.<var> = assgn.<var>)"""
+        constraint_file = write_constraint_file(constraint)
+
+        stdout, stderr, code = run_isla(
+            "solve",
+            grammar_file.name,
+            constraint_file.name,
+            "-n",
+            10,
+            "-t",
+            10,
+            "--jobs",
+            2,
+        )
+
+        self.assertFalse(code)
+        self.assertFalse(stderr)
+
+        solutions = stdout.split("\n")
+        self.assertEqual(10, len(solutions))
+        self.assertEqual(len(solutions), len(set(solutions)))
+
+        solver = ISLaSolver(LANG_GRAMMAR, constraint)
+        for solution in solutions:
+            self.assertTrue(solver.check(solution))
+
+        grammar_file.close()
+        constraint_file.close()
+
+    def test_solve_nonpositive_jobs(self):
+        grammar_file = write_grammar_file(LANG_GRAMMAR)
+
+        stdout, stderr, code = run_isla("solve", grammar_file.name, "--jobs", 0)
+
+        self.assertEqual(2, code)
+        self.assertFalse(stdout)
+        self.assertIn("number of jobs must be positive", stderr)
+
+        grammar_file.close()
+
     def test_assgn_lang_no_constraint(self):
         grammar_file = write_grammar_file(LANG_GRAMMAR)
 
@@ -729,6 +775,92 @@ exists <assgn> assgn:
 
         out_dir.cleanup()
 
+    def test_fuzz_bash_jsonl_results(self):
+        self.fuzz_bash_batched_results_test("jsonl")
+
+    def test_fuzz_bash_sqlite_results(self):
+        self.fuzz_bash_batched_results_test("sqlite")
+
+    def fuzz_bash_batched_results_test(self, results_format: str):
+        constraint = 'forall <code>: not <code> = "0"'
+        out_dir = tempfile.TemporaryDirectory()
+        runs = 20
+
+        stdout, stderr, code = run_isla(
+            "fuzz",
+            "bash {}",
+            "-e",
+            ".sh",
+            "--grammar",
+            " ".join(echo_grammar.split("\n")),
+            "--constraint",
+            " ".join(constraint.split("\n")),
+            "-d",
+            out_dir.name,
+            "-n",
+            runs,
+            "--target-jobs",
+            3,
+            "--results",
+            results_format,
+        )
+
+        self.assertFalse(stdout)
+        self.assertFalse(stderr)
+        self.assertFalse(code)
+
+        self.assertEqual([f"results.{results_format}"], os.listdir(out_dir.name))
+        results_file = os.path.join(out_dir.name, f"results.{results_format}")
+        if results_format == "jsonl":
+            with open(results_file, encoding="utf-8") as file:
+                results = [
+                    tuple(json.loads(line)[key] for key in ["index", "input", "status"])
+                    for line in file
+                ]
+        else:
+            con = sqlite3.connect(results_file)
+            results = con.execute("SELECT id, input, status FROM results").fetchall()
+            con.close()
+
+        self.assertEqual(list(range(runs)), sorted(index for index, _, _ in results))
+
+        solver = ISLaSolver(echo_grammar, constraint)
+        for _, inp, status in results:
+            self.assertTrue(solver.check(inp))
+            exit_code = next(
+                (
+                    int(line[len("exit ") :])
+                    for line in inp.split("\n")
+                    if line.startswith("exit")
+                ),
+                0,
+            )
+            self.assertEqual(exit_code, status)
+
+        # The JSON lines results can be checked in batch mode.
+        if results_format == "jsonl":
+            stdout, stderr, code = run_isla(
+                "check",
+                "--grammar",
+                " ".join(echo_grammar.split("\n")),
+                "--constraint",
+                " ".join(constraint.split("\n")),
+                "--batch",
+                results_file,
+            )
+
+            self.assertFalse(stderr)
+            self.assertFalse(code)
+            self.assertEqual(
+                [
+                    f"{results_file}:{line}: input satisfies the ISLa constraint"
+                    for line in range(1, runs + 1)
+                ],
+                stdout.splitlines(),
+            )
+
+        out_dir.cleanup()
+
     def test_create(self):
         out_dir = tempfile.TemporaryDirectory()
 
@@ -971,6 +1103,98 @@ exists <assgn> assgn:
         self.assertFalse(stderr)
         self.assertTrue("input could not be parsed" in stdout)
 
+    def test_check_batch_dir(self):
+        grammar_file = write_grammar_file(LANG_GRAMMAR)
+
+        contents = ["x := 1", "a := 2 ; b := a", "x := 1 | a := x"]
+        with tempfile.TemporaryDirectory() as input_dir:
+            for idx, content in enumerate(contents):
+                with open(os.path.join(input_dir, f"{idx}.txt"), "w") as file:
+                    file.write(content + "\n")
+
+            stdout, stderr, code = run_isla(
+                "check",
+                "--constraint",
+                'exists <var>: <var> = "a"',
+                "--batch",
+                input_dir,
+                grammar_file.name,
+            )
+
+            self.assertEqual(1, code)
+            self.assertFalse(stderr)
+            self.assertEqual(
+                [
+                    f"{input_dir}/0.txt: input does not satisfy the ISLa constraint",
+                    f"{input_dir}/1.txt: input satisfies the ISLa constraint",
+                    f"{input_dir}/2.txt: input could not be parsed",
+                ],
+                stdout.splitlines(),
+            )
+
+    def test_check_batch_jsonl(self):
+        grammar_file = write_grammar_file(LANG_GRAMMAR)
+
+        inputs = [f"x := {i} ; a := x" for i in range(10)]
+        input_file = NamedTemporaryFile(suffix=".jsonl")
+        input_file.write(
+            "".join(
+                json.dumps(inp if i % 2 else {"input": inp, "status": 0}) + "\n"
+                for i, inp in enumerate(inputs)
+            ).encode("utf-8")
+        )
+        input_file.seek(0)
+
+        stdout, stderr, code = run_isla(
+            "check",
+            "--constraint",
+            'exists <var>: <var> = "a"',
+            "--batch",
+            input_file.name,
+            "--jobs",
+            "2",
+            grammar_file.name,
+        )
+
+        self.assertFalse(code)
+        self.assertFalse(stderr)
+        self.assertEqual(
+            [
+                f"{input_file.name}:{i}: input satisfies the ISLa constraint"
+                for i in range(1, 11)
+            ],
+            stdout.splitlines(),
+        )
+
+    def test_check_batch_jsonl_invalid_entries(self):
+        grammar_file = write_grammar_file(LANG_GRAMMAR)
+
+        for invalid_entry in ['{"status": 0}', '{"input": 42}', "42", "x := 1"]:
+            input_file = NamedTemporaryFile(suffix=".jsonl")
+            input_file.write(
+                (json.dumps("x := 1 ; a := x") + "\n" + invalid_entry + "\n").encode(
+                    "utf-8"
+                )
+            )
+            input_file.seek(0)
+
+            stdout, stderr, code = run_isla(
+                "check",
+                "--constraint",
+                'exists <var>: <var> = "a"',
+                "--batch",
+                input_file.name,
+                grammar_file.name,
+            )
+
+            self.assertEqual(DATA_FORMAT_ERROR, code)
+            self.assertEqual(
+                f"isla check: error: {input_file.name}:2: invalid batch entry", stderr
+            )
+            self.assertEqual(
+                f"{input_file.name}:1: input satisfies the ISLa constraint", stdout
+            )
+
     def test_find_assgn_files(self):
         grammar_file = write_grammar_file(LANG_GRAMMAR)
 
@@ -18,6 +18,7 @@
 
 import pickle
 import random
+import sys
 import unittest
 from typing import List
 
@@ -229,10 +230,66 @@ class TestDerivationTree(unittest.TestCase):
         self.assertTrue(other_tree.is_prefix(potential_prefix_tree))
         self.assertTrue(other_tree.is_potential_prefix(potential_prefix_tree))
 
+    def test_subtrees_with_value(self):
+        fuzzer = GrammarFuzzer(XML_GRAMMAR)
+        tree = fuzzer.expand_tree(DerivationTree("<start>", None))
+
+        for _ in range(10):
+            path, subtree = random.choice(
+                [(p, t) for p, t in tree.paths() if t.value in XML_GRAMMAR]
+            )
+            replacement = fuzzer.expand_tree(DerivationTree(subtree.value, None))
+            new_tree = tree.replace_path(path, replacement)
+
+            for value in XML_GRAMMAR:
+                for prefix in [(), path, path[:-1]]:
+                    self.assertEqual(
+                        [
+                            (p, t)
+                            for p, t in new_tree.paths()
+                            if t.value == value and p[: len(prefix)] == prefix
+                        ],
+                        new_tree.subtrees_with_value(value, prefix),
+                    )
+
+            tree = new_tree
+
     def test_find_start(self):
         tree = DerivationTree("<start>", id=1)
         self.assertEqual((), tree.find_node(1))
 
+    def test_find_nodes(self):
+        fuzzer = GrammarFuzzer(XML_GRAMMAR)
+        tree = fuzzer.expand_tree(DerivationTree("<start>", None))
+        self.assertTrue(tree.has_unique_ids())
+
+        for _ in range(10):
+            path, subtree = random.choice(
+                [(p, t) for p, t in tree.paths() if t.value in XML_GRAMMAR]
+            )
+            replacement = fuzzer.expand_tree(DerivationTree(subtree.value, None))
+            new_tree = tree.replace_path(path, replacement)
+
+            self.assertIsNone(new_tree.find_node(subtree))
+            self.assertEqual(path, tree.find_node(subtree))
+            self.assertEqual(
+                [p for p, _ in new_tree.paths()],
+                new_tree.find_nodes(t for _, t in new_tree.paths()),
+            )
+            self.assertTrue(new_tree.has_unique_ids())
+
+            tree = new_tree
+
+        duplicate = DerivationTree("<a>", [DerivationTree("<b>", id=1)] * 2)
+        self.assertTrue(duplicate.has_unique_ids())
+        self.assertEqual((0,), duplicate.find_node(1))
+
+        duplicate = DerivationTree(
+            "<a>", [DerivationTree("<b>", id=1), DerivationTree("<c>", id=1)]
+        )
+        self.assertFalse(duplicate.has_unique_ids())
+        self.assertEqual((0,), duplicate.find_node(1))
+
     def test_from_parse_tree(self):
         for _ in range(20):
             fuzzer = GrammarFuzzer(
@@ -502,6 +559,81 @@ digraph {
 
         self.assertEqual(expected, str(dtree.to_dot()))
 
+    def test_compact_representation(self):
+        tree = DerivationTree(
+            "<start>",
+            (
+                DerivationTree("<A>", (DerivationTree("a" * 50, ()),)),
+                DerivationTree("<A>", None),
+            ),
+        )
+
+        self.assertFalse(hasattr(tree, "__dict__"))
+        with self.assertRaises(AttributeError):
+            tree.some_attribute = 42
+
+        self.assertIs(tree.children[0].value, tree.children[1].value)
+        self.assertIs(sys.intern("".join(["a"] * 50)), tree.children[0].children[0].value)
+
+        for restored in [
+            DerivationTree.from_json(tree.to_json()),
+            pickle.loads(pickle.dumps(tree)),
+        ]:
+            self.assertTrue(tree.structurally_equal(restored))
+            self.assertEqual(tree.id, restored.id)
+            self.assertIs(tree.value, restored.value)
+            self.assertEqual(
+                [path for path, _ in tree.subtrees_with_value("<A>")],
+                [path for path, _ in restored.subtrees_with_value("<A>")],
+            )
+
+    def test_derived_data_after_replace_path(self):
+        grammar = canonical(XML_GRAMMAR)
+        fuzzer = GrammarFuzzer(XML_GRAMMAR)
+
+        tree = fuzzer.expand_tree(DerivationTree("<start>", None))
+        tree.paths()
+        tree.open_leaves()
+
+        for _ in range(20):
+            path, subtree = random.choice(
+                [(p, t) for p, t in tree.paths() if t.value in grammar]
+            )
+            if random.random() < 0.5:
+                replacement = DerivationTree(subtree.value, None)
+            else:
+                replacement = fuzzer.expand_tree(DerivationTree(subtree.value, None))
+
+            tree = tree.replace_path(path, replacement)
+            rebuilt = DerivationTree.from_parse_tree(tree.to_parse_tree())
+
+            self.assertEqual(
+                [(p, t.value) for p, t in rebuilt.paths()],
+                [(p, t.value) for p, t in tree.paths()],
+            )
+            self.assertTrue(all(tree.get_subtree(p) is t for p, t in tree.paths()))
+            self.assertEqual(
+                [p for p, _ in rebuilt.open_leaves()],
+                [p for p, _ in tree.open_leaves()],
+            )
+            self.assertEqual(len(rebuilt), len(tree))
+            self.assertEqual(rebuilt.structural_hash(), tree.structural_hash())
+
+    def test_replace_path_releases_original_tree(self):
+        tree = DerivationTree(
+            "<a>", [DerivationTree("<b>", None), DerivationTree("<c>", None)]
+        )
+        tree.paths()
+
+        expanded = tree.replace_path((0,), DerivationTree("<b>", []))
+        self.assertIsNotNone(expanded._DerivationTree__origin)
+
+        # The original tree has only cached its paths; once they are derived, the
+        # expanded tree does not need the original any more.
+        self.assertEqual(3, len(list(expanded.paths())))
+        self.assertIsNone(expanded._DerivationTree__origin)
+        self.assertEqual([(1,)], [path for path, _ in expanded.open_leaves()])
+
     def test_expand_one_step(self):
         grammar = canonical(
             {"<start>": ["<A>"], "<A>": ["<B><A>", "a<A>", "a"], "<B>": ["b"]}
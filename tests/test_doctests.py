@@ -11,6 +11,7 @@ from isla import (
     fuzzer,
     isla_predicates,
     isla_shortcuts,
+    k_path_index,
     language,
     optimizer,
     mutator,
@@ -57,6 +58,10 @@ class TestDocstrings(unittest.TestCase):
         doctest_results = doctest.testmod(m=isla_shortcuts)
         self.assertFalse(doctest_results.failed)
 
+    def test_k_path_index(self):
+        doctest_results = doctest.testmod(m=k_path_index)
+        self.assertFalse(doctest_results.failed)
+
     def test_language(self):
         doctest_results = doctest.testmod(m=language)
         self.assertFalse(doctest_results.failed)
@@ -31,6 +31,8 @@ from isla import language
 from isla.derivation_tree import DerivationTree
 from isla.evaluator import (
     evaluate,
+    evaluate_legacy,
+    compile_formula,
     matches_for_quantified_formula,
     quantified_formula_might_match,
     can_extend_leaf_to_make_quantifier_match_parent,
@@ -1042,6 +1044,66 @@ forall <assgn> assgn_1="{<var> lhs_1} := {<rhs> rhs_1}" in start:
             ),
         )
 
+    def test_compiled_formula_agrees_with_legacy_evaluation(self):
+        formula = parse_isla(
+            """
+forall <assgn> assgn_1="<var> := {<rhs> rhs_1}" in start:
+  forall <var> var in rhs_1:
+    exists <assgn> assgn_2="{<var> lhs_2} := <rhs>" in start:
+      (before(assgn_2, assgn_1) and (= lhs_2 var) and
+       not str.to.int(lhs_2) = 1)""",
+            LANG_GRAMMAR,
+            structural_predicates={BEFORE_PREDICATE},
+        )
+        start = next(iter(formula.free_variables()))
+
+        graph = gg.GrammarGraph.from_grammar(LANG_GRAMMAR)
+        compiled = compile_formula(formula, LANG_GRAMMAR, graph)
+
+        fuzzer = GrammarCoverageFuzzer(LANG_GRAMMAR)
+        parser = EarleyParser(LANG_GRAMMAR)
+        results = set()
+        for _ in range(30):
+            tree = DerivationTree.from_parse_tree(next(parser.parse(fuzzer.fuzz())))
+            for open_tree in [tree] + [
+                tree.replace_path(path, DerivationTree(subtree.value))
+                for path, subtree in tree.paths()
+                if subtree.value in ["<var>", "<rhs>"]
+            ]:
+                expected = evaluate_legacy(
+                    formula.substitute_expressions({start: open_tree}),
+                    LANG_GRAMMAR,
+                    {},
+                    open_tree,
+                    graph=graph,
+                )
+                result = compiled(
+                    {start: ((), open_tree)}, open_tree, open_tree.trie()
+                )
+
+                self.assertEqual(expected, result, str(open_tree))
+                results.add(result.val)
+
+        self.assertEqual(3, len(results))
+
+    def test_compiled_structural_predicate_with_tree_arguments(self):
+        tree = DerivationTree.from_parse_tree(
+            next(EarleyParser(LANG_GRAMMAR).parse("x := 1 ; y := x"))
+        )
+        assgn_1, assgn_2 = [
+            subtree for _, subtree in tree.paths() if subtree.value == "<assgn>"
+        ]
+
+        graph = gg.GrammarGraph.from_grammar(LANG_GRAMMAR)
+        for args, expected in [
+            ((assgn_1, assgn_2), ThreeValuedTruth.true()),
+            ((assgn_2, assgn_1), ThreeValuedTruth.false()),
+        ]:
+            compiled = compile_formula(
+                StructuralPredicateFormula(BEFORE_PREDICATE, *args), LANG_GRAMMAR, graph
+            )
+            self.assertEqual(expected, compiled({}, tree, tree.trie()))
+
     def test_scriptsize_c_defuse_property(self):
         constr = """
 forall <expr> expr in start:
@@ -21,7 +21,8 @@ import unittest
 from grammar_graph.gg import GrammarGraph
 
 from isla.derivation_tree import DerivationTree
-from isla.existential_helpers import insert_tree, insert_trees, SELF_EMBEDDING, CONTEXT_ADDITION, DIRECT_EMBEDDING
+from isla.existential_helpers import insert_tree, insert_trees, SELF_EMBEDDING, CONTEXT_ADDITION, DIRECT_EMBEDDING, \
+    self_embedding_nonterminals_reaching
 from isla.parser import EarleyParser
 from isla_formalizations import scriptsizec
 from isla_formalizations.xml_lang import XML_GRAMMAR, XML_GRAMMAR_WITH_NAMESPACE_PREFIXES
@@ -48,6 +49,28 @@ class TestExistentialHelpers(unittest.TestCase):
         results = insert_tree(canonical_grammar, to_insert, tree)
         self.assertIn("x := 1 ; y := 2 ; y := 0 ; y := z", map(str, results))
 
+    def test_self_embedding_nonterminals_reaching(self):
+        graph = GrammarGraph.from_grammar(LANG_GRAMMAR)
+        self.assertEqual({"<stmt>"}, self_embedding_nonterminals_reaching(graph, "<assgn>"))
+        self.assertEqual({"<stmt>"}, self_embedding_nonterminals_reaching(graph, "<digit>"))
+        self.assertEqual(set(), self_embedding_nonterminals_reaching(graph, "<start>"))
+
+    def test_insert_lang_max_num_solutions(self):
+        canonical_grammar = canonical(LANG_GRAMMAR)
+        tree = DerivationTree.from_parse_tree(parse("x := 1 ; y := 2 ; z := 3", LANG_GRAMMAR))
+        to_insert = DerivationTree("<assgn>", None)
+
+        all_results = insert_tree(canonical_grammar, to_insert, tree, max_num_solutions=None)
+        self.assertTrue(all(result.find_node(to_insert) is not None for result in all_results))
+
+        # Results are computed lazily up to the maximum number of solutions, but in the
+        # same order as without that limit.
+        results = insert_tree(canonical_grammar, to_insert, tree, max_num_solutions=2)
+        self.assertLess(len(results), len(all_results))
+        self.assertEqual(
+            [str(result) for result in all_results[:len(results)]],
+            [str(result) for result in results])
+
     def test_insert_lang_2(self):
         inserted_tree = DerivationTree('<assgn>', (
             DerivationTree('<var>', None),
@@ -26,6 +26,7 @@ import pytest
 import z3
 from grammar_graph.gg import GrammarGraph
 from returns.maybe import Some
+from returns.pipeline import is_successful
 
 from isla.existential_helpers import path_to_tree, paths_between
 from isla.helpers import (
@@ -52,6 +53,7 @@ from isla.solver import ISLaSolver
 from isla.type_defs import Grammar, ParseTree
 from isla.z3_helpers import (
     evaluate_z3_expression,
+    evaluate_z3_formula,
     z3_eq,
     smt_expr_to_str,
     DomainError,
@@ -296,6 +298,76 @@ class TestHelpers(unittest.TestCase):
         assgn = {"a": "a", "b": "b", "c": "c"}
         self.assertFalse(eval_result[1](tuple([assgn[var] for var in vars])))
 
+    def test_evaluate_z3_formula_agrees_with_z3(self):
+        x, y = z3.Strings("x y")
+        n = z3.Int("n")
+
+        formulas = [
+            z3_eq(z3.SubString(x, 1, 2), y),
+            z3_eq(z3.SubString(x, -1, 2), y),
+            z3_eq(z3.SubString(x, 1, -2), y),
+            z3_eq(z3.SubString(x, 2, 5), y),
+            z3_eq(z3.SubSeq(x, 0, 1), y),
+            z3_eq(z3.StrFromCode(z3.StrToCode(y)), y),
+            z3_eq(x.at(1), y),
+            z3_eq(x.at(7), y),
+            z3.PrefixOf(y, x),
+            z3.SuffixOf(y, x),
+            z3.Contains(x, y),
+            z3_eq(z3.IndexOf(x, y, 1), 2),
+            z3_eq(z3.IndexOf(x, y, 0), -1),
+            z3_eq(z3.Replace(x, y, "-"), "a-"),
+            z3_eq(z3.Replace(x, "", y), z3.Concat(y, x)),
+            z3_eq(z3.IntToStr(z3.Length(x) - 3), ""),
+            z3_eq(z3.IntToStr(z3.Length(x)), "3"),
+            x < y,
+            x <= y,
+            z3.Distinct(x, y, z3.StringVal("b")),
+            z3.Implies(z3.Length(x) > 2, z3.Length(y) < 2),
+            z3_eq(z3.If(z3.Length(x) > 2, x, y), "abc"),
+            -z3.Length(x) < -2,
+            z3_eq(z3.Length(x) / 2, 1),
+            z3_eq((-z3.Length(x)) / 2, -2),
+            z3_eq(z3.Length(x) % 2, 1),
+            z3_eq((-z3.Length(x)) % 2, 1),
+            z3_eq((-z3.Length(x)) % -2, 1),
+            z3.InRe(x, z3.Star(z3.AllChar(z3.ReSort(z3.StringSort())))),
+            z3.InRe(x, z3.Concat(z3.Re("a"), z3.Full(z3.ReSort(z3.StringSort())))),
+            z3.InRe(x, z3.Empty(z3.ReSort(z3.StringSort()))),
+            z3.Length(x) ** 2 + z3.Length(y) ** 2 <= 10,
+        ]
+
+        for formula in formulas:
+            for x_val, y_val in itertools.product(["abc", "a\nb", ""], ["b", "bc"]):
+                solver = z3.Solver()
+                solver.add(
+                    z3.Not(
+                        z3.substitute(
+                            formula,
+                            (x, z3.StringVal(x_val)),
+                            (y, z3.StringVal(y_val)),
+                        )
+                    )
+                )
+                self.assertEqual(
+                    solver.check() == z3.unsat,
+                    evaluate_z3_formula(formula, (("x", x_val), ("y", y_val)))
+                    .unwrap()
+                    .to_bool(),
+                    f"{formula} for x={repr(x_val)}, y={repr(y_val)}",
+                )
+
+        # Variables that are not instantiated and operations that cannot be evaluated
+        # natively result in Nothing.
+        self.assertFalse(is_successful(evaluate_z3_formula(z3.Length(x) > n, ())))
+        self.assertFalse(
+            is_successful(
+                evaluate_z3_formula(
+                    z3.InRe(x, z3.Intersect(z3.Re("a"), z3.Re("b"))), (("x", "a"),)
+                )
+            )
+        )
+
     def test_eliminate_suffixes(self):
         self.assertEqual([(0,), (0,)], eliminate_suffixes([(0,), (0,)]))
 
@@ -382,6 +454,27 @@ class TestHelpers(unittest.TestCase):
         except DomainError as err:
             self.assertIn("Empty string cannot be converted to int", str(err))
 
+    def test_evaluate_guarded_str_to_int(self):
+        x = z3.String("x")
+        formulas = [
+            z3.If(z3_eq(x, z3.StringVal("")), 0, z3.StrToInt(x)) >= 0,
+            z3.Implies(z3.Not(z3_eq(x, z3.StringVal(""))), z3.StrToInt(x) >= 0),
+            z3.Or(z3_eq(x, z3.StringVal("")), z3.StrToInt(x) >= 0),
+            z3.Not(z3.And(z3.Not(z3_eq(x, z3.StringVal(""))), z3.StrToInt(x) < 0)),
+        ]
+
+        for formula in formulas:
+            for x_val in ["", "17"]:
+                self.assertTrue(
+                    evaluate_z3_formula(formula, (("x", x_val),)).unwrap().to_bool(),
+                    f"{formula} for x={repr(x_val)}",
+                )
+
+        # Unguarded conversions of the empty string still evaluate to false.
+        self.assertFalse(
+            evaluate_z3_formula(z3.StrToInt(x) >= 0, (("x", ""),)).unwrap().to_bool()
+        )
+
     @pytest.mark.skip("Temporarily skipped until solver is fixed")  # TODO
     def test_numeric_intervals_from_regex_grammar_supported(self):
         doclines = numeric_intervals_from_regex.__doc__.split("\n")
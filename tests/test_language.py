@@ -17,13 +17,15 @@
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
 import copy
+import pickle
 import random
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 import z3
 from grammar_graph import gg
-from orderedset import OrderedSet
+from orderedset import FrozenOrderedSet, OrderedSet
 
 import isla.isla_shortcuts as sc
 from isla import language
@@ -37,6 +39,7 @@ from isla.isla_predicates import (
     SAME_POSITION_PREDICATE,
 )
 from isla.isla_predicates import count, COUNT_PREDICATE
+from isla.k_path_index import k_path_index
 from isla.language import (
     Constant,
     BoundVariable,
@@ -57,7 +60,7 @@ from isla.language import (
 )
 from isla.parser import EarleyParser
 from isla.z3_helpers import z3_eq
-from isla_formalizations import rest, scriptsizec, tar
+from isla_formalizations import rest, scriptsizec, tar, xml_lang
 from isla_formalizations.csv import CSV_GRAMMAR, CSV_COLNO_PROPERTY
 from isla_formalizations.scriptsizec import (
     SCRIPTSIZE_C_DEF_USE_CONSTR_TEXT,
@@ -537,6 +540,71 @@ class TestLanguage(unittest.TestCase):
         tree = DerivationTree("<rhs>", (DerivationTree("<var>"),))
         self.assertTrue(bind_expression.match(tree, LANG_GRAMMAR))
 
+    def test_bind_expr_match_agrees_with_match(self):
+        random.seed(0)
+
+        for grammar, formula in [
+            (
+                XML_GRAMMAR_WITH_NAMESPACE_PREFIXES,
+                xml_lang.XML_WELLFORMEDNESS_CONSTRAINT
+                & xml_lang.XML_NAMESPACE_CONSTRAINT
+                & xml_lang.XML_NO_ATTR_REDEF_CONSTRAINT,
+            ),
+            (
+                scriptsizec.SCRIPTSIZE_C_GRAMMAR,
+                scriptsizec.SCRIPTSIZE_C_DEF_USE_CONSTR
+                & scriptsizec.SCRIPTSIZE_C_NO_REDEF_CONSTR,
+            ),
+        ]:
+            quantified_formulas = language.FilterVisitor(
+                lambda f: isinstance(f, language.QuantifiedFormula)
+                and f.bind_expression is not None
+            ).collect(formula)
+            self.assertTrue(quantified_formulas)
+
+            fuzzer = GrammarCoverageFuzzer(grammar)
+            for _ in range(10):
+                tree = DerivationTree.from_parse_tree(fuzzer.fuzz_tree())
+
+                for quantified_formula in quantified_formulas:
+                    bind_expression = quantified_formula.bind_expression
+                    for _, subtree in tree.filter(
+                        lambda t: t.value == quantified_formula.bound_variable.n_type
+                    ):
+                        expected = next(
+                            (
+                                possible_match
+                                for mexpr_tree, mexpr_var_paths in (
+                                    bind_expression.to_tree_prefix(
+                                        subtree.value, grammar
+                                    )
+                                )
+                                if (
+                                    possible_match := match(
+                                        subtree, mexpr_tree, mexpr_var_paths
+                                    )
+                                )
+                            ),
+                            None,
+                        )
+
+                        def normalize(result):
+                            return result and [
+                                (
+                                    var.n_type
+                                    if isinstance(var, DummyVariable)
+                                    else var,
+                                    path,
+                                    matched_tree,
+                                )
+                                for var, (path, matched_tree) in result.items()
+                            ]
+
+                        self.assertEqual(
+                            normalize(expected),
+                            normalize(bind_expression.match(subtree, grammar)),
+                        )
+
     def test_match_expr_match_xml(self):
         match_expression = BindExpression(
             "<",
@@ -645,6 +713,27 @@ class TestLanguage(unittest.TestCase):
         # "<xml-close-tag>"
         self.assertIn(tree.find_node(1087), match_paths)
 
+    def test_match_paths_cache_checks_matched_trees(self):
+        bind_expression = BindExpression(BoundVariable("x", "<b>"))
+        grammar = {
+            "<start>": ["<a>"],
+            "<a>": ["<b>", "<c>"],
+            "<b>": ["1"],
+            "<c>": ["1"],
+        }
+
+        matching_tree = DerivationTree.from_parse_tree(("<a>", [("<b>", [("1", [])])]))
+        other_tree = DerivationTree.from_parse_tree(("<a>", [("<c>", [("1", [])])]))
+        self.assertTrue(bind_expression.match_paths(matching_tree, grammar))
+
+        # A collision of structural hashes does not return the cached result.
+        other_tree._DerivationTree__structural_hash = matching_tree.structural_hash()
+        self.assertIsNone(bind_expression.match_paths(other_tree, grammar))
+        self.assertEqual(
+            bind_expression.match_paths(matching_tree, grammar),
+            bind_expression.match_paths(matching_tree.new_ids(), dict(grammar)),
+        )
+
     def test_tree_k_paths(self):
         graph = gg.GrammarGraph.from_grammar(scriptsizec.SCRIPTSIZE_C_GRAMMAR)
 
@@ -683,6 +772,47 @@ class TestLanguage(unittest.TestCase):
                     f"Paths for tree {tree} differ",
                 )
 
+    def test_concrete_tree_k_paths(self):
+        graph = gg.GrammarGraph.from_grammar(scriptsizec.SCRIPTSIZE_C_GRAMMAR)
+
+        fuzzer = GrammarCoverageFuzzer(scriptsizec.SCRIPTSIZE_C_GRAMMAR)
+        for i in range(20):
+            tree = DerivationTree("<start>")
+            for _ in range(random.randint(1, 10)):
+                tree = fuzzer.expand_tree_once(tree)
+
+            # Requesting the largest k first computes the paths for all smaller k.
+            for k in reversed(range(1, 5)):
+                self.assertEqual(
+                    graph.k_paths_in_tree(
+                        tree, k, include_potential_paths=False, include_terminals=False
+                    ),
+                    tree.k_paths(graph, k, include_potential_paths=False),
+                    f"Paths for tree {tree} differ",
+                )
+
+    def test_k_path_bits(self):
+        graph = gg.GrammarGraph.from_grammar(scriptsizec.SCRIPTSIZE_C_GRAMMAR)
+
+        fuzzer = GrammarCoverageFuzzer(scriptsizec.SCRIPTSIZE_C_GRAMMAR)
+        for k in range(1, 4):
+            index = k_path_index(graph, k)
+            all_paths = graph.k_paths(k, include_terminals=False)
+            for i in range(10):
+                tree = DerivationTree("<start>")
+                for _ in range(random.randint(1, 10)):
+                    tree = fuzzer.expand_tree_once(tree)
+
+                for include_potential_paths in [True, False]:
+                    tree_paths = tree.k_paths(graph, k, include_potential_paths)
+                    bits = tree.k_path_bits(graph, k, include_potential_paths)
+
+                    self.assertEqual(tree_paths & all_paths, index.from_bits(bits))
+                    self.assertEqual(
+                        len(tree_paths & all_paths) / len(all_paths),
+                        tree.k_coverage(graph, k, include_potential_paths),
+                    )
+
     def test_open_tree_paths_replace(self):
         graph = gg.GrammarGraph.from_grammar(scriptsizec.SCRIPTSIZE_C_GRAMMAR)
 
@@ -858,6 +988,195 @@ forall <xml-tree> tree="<<id>><inner-xml-tree></<id>>" in start:
 
         pickle.dumps(constraint)
 
+    def test_formulas_are_interned(self):
+        constraint_text = """
+forall <xml-tree> tree="<<id>><inner-xml-tree></<id>>" in start:
+    (= tree "<a></a>")
+"""
+        x = Constant("x", "<x>")
+        a = SMTFormula(z3_eq(x.to_smt(), z3.StringVal("a")), x)
+        b = SMTFormula(z3_eq(x.to_smt(), z3.StringVal("b")), x)
+        c = SMTFormula(z3_eq(x.to_smt(), z3.StringVal("c")), x)
+
+        self.assertIs(a, SMTFormula(z3_eq(x.to_smt(), z3.StringVal("a")), x))
+        self.assertIs(a & -b, a & -b)
+        self.assertIsNot(
+            a, SMTFormula(z3_eq(x.to_smt(), z3.StringVal("a")), x, auto_eval=False)
+        )
+
+        # Universal formulas with different IDs are equal, but not shared.
+        constraint = parse_isla(constraint_text, XML_GRAMMAR_WITH_NAMESPACE_PREFIXES)
+        other_constraint = parse_isla(
+            constraint_text, XML_GRAMMAR_WITH_NAMESPACE_PREFIXES
+        )
+        self.assertEqual(constraint, other_constraint)
+        self.assertIsNot(constraint, other_constraint)
+
+        # Nested conjunctions are equal to their flattened versions; this must be
+        # reflected by their hashes.
+        self.assertEqual((a & b) & c, a & (b & c))
+        self.assertEqual(hash((a & b) & c), hash(a & (b & c)))
+        self.assertNotEqual(hash((a & b) & c), hash((a & c) & b))
+
+        # Setting the auto_eval flag does not affect shared formulas.
+        self.assertIsNot(a, language.set_smt_auto_eval(a, False))
+        self.assertFalse(language.set_smt_auto_eval(a, False).auto_eval)
+        self.assertTrue(a.auto_eval)
+
+        # Cached hashes are not pickled.
+        unpickled = pickle.loads(pickle.dumps(a & -b))
+        self.assertEqual(a & -b, unpickled)
+        self.assertFalse(
+            any(
+                attribute.startswith(language.FORMULA_CACHE_PREFIX)
+                for attribute in (a & -b).__getstate__()
+            )
+        )
+
+    def test_formulas_with_same_named_predicates_are_not_shared(self):
+        x = Constant("x", "<x>")
+        p1 = language.SemanticPredicate("p", 1, lambda graph, x, negate=False: True)
+        p2 = language.SemanticPredicate("p", 1, lambda graph, x, negate=False: False)
+
+        a = language.SemanticPredicateFormula(p1, x)
+        b = language.SemanticPredicateFormula(p2, x)
+        self.assertEqual(a, b)
+        self.assertIsNot(a, b)
+        self.assertIs(p2, b.predicate)
+        self.assertIs(a, language.SemanticPredicateFormula(p1, x))
+
+        q1 = language.StructuralPredicate("q", 1, lambda tree, path: True)
+        q2 = language.StructuralPredicate("q", 1, lambda tree, path: False)
+        self.assertIs(q2, language.StructuralPredicateFormula(q2, x).predicate)
+        self.assertIsNot(
+            language.StructuralPredicateFormula(q1, x),
+            language.StructuralPredicateFormula(q2, x),
+        )
+
+    def test_parsed_formulas_are_cached(self):
+        def parse():
+            return parse_isla(
+                SCRIPTSIZE_C_DEF_USE_CONSTR_TEXT,
+                scriptsizec.SCRIPTSIZE_C_GRAMMAR,
+                structural_predicates={
+                    BEFORE_PREDICATE,
+                    LEVEL_PREDICATE,
+                    SAME_POSITION_PREDICATE,
+                },
+            )
+
+        formula = parse()
+        other_formula = parse()
+        self.assertEqual(formula, other_formula)
+
+        # Universal quantifiers get fresh IDs, as if the formula was parsed again.
+        def forall_ids(f: Formula):
+            return [
+                sub_formula.id
+                for sub_formula in language.FilterVisitor(
+                    lambda sub_formula: isinstance(sub_formula, language.ForallFormula)
+                ).collect(f)
+            ]
+
+        self.assertTrue(forall_ids(formula))
+        self.assertTrue(set(forall_ids(formula)).isdisjoint(forall_ids(other_formula)))
+
+        # Serialized formulas are loaded with the given predicates.
+        loaded_formula = language.deserialize_isla(
+            language.serialize_isla(formula),
+            structural_predicates={
+                BEFORE_PREDICATE,
+                LEVEL_PREDICATE,
+                SAME_POSITION_PREDICATE,
+            },
+        )
+        self.assertEqual(formula, loaded_formula)
+        self.assertTrue(set(forall_ids(formula)).isdisjoint(forall_ids(loaded_formula)))
+
+    def test_parsed_formulas_with_same_named_predicates_are_not_shared(self):
+        p1 = language.SemanticPredicate("p", 1, lambda graph, x, negate=False: True)
+        p2 = language.SemanticPredicate("p", 1, lambda graph, x, negate=False: False)
+
+        f1 = parse_isla("forall <var> v in start: p(v)", semantic_predicates={p1})
+        f2 = parse_isla("forall <var> v in start: p(v)", semantic_predicates={p2})
+        self.assertEqual(f1, f2)
+        self.assertIs(p1, f1.inner_formula.predicate)
+        self.assertIs(p2, f2.inner_formula.predicate)
+
+    def test_smt_formula_with_flags(self):
+        x = Constant("x", "<x>")
+        a = SMTFormula(z3_eq(x.to_smt(), z3.StringVal("a")), x)
+
+        without_eval = a.with_flags(auto_eval=False)
+        self.assertFalse(without_eval.auto_eval)
+        self.assertTrue(without_eval.auto_subst)
+        self.assertIs(a.formula, without_eval.formula)
+        self.assertIs(a, a.with_flags())
+
+        self.assertEqual(a, SMTFormula('(= x "a")', x))
+        self.assertEqual(a, pickle.loads(pickle.dumps(a)))
+        self.assertFalse(a.is_true or a.is_false)
+
+    def test_substitute_expressions_keeps_unaffected_subformulas(self):
+        x = Constant("x", "<var>")
+        y = Constant("y", "<var>")
+
+        x_is_a = SMTFormula(z3_eq(x.to_smt(), z3.StringVal("a")), x)
+        y_is_b = SMTFormula(z3_eq(y.to_smt(), z3.StringVal("b")), y)
+        formula = x_is_a & -y_is_b
+
+        # Substituting variables not occurring in a sub-formula leaves it untouched.
+        result = formula.substitute_expressions({y: DerivationTree("<var>")})
+        self.assertIs(x_is_a, language.split_conjunction(result)[0])
+
+        # Substituting a tree only changes the formulas containing it.
+        var_1 = DerivationTree("<var>")
+        var_2 = DerivationTree("<var>")
+        x_in_tree = SMTFormula(
+            z3_eq(x.to_smt(), z3.StringVal("a")),
+            instantiated_variables=FrozenOrderedSet([x]),
+            substitutions={x: var_1},
+        )
+        y_in_tree = SMTFormula(
+            z3_eq(y.to_smt(), z3.StringVal("b")),
+            instantiated_variables=FrozenOrderedSet([y]),
+            substitutions={y: var_2},
+        )
+        formula = x_in_tree & -y_in_tree
+
+        self.assertIs(
+            formula, formula.substitute_expressions({DerivationTree("<var>"): var_1})
+        )
+
+        new_var_2 = DerivationTree("<var>", [DerivationTree("<digit>")], id=var_2.id)
+        result = formula.substitute_expressions({var_2: new_var_2})
+        self.assertIs(x_in_tree, language.split_conjunction(result)[0])
+        self.assertEqual(
+            new_var_2, language.split_conjunction(result)[1].substitutions[y]
+        )
+
+    def test_substitute_expressions_in_threads(self):
+        x = Constant("x", "<var>")
+        y = Constant("y", "<var>")
+        formula = SMTFormula(z3_eq(x.to_smt(), y.to_smt()), x, y) & SMTFormula(
+            z3_eq(y.to_smt(), z3.StringVal("a")), y
+        )
+
+        def substitute(value: str) -> str:
+            results = set()
+            for _ in range(50):
+                result = formula.substitute_expressions(
+                    {y: DerivationTree("<var>", [DerivationTree(value, [])])}
+                )
+                results.add(str(result))
+            return "; ".join(results)
+
+        values = list("abcdefgh")
+        with ThreadPoolExecutor(max_workers=len(values)) as executor:
+            results = list(executor.map(substitute, values))
+
+        self.assertEqual([substitute(value) for value in values], results)
+
     def test_match(self):
         # We assume a match expression `{<var> lhs} := {<var> rhs} ; <assgn>` for the assignment language.
         lhs = BoundVariable("<lhs>", "<var>")
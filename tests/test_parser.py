@@ -16,12 +16,19 @@
 # You should have received a copy of the GNU General Public License
 # along with ISLa.  If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
+import mmap
+import random
+import tempfile
 import unittest
 
 from isla.fuzzer import GrammarCoverageFuzzer
 from isla.helpers import tree_to_string
 from isla.derivation_tree import DerivationTree
-from isla.parser import EarleyParser, EnhancedExtractor
+from isla.parser import EarleyParser, EnhancedExtractor, IndexedEarleyParser, \
+    IncrementalEarleyRecognizer
+from isla_formalizations import scriptsizec, rest
+from isla_formalizations.csv import CSV_GRAMMAR
 from test_data import LANG_GRAMMAR
 
 
@@ -33,6 +40,98 @@ class TestParser(unittest.TestCase):
             tree = fuzzer.expand_tree(DerivationTree('<start>')).to_parse_tree()
             self.assertEqual(tree, EnhancedExtractor(parser, tree_to_string(tree)).extract_a_tree())
 
+    def test_indexed_earley_parser_lang(self):
+        parser = IndexedEarleyParser(LANG_GRAMMAR)
+        fuzzer = GrammarCoverageFuzzer(LANG_GRAMMAR)
+        for _ in range(100):
+            tree = fuzzer.expand_tree(DerivationTree('<start>')).to_parse_tree()
+            self.assertEqual(tree, EnhancedExtractor(parser, tree_to_string(tree)).extract_a_tree())
+
+    def test_indexed_earley_parser_same_trees(self):
+        ambiguous_grammar = {
+            "<start>": ["<e>"],
+            "<e>": ["<e>+<e>", "<e><e>", "a", "", "<n>"],
+            "<n>": ["<n>", "b"],
+        }
+
+        for grammar in [
+            CSV_GRAMMAR,
+            rest.REST_GRAMMAR,
+            scriptsizec.SCRIPTSIZE_C_GRAMMAR,
+            ambiguous_grammar,
+        ]:
+            parser = EarleyParser(grammar)
+            indexed_parser = IndexedEarleyParser(grammar)
+            fuzzer = GrammarCoverageFuzzer(grammar, max_nonterminals=15)
+            for _ in range(10):
+                inp = str(fuzzer.expand_tree(DerivationTree('<start>')))
+                self.assertEqual(
+                    list(itertools.islice(parser.parse(inp), 5)),
+                    list(itertools.islice(indexed_parser.parse(inp), 5)))
+
+    def test_parse_first_ambiguous_grammar(self):
+        grammar = {"<start>": ["<e>"], "<e>": ["<e><e>", "a"]}
+        inp = "a" * 60
+
+        parser = IndexedEarleyParser(grammar)
+        first_tree = parser.parse_first(inp)
+        self.assertEqual(first_tree, next(parser.parse(inp)))
+        self.assertEqual(inp, tree_to_string(first_tree))
+
+        trees = list(itertools.islice(parser.parse(inp), 100))
+        self.assertEqual(100, len({str(tree) for tree in trees}))
+        self.assertTrue(all(tree_to_string(tree) == inp for tree in trees))
+
+    def test_parse_first_cyclic_grammar(self):
+        grammar = {"<start>": ["<a>"], "<a>": ["<a>", "<b>"], "<b>": ["<a>", "b"]}
+        self.assertEqual(
+            ('<start>', [('<a>', [('<b>', [('b', [])])])]),
+            IndexedEarleyParser(grammar).parse_first("b"))
+
+    def test_incremental_recognizer(self):
+        for grammar in [LANG_GRAMMAR, CSV_GRAMMAR]:
+            parser = IndexedEarleyParser(grammar)
+            fuzzer = GrammarCoverageFuzzer(grammar)
+            for _ in range(20):
+                inp = str(fuzzer.expand_tree(DerivationTree('<start>')))
+                if random.random() < 0.5:
+                    idx = random.randrange(len(inp))
+                    inp = inp[:idx] + random.choice(inp) + inp[idx + 1:]
+
+                recognizer = IncrementalEarleyRecognizer(parser)
+                for idx in range(0, len(inp), 3):
+                    recognizer.feed(inp[idx:idx + 3])
+                accepted = recognizer.finish()
+
+                try:
+                    parser.parse_first(inp)
+                    self.assertTrue(accepted)
+                except SyntaxError:
+                    self.assertFalse(accepted)
+
+                if recognizer.accepted_prefix_length >= 0:
+                    parser.parse_first(inp[:recognizer.accepted_prefix_length])
+
+    def test_incremental_recognizer_mmap(self):
+        rows = "\n".join(f"a{idx};b;c" for idx in range(2000)) + "\n"
+        with tempfile.NamedTemporaryFile() as file:
+            file.write((rows + 'x;"y"z\n').encode("utf-8"))
+            file.flush()
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                recognizer = IncrementalEarleyRecognizer(
+                    IndexedEarleyParser(CSV_GRAMMAR))
+                self.assertFalse(recognizer.feed_stream(mapped, chunk_size=1000))
+
+        self.assertEqual(len(rows), recognizer.accepted_prefix_length)
+        self.assertEqual(len(rows) + 5, recognizer.viable_prefix_length)
+
+    def test_indexed_earley_parser_syntax_error(self):
+        for parser in [EarleyParser(LANG_GRAMMAR), IndexedEarleyParser(LANG_GRAMMAR)]:
+            with self.assertRaises(SyntaxError) as context:
+                next(parser.parse("x := 1 ; y := z ;"))
+            self.assertEqual("at ' ;'", str(context.exception))
+
 
 if __name__ == '__main__':
     unittest.main()
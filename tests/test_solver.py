@@ -23,9 +23,12 @@ import os
 import random
 import string
 import sys
+import tempfile
+import time
 import unittest
 from datetime import datetime
 from typing import cast, Optional, Dict, List, Callable, Union, Set
+from unittest import mock
 from xml.dom import minidom
 from xml.sax.saxutils import escape
 
@@ -67,7 +70,7 @@ from isla.language import (
     SemPredEvalResult,
     parse_bnf,
 )
-from isla.parser import EarleyParser, PEGParser
+from isla.parser import EarleyParser, PEGParser, earley_parser
 from isla.solver import (
     ISLaSolver,
     SolutionState,
@@ -85,6 +88,7 @@ from isla.solver import (
     smt_formulas_referring_to_subtrees,
     SolverDefaults,
 )
+from isla.three_valued_truth import ThreeValuedTruth
 from isla.type_defs import Grammar, ImmutableList
 from isla.z3_helpers import z3_eq, smt_string_val_to_string
 from isla_formalizations import rest, tar, simple_tar, scriptsizec
@@ -217,6 +221,32 @@ class TestSolver(unittest.TestCase):
 
         self.execute_generation_test(formula)
 
+    def test_disjunctions_are_split_lazily(self):
+        formula = " and ".join(
+            f'((forall <var> v in start: not (= v "{var}")) or '
+            + f'(forall <digit> d in start: not (= d "{digit}")))'
+            for var, digit in ["a1", "b2", "c3"]
+        )
+
+        # Instead of 8 initial states, there are two states with the remaining
+        # disjunctions, which are split when the states are processed.
+        solver = ISLaSolver(LANG_GRAMMAR, formula, max_dnf_disjuncts=2)
+        self.assertEqual(2, len(solver.queue))
+        for _, state in solver.queue:
+            self.assertEqual(
+                2,
+                len(
+                    [
+                        conjunct
+                        for conjunct in language.split_conjunction(state.constraint)
+                        if isinstance(conjunct, language.DisjunctiveFormula)
+                    ]
+                ),
+            )
+
+        for _ in range(3):
+            self.assertTrue(solver.check(solver.solve()))
+
     def test_xml(self):
         constraint = """
 forall <xml-tree> tree="<{<id> opid}[ <xml-attribute>]><inner-xml-tree></{<id> clid}>" in start:
@@ -348,6 +378,67 @@ forall <assgn> assgn_1="<var> := {<var> rhs}" in start:
             num_solutions=50,
         )
 
+    def test_declared_before_used_parallel(self):
+        formula = """
+forall <assgn> assgn_1="<var> := {<var> rhs}" in start:
+  exists <assgn> assgn_2="{<var> lhs} := <rhs>" in start:
+    (before(assgn_2, assgn_1) and (= lhs rhs))
+"""
+
+        solver = ISLaSolver(
+            LANG_GRAMMAR,
+            formula,
+            max_number_free_instantiations=1,
+            workers=3,
+        )
+
+        solutions: List[DerivationTree] = []
+        try:
+            while len(solutions) < 20:
+                solutions.append(solver.solve())
+        finally:
+            solver.terminate_workers()
+
+        self.assertEqual(20, len(solutions))
+        self.assertEqual(
+            len(solutions), len({solution.structural_hash() for solution in solutions})
+        )
+        self.assertTrue(all(solver.check(solution) for solution in solutions))
+
+    def test_solutions_generator(self):
+        solver = ISLaSolver(LANG_GRAMMAR, max_number_free_instantiations=10)
+
+        solutions = solver.solutions(limit=5, as_strings=True)
+        self.assertEqual(5, len(list(solutions)))
+
+        # Closing the generator cancels the search; it can be resumed afterward.
+        solutions = solver.solutions()
+        first = next(solutions)
+        solutions.close()
+        self.assertIsInstance(first, DerivationTree)
+        self.assertTrue(solver.check(solver.solve()))
+
+        # An expired deadline ends the generator without an exception.
+        self.assertEqual([], list(solver.solutions(deadline=time.time() - 1)))
+
+    def test_solutions_generator_parallel(self):
+        formula = """
+forall <assgn> assgn_1="<var> := {<var> rhs}" in start:
+  exists <assgn> assgn_2="{<var> lhs} := <rhs>" in start:
+    (before(assgn_2, assgn_1) and (= lhs rhs))
+"""
+
+        solver = ISLaSolver(
+            LANG_GRAMMAR, formula, max_number_free_instantiations=1, workers=2
+        )
+
+        solutions = solver.solutions(limit=10, buffer_size=1)
+        self.assertEqual(10, len(list(solutions)))
+        self.assertEqual(1, solver.worker_results_size)
+        self.assertFalse(
+            any(process.is_alive() for process in solver.worker_processes)
+        )
+
     def test_solve_assgn_lang_without_constraint(self):
         self.execute_generation_test(
             max_number_free_instantiations=10,
@@ -760,6 +851,21 @@ forall int colno:
             .unwrap()
         )
 
+    def test_parse_reuses_parsers(self):
+        solver = ISLaSolver(LANG_GRAMMAR)
+        other_solver = ISLaSolver(LANG_GRAMMAR)
+
+        self.assertIs(
+            earley_parser(solver.immutable_grammar, "<assgn>"),
+            earley_parser(other_solver.immutable_grammar, "<assgn>"),
+        )
+
+        tree = solver.parse("x := 1", "<assgn>")
+        self.assertEqual("<assgn>", tree.value)
+        self.assertEqual("x := 1", str(tree))
+        self.assertEqual("x := 1", str(other_solver.parse("x := 1", "<assgn>")))
+        self.assertEqual("x := 1", str(solver.parse("x := 1")))
+
     def test_check(self):
         constraint = "<pagesize> = <bufsize>"
         solver = ISLaSolver(CONFIG_GRAMMAR, constraint)
@@ -767,6 +873,34 @@ forall int colno:
         self.assertTrue(solver.check("pagesize=12\nbufsize=12"))
         self.assertFalse(solver.check("pagesize=12\nbufsize=1200"))
 
+    def test_check_batch(self):
+        constraint = "<pagesize> = <bufsize>"
+        solver = ISLaSolver(CONFIG_GRAMMAR, constraint)
+
+        inputs = [
+            f"pagesize={i}\nbufsize={i if i % 3 else i * 10}" for i in range(1, 40)
+        ] + ["pagesize=1\nbufsize=x"]
+        expected = [
+            Success(ThreeValuedTruth.from_bool(i % 3 != 0)) for i in range(1, 40)
+        ]
+
+        results = list(solver.check_batch(inputs))
+        self.assertEqual(expected, results[:-1])
+        self.assertIsInstance(results[-1].failure(), SyntaxError)
+
+        parallel_results = list(solver.check_batch(inputs, processes=3, chunk_size=2))
+        self.assertEqual(expected, parallel_results[:-1])
+        self.assertIsInstance(parallel_results[-1].failure(), SyntaxError)
+
+        self.assertEqual(
+            expected[:5],
+            list(
+                solver.check_batch(
+                    solver.parse(inp, skip_check=True) for inp in inputs[:5]
+                )
+            ),
+        )
+
     def test_solve_config_grammar_leaddigit_equality(self):
         # This raised an exception
         solver = ISLaSolver(
@@ -1380,6 +1514,131 @@ and str.len(<payload>) = 10
                 2 * len(str(solution[payload_tree])),
             )
 
+    def test_solve_quantifier_free_formula_distinct_solutions(self):
+        solver = ISLaSolver(LANG_GRAMMAR, max_number_smt_instantiations=5)
+
+        var = language.Constant("var", "<var>")
+        var_tree = DerivationTree("<var>")
+
+        formula = language.SMTFormula(
+            cast(z3.BoolRef, var.to_smt() != z3.StringVal("a")),
+            var,
+            substitutions={var: var_tree},
+        )
+
+        solutions = solver.solve_quantifier_free_formula((formula,))
+
+        self.assertEqual(5, len(solutions))
+        values = [str(solution[var_tree]) for solution in solutions]
+        self.assertEqual(len(values), len(set(values)))
+        self.assertNotIn("a", values)
+
+    def test_persistent_regex_cache(self):
+        cache_dir = tempfile.TemporaryDirectory()
+
+        solver = ISLaSolver(LANG_GRAMMAR, regex_cache_dir=cache_dir.name)
+        regex = solver.extract_regular_expression("<assgn>")
+        self.assertEqual(2, len(os.listdir(cache_dir.name)))  # <var>, <rhs>
+
+        other_solver = ISLaSolver(LANG_GRAMMAR, regex_cache_dir=cache_dir.name)
+        self.assertTrue(
+            other_solver.load_regular_expression("<var>")
+            .unwrap()
+            .eq(solver.extract_regular_expression("<var>"))
+        )
+        self.assertTrue(other_solver.extract_regular_expression("<assgn>").eq(regex))
+
+        # Different unwinding thresholds or grammars have their own cache entries.
+        self.assertFalse(
+            is_successful(
+                ISLaSolver(
+                    LANG_GRAMMAR,
+                    regex_cache_dir=cache_dir.name,
+                    grammar_unwinding_threshold=3,
+                ).load_regular_expression("<var>")
+            )
+        )
+        self.assertFalse(
+            is_successful(
+                ISLaSolver(
+                    LANG_GRAMMAR | {"<digit>": ["0"]},
+                    regex_cache_dir=cache_dir.name,
+                ).load_regular_expression("<var>")
+            )
+        )
+
+        # Cached entries are preferred over the computation.
+        with open(other_solver.regex_cache_file("<var>").unwrap(), "w") as file:
+            file.write('(declare-const c String)(assert (str.in_re c (str.to_re "x")))')
+        self.assertTrue(
+            ISLaSolver(LANG_GRAMMAR, regex_cache_dir=cache_dir.name)
+            .extract_regular_expression("<var>")
+            .eq(z3.Re("x"))
+        )
+
+        cache_dir.cleanup()
+
+    def test_state_costs_are_cached_per_cost_computer(self):
+        constraint = 'exists <var> var in start: (= var "a")'
+        solver = ISLaSolver(LANG_GRAMMAR, constraint)
+        other_solver = ISLaSolver(LANG_GRAMMAR, constraint)
+
+        with mock.patch("isla.solver.MAX_CACHED_STATE_COSTS", 3):
+            self.assertTrue(solver.check(solver.solve()))
+
+        self.assertEqual(3, len(solver.cost_computer.state_costs_cache))
+        # The other solver only computed the costs of its initial state.
+        self.assertEqual(1, len(other_solver.cost_computer.state_costs_cache))
+
+    def test_persistent_constraint_cache(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        constraint = 'forall <var> var in start: (= var "a")'
+
+        solver = ISLaSolver(
+            LANG_GRAMMAR, constraint, constraint_cache_dir=cache_dir.name
+        )
+        self.assertEqual(1, len(os.listdir(cache_dir.name)))
+        self.assertTrue(solver.check(solver.solve()))
+
+        # Cached entries are loaded instead of parsing the constraint.
+        cache_file = os.path.join(cache_dir.name, os.listdir(cache_dir.name)[0])
+        with open(cache_file, "wb") as file:
+            file.write(
+                language.serialize_isla(
+                    language.parse_isla('forall <var> var in start: (= var "b")')
+                )
+            )
+
+        language._parsed_formulas.clear()
+        other_solver = ISLaSolver(
+            LANG_GRAMMAR, constraint, constraint_cache_dir=cache_dir.name
+        )
+        self.assertEqual(
+            'forall <var> var in start:\n  (= var "b")',
+            language.unparse_isla(other_solver.formula),
+        )
+
+        # Entries written by other ISLa versions are ignored and overwritten.
+        with open(cache_file, "rb") as file:
+            data = file.read()
+        with open(cache_file, "wb") as file:
+            file.write(
+                b"ISLa formula 1 0.0.0\n" + data[len(language.SERIALIZATION_HEADER) :]
+            )
+
+        language._parsed_formulas.clear()
+        other_solver = ISLaSolver(
+            LANG_GRAMMAR, constraint, constraint_cache_dir=cache_dir.name
+        )
+        self.assertEqual(
+            'forall <var> var in start:\n  (= var "a")',
+            language.unparse_isla(other_solver.formula),
+        )
+        with open(cache_file, "rb") as file:
+            self.assertTrue(file.read().startswith(language.SERIALIZATION_HEADER))
+
+        cache_dir.cleanup()
+
     def test_solve_bnf_xmllike(self):
         grammar_str = rf'''
 <start> ::= "<a>" <x> "</a>"